@@ -7,6 +7,7 @@ from django.utils import timezone
 from django.contrib.admin.views.decorators import staff_member_required
 from django.http import JsonResponse, HttpResponse
 from django.db.models import Count, Sum, Avg, Q
+from django.db.models.functions import TruncDate
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
@@ -518,20 +519,27 @@ def user_analytics(request):
     week_ago = today - timedelta(days=7)
     month_ago = today - timedelta(days=30)
     
-    # User growth data
+    # User growth data (one grouped query for the whole window)
+    registrations_by_day = dict(
+        User.objects.filter(date_joined__date__gt=today - timedelta(days=30))
+        .annotate(day=TruncDate('date_joined'))
+        .values('day')
+        .annotate(count=Count('id'))
+        .values_list('day', 'count')
+        .order_by()
+    )
     daily_registrations = []
     for i in range(30):
         date = today - timedelta(days=i)
-        count = User.objects.filter(date_joined__date=date).count()
-        daily_registrations.append({'date': date.strftime('%Y-%m-%d'), 'count': count})
+        daily_registrations.append({'date': date.strftime('%Y-%m-%d'), 'count': registrations_by_day.get(date, 0)})
     
     # Verification statistics
-    verification_stats = {
-        'total': UserProfile.objects.count(),
-        'verified': UserProfile.objects.filter(is_verified=True).count(),
-        'unverified': UserProfile.objects.filter(is_verified=False).count(),
-        'verification_rate': 0
-    }
+    verification_stats = UserProfile.objects.aggregate(
+        total=Count('id'),
+        verified=Count('id', filter=Q(is_verified=True)),
+        unverified=Count('id', filter=Q(is_verified=False)),
+    )
+    verification_stats['verification_rate'] = 0
     
     if verification_stats['total'] > 0:
         verification_stats['verification_rate'] = (verification_stats['verified'] / verification_stats['total']) * 100
@@ -787,6 +787,9 @@ TWILIO_PHONE_NUMBER = getenv('TWILIO_PHONE_NUMBER')
 
 # Push Notification Settings (Firebase Cloud Messaging)
 FCM_API_KEY = getenv('FCM_API_KEY')
+# FCM HTTP v1 credentials (used for batched push delivery)
+FCM_SERVICE_ACCOUNT_FILE = getenv('FCM_SERVICE_ACCOUNT_FILE')
+FCM_PROJECT_ID = getenv('FCM_PROJECT_ID')
 
 # WebSocket Settings (for real-time notifications)
 CHANNEL_LAYERS = {
@@ -799,7 +802,7 @@ CHANNEL_LAYERS = {
 NOTIFICATION_SETTINGS = {
     'ENABLE_EMAIL': True,
     'ENABLE_SMS': bool(TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN),
-    'ENABLE_PUSH': bool(FCM_API_KEY),
+    'ENABLE_PUSH': bool(FCM_API_KEY or FCM_SERVICE_ACCOUNT_FILE),
     'ENABLE_WEBSOCKET': True,
     'SMS_ENABLED_FOR': ['transaction', 'security', 'kyc'],  # Types that should send SMS
     'PUSH_ENABLED_FOR': ['transaction', 'security'],  # Types that should send push notifications
@@ -832,6 +835,76 @@ LOGGING = {
     },
 }
 
+# Number of account-id shards the daily interest run fans out to (1 = serial run)
+INTEREST_ACCRUAL_SHARDS = int(getenv('INTEREST_ACCRUAL_SHARDS', '1'))
+
+# Email weekly account statements (send_weekly_statements does nothing while off)
+WEEKLY_STATEMENT_EMAILS_ENABLED = getenv('WEEKLY_STATEMENT_EMAILS_ENABLED', 'False').lower() == 'true'
+
+# Bulk transfers: items committed per database transaction
+BULK_TRANSFER_CHUNK_SIZE = int(getenv('BULK_TRANSFER_CHUNK_SIZE', '500'))
+# Largest number of items accepted by one bulk transfer request
+BULK_TRANSFER_MAX_ITEMS = int(getenv('BULK_TRANSFER_MAX_ITEMS', '5000'))
+# Largest bulk transfer run inside the request when no task queue is available
+BULK_TRANSFER_INLINE_MAX_ITEMS = int(getenv('BULK_TRANSFER_INLINE_MAX_ITEMS', '50'))
+# Seconds without progress after which a processing bulk transfer is treated as dead and resumed
+BULK_TRANSFER_STALE_AFTER = int(getenv('BULK_TRANSFER_STALE_AFTER', '600'))
+
+# Scheduled transfers: due schedules claimed (and executed) per batch
+SCHEDULED_TRANSFER_BATCH_SIZE = int(getenv('SCHEDULED_TRANSFER_BATCH_SIZE', '200'))
+
+# Statements: transactions fetched per database round trip while streaming/rendering
+STATEMENT_CHUNK_SIZE = int(getenv('STATEMENT_CHUNK_SIZE', '2000'))
+
+# Seconds the bank admin dashboard metrics are cached
+DASHBOARD_CACHE_TTL = int(getenv('DASHBOARD_CACHE_TTL', '60'))
+
+# Account name enquiry: backend (dotted path), cache TTLs for found / unknown accounts,
+# per-lookup timeout and concurrent lookups; the stub latency simulates NIBSS offline
+NAME_ENQUIRY_BACKEND = getenv('NAME_ENQUIRY_BACKEND', 'bank.name_enquiry_services.LocalStubBackend')
+NAME_ENQUIRY_CACHE_TTL = int(getenv('NAME_ENQUIRY_CACHE_TTL', str(6 * 60 * 60)))
+NAME_ENQUIRY_NEGATIVE_TTL = int(getenv('NAME_ENQUIRY_NEGATIVE_TTL', '600'))
+NAME_ENQUIRY_TIMEOUT = float(getenv('NAME_ENQUIRY_TIMEOUT', '3'))
+NAME_ENQUIRY_MAX_WORKERS = int(getenv('NAME_ENQUIRY_MAX_WORKERS', '16'))
+NAME_ENQUIRY_STUB_LATENCY = float(getenv('NAME_ENQUIRY_STUB_LATENCY', '0'))
+
+# Bank directory: seconds clients may reuse the list before revalidating with its ETag
+BANK_DIRECTORY_MAX_AGE = int(getenv('BANK_DIRECTORY_MAX_AGE', '300'))
+
+# Homepage random picks: ids drawn per pool and seconds before the pool is redrawn
+HOME_SAMPLE_POOL_SIZE = int(getenv('HOME_SAMPLE_POOL_SIZE', '200'))
+HOME_SAMPLE_POOL_TTL = int(getenv('HOME_SAMPLE_POOL_TTL', '300'))
+
+# Product search: backend dotted path (empty picks Postgres full-text or the in-memory index by
+# database vendor), text search configuration, typo-fallback similarity and results per query
+PRODUCT_SEARCH_BACKEND = getenv('PRODUCT_SEARCH_BACKEND', '')
+PRODUCT_SEARCH_CONFIG = getenv('PRODUCT_SEARCH_CONFIG', 'english')
+PRODUCT_SEARCH_TRIGRAM_THRESHOLD = float(getenv('PRODUCT_SEARCH_TRIGRAM_THRESHOLD', '0.3'))
+PRODUCT_SEARCH_MAX_RESULTS = int(getenv('PRODUCT_SEARCH_MAX_RESULTS', '1000'))
+
+# Product prices: seconds between lazy repricing sweeps (per process) for ended/started discounts
+PRODUCT_PRICE_SWEEP_INTERVAL = int(getenv('PRODUCT_PRICE_SWEEP_INTERVAL', '15'))
+
+# Similar products: neighbours stored per product (same store and other stores each)
+PRODUCT_SIMILARITY_TOP_N = int(getenv('PRODUCT_SIMILARITY_TOP_N', '20'))
+
+# Outbox relay: side-effect events claimed (and delivered) per batch
+OUTBOX_RELAY_BATCH_SIZE = int(getenv('OUTBOX_RELAY_BATCH_SIZE', '100'))
+
+# Notification dispatcher: identical messages to a recipient are dropped for this many seconds
+NOTIFICATION_DEDUP_WINDOW = int(getenv('NOTIFICATION_DEDUP_WINDOW', '60'))
+# Messages per second per channel (and worker process)
+NOTIFICATION_RATE_LIMITS = {
+    'sms': int(getenv('NOTIFICATION_SMS_RATE_LIMIT', '20')),
+    'push': int(getenv('NOTIFICATION_PUSH_RATE_LIMIT', '500')),
+    'websocket': int(getenv('NOTIFICATION_WEBSOCKET_RATE_LIMIT', '2000')),
+}
+
+# Reject wallet credits that would exceed the owner's KYC tier balance cap
+KYC_ENFORCE_BALANCE_LIMIT = getenv('KYC_ENFORCE_BALANCE_LIMIT', 'False').lower() == 'true'
+# Seconds a worker may use a cached KYC tier (invalidation only reaches the local cache)
+KYC_TIER_CACHE_TTL = int(getenv('KYC_TIER_CACHE_TTL', '60'))
+
 # # Celery configuration
 # CELERY_BROKER_URL = getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 # CELERY_RESULT_BACKEND = getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/1')
@@ -848,6 +921,31 @@ LOGGING = {
 #         'task': 'bank.tasks.send_weekly_statements',
 #         'schedule': crontab(hour=8, minute=0, day_of_week='sun'),
 #     },
+#     'refresh-transaction-rollups-every-minute': {
+#         'task': 'bank.tasks.refresh_transaction_rollups',
+#         'schedule': crontab(),
+#     },
+#     'repair-transaction-rollups-01-30': {
+#         'task': 'bank.tasks.refresh_transaction_rollups',
+#         'schedule': crontab(hour=1, minute=30),
+#         'kwargs': {'days': 2},
+#     },
+#     'dispatch-scheduled-transfers-every-minute': {
+#         'task': 'bank.tasks.dispatch_scheduled_transfers',
+#         'schedule': crontab(),
+#     },
+#     'relay-outbox-events-every-minute': {
+#         'task': 'bank.tasks.relay_outbox_events',
+#         'schedule': crontab(),
+#     },
+#     'sweep-product-prices-every-minute': {
+#         'task': 'product.tasks.sweep_product_prices',
+#         'schedule': crontab(),
+#     },
+#     'rebuild-product-similarity-02-00': {
+#         'task': 'product.tasks.rebuild_product_similarity',
+#         'schedule': crontab(hour=2, minute=0),
+#     },
 # }
 
 
@@ -20,7 +20,7 @@ from django import forms
 from django.urls import path
 from django.template.response import TemplateResponse
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Sum, Count, Q
+from django.db.models import Count, Q
 from .models import Transaction, Wallet
 from .models import (
     Wallet, Transaction, BankTransfer, BillPayment, VirtualCard, Bank, 
@@ -28,6 +28,7 @@ from .models import (
     StaffRole, StaffProfile, TransactionApproval, CustomerEscalation, StaffActivity,
     XySaveAccount, XySaveTransaction, XySaveGoal, XySaveInvestment, XySaveSettings,
     SpendAndSaveAccount, SpendAndSaveTransaction, SpendAndSaveSettings,
+    InterestAccrualRun, UserTransferStats, DailyTransactionRollup, OutboxEvent,
     TargetSaving, TargetSavingDeposit, TargetSavingCategory, TargetSavingFrequency, TargetSavingWithdrawal,
     FixedSavingsAccount, FixedSavingsTransaction, FixedSavingsSettings,
     FixedSavingsSource, FixedSavingsPurpose
@@ -37,6 +38,7 @@ from .models import (
 from djmoney.models.fields import MoneyField
 from djmoney.money import Money
 from .interest_services import InterestRateCalculator, InterestAccrualService, InterestReportService
+from .ledger_services import WalletLedger
 
 @admin.register(Wallet)
 class WalletAdmin(admin.ModelAdmin):
@@ -340,13 +342,13 @@ class TransactionAdmin(admin.ModelAdmin):
     
     def mark_as_success(self, request, queryset):
         """Mark transactions as successful."""
-        updated = queryset.update(status='success')
+        updated = queryset.update(status='success', updated_at=timezone.now())
         self.message_user(request, f'Marked {updated} transactions as successful.')
     mark_as_success.short_description = "Mark as successful"
     
     def mark_as_failed(self, request, queryset):
         """Mark transactions as failed."""
-        updated = queryset.update(status='failed')
+        updated = queryset.update(status='failed', updated_at=timezone.now())
         self.message_user(request, f'Marked {updated} transactions as failed.')
     mark_as_failed.short_description = "Mark as failed"
     
@@ -485,7 +487,7 @@ class TransactionAdmin(admin.ModelAdmin):
     reversal_summary.short_description = 'Reversals'
 
     def bulk_approve(self, request, queryset):
-        updated = queryset.update(status='success')
+        updated = queryset.update(status='success', updated_at=timezone.now())
         self.message_user(request, f'Approved {updated} transactions.')
     bulk_approve.short_description = 'Approve selected transactions'
     def bulk_review(self, request, queryset):
@@ -508,10 +510,9 @@ class TransactionAdmin(admin.ModelAdmin):
         count = 0
         for tx in queryset:
             if not tx.parent:  # Only reverse original transactions
-                tx.wallet.balance += tx.amount  # Refund
-                tx.wallet.save()
+                WalletLedger.credit(tx.wallet, tx.amount)  # Refund
                 tx.status = 'success'
-                tx.save(update_fields=['status'])
+                tx.save(update_fields=['status', 'updated_at'])
                 from .models import Transaction
                 Transaction.objects.create(
                     wallet=tx.wallet,
@@ -1088,39 +1089,9 @@ class StaffActivityAdmin(admin.ModelAdmin):
 
 @staff_member_required
 def admin_dashboard(request):
-    # Aggregate data for charts
-    from django.utils import timezone
-    import datetime
-    today = timezone.now().date()
-    last_30 = [today - datetime.timedelta(days=i) for i in range(29, -1, -1)]
-    txs = Transaction.objects.filter(timestamp__date__gte=last_30[0])
-    # Volume per day
-    volume_data = []
-    for day in last_30:
-        count = txs.filter(timestamp__date=day).count()
-        volume_data.append({'date': day.strftime('%Y-%m-%d'), 'count': count})
-    # Revenue (sum of credits)
-    revenue_data = []
-    for day in last_30:
-        revenue = txs.filter(timestamp__date=day, type='credit').aggregate(total=Sum('amount'))['total'] or 0
-        revenue_data.append({'date': day.strftime('%Y-%m-%d'), 'revenue': float(revenue)})
-    # Reversals per day
-    reversal_data = []
-    for day in last_30:
-        reversals = txs.filter(timestamp__date=day, parent__isnull=False).count()
-        reversal_data.append({'date': day.strftime('%Y-%m-%d'), 'count': reversals})
-    # Top users by volume
-    top_users = (
-        Wallet.objects.values('user__username')
-        .annotate(total=Sum('transaction__amount'))
-        .order_by('-total')[:5]
-    )
-    context = {
-        'volume_data': volume_data,
-        'revenue_data': revenue_data,
-        'reversal_data': reversal_data,
-        'top_users': top_users,
-    }
+    # Aggregated chart data (one grouped query plus rollups, cached briefly)
+    from .dashboard_services import DashboardMetricsService
+    context = DashboardMetricsService.get_metrics(days=30)
     return TemplateResponse(request, 'bank/admin_dashboard.html', context)
 
 @staff_member_required
@@ -1717,6 +1688,59 @@ admin.site.register(SpendAndSaveTransaction, SpendAndSaveTransactionAdmin)
 admin.site.register(SpendAndSaveSettings, SpendAndSaveSettingsAdmin)
 
 
+@admin.register(InterestAccrualRun)
+class InterestAccrualRunAdmin(admin.ModelAdmin):
+    list_display = (
+        'accrual_date', 'product', 'shard_index', 'shard_count', 'status',
+        'accounts_processed', 'total_interest', 'failures', 'started_at', 'completed_at'
+    )
+    list_filter = ('product', 'status', 'accrual_date')
+    readonly_fields = (
+        'product', 'accrual_date', 'shard_index', 'shard_count', 'status', 'last_account_id', 'accounts_processed',
+        'total_interest', 'failures', 'last_error', 'started_at', 'updated_at', 'completed_at'
+    )
+    ordering = ('-accrual_date', 'product')
+
+
+@admin.register(UserTransferStats)
+class UserTransferStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'count', 'mean_amount', 'max_amount', 'distinct_recipients', 'last_seen_at')
+    search_fields = ('user__username', 'user__email')
+    readonly_fields = (
+        'user', 'count', 'mean_amount', 'm2', 'max_amount', 'distinct_recipients', 'last_seen_at', 'updated_at'
+    )
+    ordering = ('-last_seen_at',)
+
+
+@admin.register(DailyTransactionRollup)
+class DailyTransactionRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'wallet', 'channel', 'tx_count', 'credit_total', 'debit_total', 'updated_at')
+    list_filter = ('channel', 'day')
+    search_fields = ('wallet__account_number', 'wallet__user__username')
+    readonly_fields = ('day', 'wallet', 'channel', 'tx_count', 'credit_total', 'debit_total', 'updated_at')
+    date_hierarchy = 'day'
+    ordering = ('-day',)
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('event_type', 'aggregate_type', 'aggregate_id', 'status', 'attempts', 'available_at', 'created_at', 'delivered_at')
+    list_filter = ('status', 'event_type', 'created_at')
+    search_fields = ('aggregate_id', 'event_type', 'last_error')
+    readonly_fields = ('id', 'event_type', 'aggregate_type', 'aggregate_id', 'payload', 'attempts', 'last_error', 'created_at', 'updated_at', 'delivered_at')
+    date_hierarchy = 'created_at'
+    ordering = ('-created_at',)
+    actions = ['retry_now']
+
+    def retry_now(self, request, queryset):
+        """Make the selected undelivered events due again immediately"""
+        updated = queryset.exclude(status=OutboxEvent.STATUS_DELIVERED).update(
+            status=OutboxEvent.STATUS_PENDING, available_at=timezone.now(), attempts=0
+        )
+        self.message_user(request, f'{updated} event(s) queued for delivery.')
+    retry_now.short_description = "Retry selected events now"
+
+
 # Target Saving Admin Classes
 
 class TargetSavingDepositInline(admin.TabularInline):
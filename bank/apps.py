@@ -10,6 +10,8 @@ class BankConfig(AppConfig):
         import bank.signals.transaction_signals  # Import transaction processing signals
         import bank.signals.notification_signals  # Import notification signals
         import bank.signals.kyc_signals  # Import KYC signals for wallet creation
+        import bank.signals.fee_signals  # Invalidate the cached fee configuration
+        import bank.signals.bank_directory_signals  # Invalidate the bank directory snapshot
         # Optional: ensure Celery finds tasks when autodiscover runs
         import bank.tasks  # noqa: F401
         # Start APScheduler job only for server process
@@ -17,7 +19,7 @@ class BankConfig(AppConfig):
             try:
                 from django_apscheduler.jobstores import register_events, DjangoJobStore
                 from apscheduler.schedulers.background import BackgroundScheduler
-                from bank.tasks import run_daily_interest_job
+                from bank.tasks import run_daily_interest_job, run_transaction_rollup_job
                 scheduler = BackgroundScheduler()
                 scheduler.add_jobstore(DjangoJobStore(), 'default')
                 # Daily at 23:55
@@ -29,6 +31,27 @@ class BankConfig(AppConfig):
                     name='Process daily interest (SAS & XySave)',
                     replace_existing=True
                 )
+                # Transaction rollups: changes every minute, full repair of the last two days nightly
+                scheduler.add_job(
+                    run_transaction_rollup_job,
+                    trigger='interval',
+                    minutes=1,
+                    id='refresh_transaction_rollups',
+                    name='Refresh transaction rollups',
+                    max_instances=1,
+                    coalesce=True,
+                    replace_existing=True
+                )
+                scheduler.add_job(
+                    run_transaction_rollup_job,
+                    trigger='cron',
+                    hour=1,
+                    minute=30,
+                    kwargs={'days': 2},
+                    id='repair_transaction_rollups',
+                    name='Repair transaction rollups (last 2 days)',
+                    replace_existing=True
+                )
                 register_events(scheduler)
                 scheduler.start()
             except Exception:
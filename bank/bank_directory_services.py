@@ -0,0 +1,171 @@
+"""
+Bank directory served from an immutable in-memory snapshot.
+
+Every app launch fetches the full bank list, which changes only when banks are
+seeded or edited. Each process keeps one snapshot of the Bank table: the rows in
+name order, the JSON payloads already encoded (and pre-compressed with gzip and,
+when the brotli package is installed, brotli), a content-hash ETag and a sorted
+prefix index for search. The snapshot is rebuilt through VersionedConfigCache
+when the Bank table's version probe changes (so edits made by `seed_banks` or any
+other process are picked up within a second), requests never read the bank rows
+themselves and clients that send If-None-Match / If-Modified-Since get a 304.
+"""
+import gzip
+import hashlib
+import json
+import re
+from bisect import bisect_left
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .config_cache import VersionedConfigCache, table_version
+from .models import Bank
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+# Fields exposed by the directory endpoints (BankSerializer)
+PUBLIC_FIELDS = ('id', 'name', 'code', 'slug', 'ussd', 'logo')
+SEARCH_LIMIT = 20
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def _encode(data) -> Dict[str, bytes]:
+    body = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8')
+    encoded = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded['br'] = brotli.compress(body)
+    return encoded
+
+
+class BankDirectorySnapshot:
+    """Read-only view of the Bank table at one version."""
+
+    def __init__(self, banks: List[Dict]):
+        self.banks = tuple(banks)
+        self.public = [{field: bank[field] for field in PUBLIC_FIELDS} for bank in self.banks]
+        self._by_id = {bank['id']: position for position, bank in enumerate(self.banks)}
+        self._by_code = {bank['code']: position for position, bank in enumerate(self.banks)}
+
+        self.payloads = {
+            'list': _encode(self.public),
+            'transfer': _encode({'banks': self.public, 'count': len(self.public)}),
+        }
+        digest = hashlib.sha256(self.payloads['list']['identity']).hexdigest()
+        # Weak: the gzip/brotli representations share the validator
+        self.etag = f'W/"{digest[:40]}"'
+        updated = [bank['updated_at'] for bank in self.banks if bank['updated_at']]
+        self.last_modified = int(max(updated).timestamp()) if updated else None
+
+        # Sorted (token, position) pairs over name words and the code; a query
+        # word matches every token it prefixes
+        index = sorted({
+            (token, position)
+            for position, bank in enumerate(self.banks)
+            for token in _tokens(bank['name']) + _tokens(bank['code'])
+        })
+        self._index_tokens = [token for token, _ in index]
+        self._index_positions = [position for _, position in index]
+
+    def get(self, bank_id) -> Optional[Dict]:
+        position = self._by_id.get(str(bank_id))
+        return None if position is None else self.public[position]
+
+    def get_by_code(self, code) -> Optional[Dict]:
+        position = self._by_code.get(str(code))
+        return None if position is None else self.banks[position]
+
+    def _prefix_matches(self, word: str) -> set:
+        matches = set()
+        start = bisect_left(self._index_tokens, word)
+        for token, position in zip(self._index_tokens[start:], self._index_positions[start:]):
+            if not token.startswith(word):
+                break
+            matches.add(position)
+        return matches
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> List[Dict]:
+        """Banks whose name words or code start with every word of `query`, in name order."""
+        words = _tokens(query)
+        if not words:
+            return []
+        positions = self._prefix_matches(words[0])
+        for word in words[1:]:
+            if not positions:
+                break
+            positions &= self._prefix_matches(word)
+        return [self.public[position] for position in sorted(positions)[:limit]]
+
+
+def _load_snapshot() -> BankDirectorySnapshot:
+    rows = Bank.objects.order_by('name', 'code').values(*PUBLIC_FIELDS, 'is_active', 'updated_at')
+    return BankDirectorySnapshot([{**row, 'id': str(row['id'])} for row in rows])
+
+
+# Rebuilt when the Bank table changes in any process
+bank_directory_cache = VersionedConfigCache('bank_directory', _load_snapshot, probe=table_version('bank.Bank'))
+
+
+class BankDirectory:
+    """Bank list, lookup and search backed by the in-memory snapshot."""
+
+    DEFAULT_MAX_AGE = 300
+
+    @staticmethod
+    def snapshot() -> BankDirectorySnapshot:
+        return bank_directory_cache.get()
+
+    @classmethod
+    def search(cls, query: str, limit: int = SEARCH_LIMIT) -> List[Dict]:
+        return cls.snapshot().search(query, limit=limit)
+
+    @staticmethod
+    def _negotiate_encoding(request, available) -> str:
+        accepted = {}
+        for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+            coding, _, params = part.strip().partition(';')
+            quality = 1.0
+            if params.strip().startswith('q='):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    quality = 0.0
+            if coding:
+                accepted[coding.lower()] = quality
+        for coding in ('br', 'gzip'):
+            if coding in available and accepted.get(coding, accepted.get('*', 0)) > 0:
+                return coding
+        return 'identity'
+
+    @classmethod
+    def response(cls, request, payload: str = 'list') -> HttpResponse:
+        """
+        Serve a pre-encoded payload ('list' or 'transfer') with ETag/Last-Modified,
+        answering 304 when the client's copy is current.
+        """
+        snapshot = cls.snapshot()
+        encoded = snapshot.payloads[payload]
+        encoding = cls._negotiate_encoding(request, encoded)
+
+        response = HttpResponse(encoded[encoding], content_type='application/json')
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+        response['ETag'] = snapshot.etag
+        if snapshot.last_modified is not None:
+            response['Last-Modified'] = http_date(snapshot.last_modified)
+        patch_cache_control(response, private=True, max_age=getattr(settings, 'BANK_DIRECTORY_MAX_AGE', cls.DEFAULT_MAX_AGE))
+        patch_vary_headers(response, ('Accept-Encoding', 'Authorization'))
+        return get_conditional_response(
+            request, etag=snapshot.etag, last_modified=snapshot.last_modified, response=response
+        )
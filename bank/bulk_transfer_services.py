@@ -0,0 +1,443 @@
+"""
+Bulk transfer engine.
+
+A bulk transfer is run in phases instead of one long transaction:
+
+1. Validate every item up front: account format, internal wallet resolution
+   (one IN query for the whole batch) and fees (fee configuration loaded once).
+2. Check the sender can cover the total of all valid items, so a batch that
+   cannot be paid fails before anything is moved.
+3. Commit items in chunks; each chunk claims its still-pending items with a
+   conditional UPDATE, debits the total of the claimed items from the sender
+   with a single conditional UPDATE, bulk-inserts their BankTransfer and
+   Transaction rows (queueing the side effects their post_save signals would
+   have queued through the outbox), credits internal recipients and updates
+   the bulk progress counters, all in one database transaction. A failed chunk
+   rolls back its own debit and its pending items are marked failed without
+   touching earlier chunks.
+
+Because nothing is reserved outside a committed chunk, a run that dies midway
+leaves its remaining items pending with the sender's money untouched. Such a
+run is picked up again once it has made no progress for
+BULK_TRANSFER_STALE_AFTER seconds. If the original run was only slow, both runs
+may reach the same items, but only one of them can claim each item, so no item
+is paid twice.
+"""
+import re
+import uuid
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from djmoney.money import Money
+
+from .constants import TransferStatus
+from .fees import calculate_transfer_fees, get_active_vat_rate, get_charge_control
+from .ledger_services import WalletLedger, InsufficientFundsError
+from .name_enquiry_services import NameEnquiryService
+from .models import BankTransfer, BulkTransfer, BulkTransferItem, Transaction, Wallet
+from .outbox_services import OutboxService
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_NUMBER_RE = re.compile(r'^\d{10}$')
+
+
+class BulkTransferEngine:
+    """Validate and commit a BulkTransfer in chunks."""
+
+    DEFAULT_CHUNK_SIZE = 500
+    DEFAULT_STALE_AFTER = 600
+
+    @classmethod
+    def run(cls, bulk_transfer: BulkTransfer, chunk_size=None, progress_callback=None) -> dict:
+        """
+        Execute every pending item of a bulk transfer.
+        A transfer left `processing` by a dead run is resumed once it is stale.
+        `progress_callback(bulk_transfer)` is called after validation and after each chunk.
+        """
+        chunk_size = chunk_size or getattr(settings, 'BULK_TRANSFER_CHUNK_SIZE', cls.DEFAULT_CHUNK_SIZE)
+
+        if not cls._claim(bulk_transfer):
+            bulk_transfer.refresh_from_db()
+            return {
+                'success': False,
+                'error': f'Bulk transfer is already {bulk_transfer.status}',
+                'status': bulk_transfer.status,
+            }
+        bulk_transfer.refresh_from_db()
+
+        try:
+            sender_wallet = Wallet.objects.get(user_id=bulk_transfer.user_id)
+        except Wallet.DoesNotExist:
+            cls._fail_all(bulk_transfer, 'Sender wallet not found')
+            return cls._result(bulk_transfer, success=False, error='Sender wallet not found')
+
+        items = list(bulk_transfer.items.filter(status=TransferStatus.PENDING).order_by('bulk_index'))
+        valid, invalid = cls.validate_items(items, sender_wallet)
+        # Recorded even with nothing invalid: it marks the run as alive after a slow validation
+        cls._fail_items(bulk_transfer, invalid)
+        if progress_callback:
+            progress_callback(bulk_transfer)
+
+        total = sum((entry['total'] for entry in valid), Decimal('0'))
+        if valid and sender_wallet.balance.amount < total:
+            cls._fail_entries(bulk_transfer, valid, 'Insufficient balance')
+            cls._finish(bulk_transfer)
+            return cls._result(bulk_transfer, success=False, error='Insufficient balance')
+
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            try:
+                with transaction.atomic():
+                    committed = cls._commit_chunk(bulk_transfer, sender_wallet, chunk)
+                    cls._record_progress(bulk_transfer, completed=committed)
+            except Exception as e:
+                if isinstance(e, InsufficientFundsError):
+                    error = 'Insufficient balance'
+                else:
+                    error = str(e)
+                    logger.error(f"Error committing bulk transfer {bulk_transfer.id} chunk at {start}: {error}")
+                cls._fail_entries(bulk_transfer, chunk, error)
+            if progress_callback:
+                progress_callback(bulk_transfer)
+
+        cls._finish(bulk_transfer)
+        return cls._result(bulk_transfer, success=True)
+
+    @classmethod
+    def _claim(cls, bulk_transfer) -> bool:
+        """Move a pending, or stale processing, bulk transfer to processing."""
+        now = timezone.now()
+        stale_after = getattr(settings, 'BULK_TRANSFER_STALE_AFTER', cls.DEFAULT_STALE_AFTER)
+        stale = Q(status='processing', updated_at__lt=now - timedelta(seconds=stale_after))
+        claimed = BulkTransfer.objects.filter(Q(status='pending') | stale, pk=bulk_transfer.pk).update(
+            status='processing', started_at=Coalesce(F('started_at'), now), updated_at=now
+        )
+        return bool(claimed)
+
+    @classmethod
+    def _fail_entries(cls, bulk_transfer, entries, error):
+        for entry in entries:
+            entry['item'].status = TransferStatus.FAILED
+            entry['item'].error_message = error
+        cls._fail_items(bulk_transfer, [entry['item'] for entry in entries])
+
+    @classmethod
+    def _fail_items(cls, bulk_transfer, items):
+        """
+        Mark items failed with their error_message, skipping any that another run has
+        already settled, and count the ones actually failed.
+        """
+        by_error = defaultdict(list)
+        for item in items:
+            by_error[item.error_message].append(item.pk)
+        with transaction.atomic():
+            failed = 0
+            for error, item_ids in by_error.items():
+                failed += BulkTransferItem.objects.filter(
+                    pk__in=item_ids, status=TransferStatus.PENDING
+                ).update(status=TransferStatus.FAILED, error_message=error, transfer=None)
+            cls._record_progress(bulk_transfer, failed=failed)
+
+    @staticmethod
+    def validate_items(items, sender_wallet):
+        """
+        Validate items and compute their fees.
+        Returns (valid, invalid): valid is a list of dicts with the item, resolved
+        recipient wallet id (or None for external), fees and total debit; invalid
+        items come back marked failed with an error message.
+        """
+        account_numbers = {item.account_number for item in items}
+        wallets = Wallet.objects.filter(
+            Q(account_number__in=account_numbers) | Q(alternative_account_number__in=account_numbers)
+        ).values_list('id', 'account_number', 'alternative_account_number')
+        internal = {}
+        for wallet_id, account_number, alternative_account_number in wallets:
+            internal[account_number] = wallet_id
+            internal.setdefault(alternative_account_number, wallet_id)
+
+        # Name enquiry for every external beneficiary in one concurrent, cached call;
+        # skipped when the configured backend cannot tell unknown accounts apart
+        names = {}
+        if NameEnquiryService.rejects_unknown_accounts():
+            names = NameEnquiryService.lookup_many(
+                (item.bank_code, item.account_number)
+                for item in items
+                if item.account_number not in internal and ACCOUNT_NUMBER_RE.match(item.account_number or '')
+            )
+
+        vat_rate = get_active_vat_rate()
+        charge_control = get_charge_control()
+        valid, invalid = [], []
+        for item in items:
+            amount = item.amount.amount
+            name = names.get((str(item.bank_code), str(item.account_number)))
+            error = None
+            if not ACCOUNT_NUMBER_RE.match(item.account_number or ''):
+                error = 'Invalid account number format'
+            elif amount <= 0:
+                error = 'Amount must be greater than zero'
+            elif internal.get(item.account_number) == sender_wallet.id:
+                error = 'Cannot transfer to your own wallet'
+            elif name is not None and not name['found'] and not name.get('error'):
+                # Lookups that timed out are not treated as unknown accounts
+                error = 'Recipient account not found at the destination bank'
+            if error:
+                item.status = TransferStatus.FAILED
+                item.error_message = error
+                invalid.append(item)
+                continue
+
+            recipient_wallet_id = internal.get(item.account_number)
+            transfer_type = 'intra' if recipient_wallet_id else 'inter'
+            fee, vat, levy = calculate_transfer_fees(
+                amount, transfer_type, vat_rate=vat_rate, charge_control=charge_control
+            )
+            valid.append({
+                'item': item,
+                'recipient_wallet_id': recipient_wallet_id,
+                'transfer_type': transfer_type,
+                'fee': fee,
+                'vat': vat,
+                'levy': levy,
+                'total': amount + fee + vat + levy,
+            })
+        return valid, invalid
+
+    @staticmethod
+    def _reference(prefix: str, account_number: str) -> str:
+        now = datetime.now()
+        return f"{prefix}-{now:%Y%m%d}-{now:%H%M%S}-{account_number[-4:]}-{uuid.uuid4().hex[:12].upper()}"
+
+    @staticmethod
+    def _claim_items(chunk):
+        """
+        Move the chunk's still-pending items to processing and return the entries
+        claimed. Must run inside the chunk's transaction: the UPDATE holds the item
+        rows until the chunk commits them as completed, so a concurrent run either
+        waits and then skips them or sees them already settled.
+        """
+        item_ids = [entry['item'].pk for entry in chunk]
+        BulkTransferItem.objects.filter(pk__in=item_ids, status=TransferStatus.PENDING).update(
+            status=TransferStatus.PROCESSING
+        )
+        claimed = set(
+            BulkTransferItem.objects.filter(pk__in=item_ids, status=TransferStatus.PROCESSING)
+            .values_list('pk', flat=True)
+        )
+        return [entry for entry in chunk if entry['item'].pk in claimed]
+
+    @classmethod
+    def _commit_chunk(cls, bulk_transfer, sender_wallet, chunk) -> int:
+        """
+        Claim the chunk's pending items, debit their total from the sender and insert
+        their transfers and ledger rows. Must run inside a transaction so the claim and
+        debit roll back with the rows. Returns the number of items committed.
+        Raises InsufficientFundsError if the sender cannot cover the chunk.
+        """
+        chunk = cls._claim_items(chunk)
+        if not chunk:
+            return 0
+        currency = sender_wallet.balance.currency
+        chunk_total = sum((entry['total'] for entry in chunk), Decimal('0'))
+        # Debit records show the running balance from just before this chunk's debit
+        running_balance = WalletLedger.debit(sender_wallet, chunk_total).amount + chunk_total
+        now = timezone.now()
+        transfers, debits = [], []
+        credits_by_wallet = defaultdict(list)
+
+        for entry in chunk:
+            item = entry['item']
+            transfer = BankTransfer(
+                user_id=bulk_transfer.user_id,
+                bank_name=item.bank_name,
+                bank_code=item.bank_code,
+                account_number=item.account_number,
+                amount=item.amount,
+                fee=Money(entry['fee'], currency),
+                vat=Money(entry['vat'], currency),
+                levy=Money(entry['levy'], currency),
+                reference=cls._reference('BT', sender_wallet.account_number),
+                description=(item.description or '')[:255],
+                transfer_type=entry['transfer_type'],
+                status=TransferStatus.COMPLETED,
+                is_bulk=True,
+                bulk_transfer_id=bulk_transfer.id,
+                bulk_index=item.bulk_index,
+                processing_started_at=now,
+                processing_completed_at=now,
+                metadata={'bulk_transfer_id': str(bulk_transfer.id), 'bulk_index': item.bulk_index},
+            )
+            transfers.append(transfer)
+            running_balance -= entry['total']
+            debits.append(Transaction(
+                wallet=sender_wallet,
+                receiver_id=entry['recipient_wallet_id'],
+                reference=cls._reference('TX', sender_wallet.account_number),
+                amount=item.amount,
+                type='debit',
+                channel='transfer',
+                description=f"Transfer to {item.account_number}",
+                status='success',
+                balance_after=Money(running_balance, currency),
+                metadata={'bulk_transfer_id': str(bulk_transfer.id), 'bulk_index': item.bulk_index},
+            ))
+            if entry['recipient_wallet_id']:
+                credits_by_wallet[entry['recipient_wallet_id']].append(entry)
+            item.transfer = transfer
+            item.status = TransferStatus.COMPLETED
+            item.error_message = ''
+
+        BankTransfer.objects.bulk_create(transfers)
+
+        # One credit per distinct internal recipient
+        credits = []
+        for wallet_id, entries in credits_by_wallet.items():
+            credited = sum((entry['item'].amount.amount for entry in entries), Decimal('0'))
+            balance = WalletLedger.credit(wallet_id, credited).amount
+            # Walk backwards from the final balance so each credit shows its own balance_after
+            for entry in reversed(entries):
+                item = entry['item']
+                credits.append(Transaction(
+                    wallet_id=wallet_id,
+                    reference=cls._reference('TX', item.account_number),
+                    amount=item.amount,
+                    type='credit',
+                    channel='transfer',
+                    description=f"Transfer from {sender_wallet.account_number}",
+                    status='success',
+                    balance_after=Money(balance, currency),
+                    metadata={'bulk_transfer_id': str(bulk_transfer.id), 'bulk_index': item.bulk_index},
+                ))
+                balance -= item.amount.amount
+
+        Transaction.objects.bulk_create(debits + credits)
+        cls._enqueue_side_effects(debits, credits)
+        BulkTransferItem.objects.bulk_update([entry['item'] for entry in chunk], ['transfer', 'status', 'error_message'])
+        transaction.on_commit(lambda: cls._record_counters(transfers))
+        return len(chunk)
+
+    @staticmethod
+    def _enqueue_side_effects(debits, credits):
+        """
+        bulk_create skips post_save, so queue what the Transaction signals queue for a
+        single transfer: notifications for every row, Spend and Save for the debits and
+        the XySave auto-sweep for the credits.
+        """
+        OutboxService.enqueue_many('transaction.notify', debits + credits)
+        OutboxService.enqueue_many('transaction.spend_and_save', debits)
+        OutboxService.enqueue_many('transaction.auto_sweep', credits)
+
+    @staticmethod
+    def _record_counters(transfers):
+        """bulk_create skips post_save, so feed the fraud counters and stats directly."""
+        from .transfer_stats_services import TransferStatsService
+        from .velocity_services import VelocityCounterService
+
+        for transfer in transfers:
+            try:
+                VelocityCounterService.record_transfer_created(transfer)
+                VelocityCounterService.record_transfer_completed(transfer)
+                TransferStatsService.record_transfer_completed(transfer)
+            except Exception as e:
+                logger.warning(f"Failed to update fraud counters for bulk transfer {transfer.id}: {str(e)}")
+
+    @staticmethod
+    def _record_progress(bulk_transfer, completed=0, failed=0):
+        BulkTransfer.objects.filter(pk=bulk_transfer.pk).update(
+            completed_count=F('completed_count') + completed,
+            failed_count=F('failed_count') + failed,
+            updated_at=timezone.now(),
+        )
+        bulk_transfer.refresh_from_db(fields=['completed_count', 'failed_count', 'updated_at'])
+
+    @staticmethod
+    def _finish(bulk_transfer):
+        bulk_transfer.refresh_from_db()
+        if bulk_transfer.failed_count == 0:
+            bulk_transfer.status = 'completed'
+        elif bulk_transfer.completed_count == 0:
+            bulk_transfer.status = 'failed'
+        else:
+            bulk_transfer.status = 'partial_completed'
+        bulk_transfer.completed_at = timezone.now()
+        bulk_transfer.save(update_fields=['status', 'completed_at', 'updated_at'])
+
+    @classmethod
+    def _fail_all(cls, bulk_transfer, reason):
+        failed = bulk_transfer.items.filter(status=TransferStatus.PENDING).update(
+            status=TransferStatus.FAILED, error_message=reason
+        )
+        cls._record_progress(bulk_transfer, failed=failed)
+        cls._finish(bulk_transfer)
+
+    @staticmethod
+    def _result(bulk_transfer, success=True, error=None):
+        result = {
+            'success': success,
+            'completed_count': bulk_transfer.completed_count,
+            'failed_count': bulk_transfer.failed_count,
+            'status': bulk_transfer.status,
+        }
+        if error:
+            result['error'] = error
+        return result
+
+
+class BulkTransferProgress:
+    """Progress snapshots for bulk transfer jobs, pushed to the owner's notification channel."""
+
+    @staticmethod
+    def snapshot(bulk_transfer: BulkTransfer) -> dict:
+        """Completed, failed, remaining and a linear ETA for a bulk transfer."""
+        processed = bulk_transfer.completed_count + bulk_transfer.failed_count
+        remaining = max(bulk_transfer.total_count - processed, 0)
+        eta_seconds = None
+        if bulk_transfer.status == 'processing' and bulk_transfer.started_at and processed:
+            elapsed = (timezone.now() - bulk_transfer.started_at).total_seconds()
+            eta_seconds = round(elapsed / processed * remaining, 1)
+        elif bulk_transfer.status not in ('pending', 'processing'):
+            eta_seconds = 0
+        return {
+            'job_id': str(bulk_transfer.id),
+            'status': bulk_transfer.status,
+            'total': bulk_transfer.total_count,
+            'completed': bulk_transfer.completed_count,
+            'failed': bulk_transfer.failed_count,
+            'remaining': remaining,
+            'eta_seconds': eta_seconds,
+            'started_at': bulk_transfer.started_at.isoformat() if bulk_transfer.started_at else None,
+            'completed_at': bulk_transfer.completed_at.isoformat() if bulk_transfer.completed_at else None,
+        }
+
+    @classmethod
+    def publish(cls, bulk_transfer: BulkTransfer) -> None:
+        """Send a progress event to the user's NotificationConsumer group."""
+        try:
+            from asgiref.sync import async_to_sync
+            from channels.layers import get_channel_layer
+
+            channel_layer = get_channel_layer()
+            if channel_layer is None:
+                return
+            progress = cls.snapshot(bulk_transfer)
+            async_to_sync(channel_layer.group_send)(
+                f"user_{bulk_transfer.user_id}",
+                {
+                    'type': 'notify',
+                    'title': f"Bulk transfer {bulk_transfer.title}",
+                    'message': (
+                        f"{progress['completed']} completed, {progress['failed']} failed, "
+                        f"{progress['remaining']} remaining"
+                    ),
+                    'extra_data': {'event': 'bulk_transfer_progress', **progress},
+                }
+            )
+        except Exception as e:
+            logger.warning(f"Failed to publish bulk transfer progress for {bulk_transfer.id}: {str(e)}")
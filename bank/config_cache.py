@@ -0,0 +1,103 @@
+"""
+In-process caches for small, rarely changing configuration tables.
+
+Each process keeps the loaded snapshot in memory together with the version it
+was built from, instead of querying the database on each call. The version is
+re-read at most every CHECK_INTERVAL seconds and the snapshot is rebuilt when it
+changes:
+
+* with a `probe` (see `table_version`), the version is read from the source
+  tables themselves (row count and latest ``updated_at``), so a change made by
+  any process, including management commands, is seen by every other process;
+* without one, it is a counter in the Django cache bumped by `invalidate()`,
+  which only reaches other processes when that cache is shared.
+
+Either way a snapshot is never served for longer than MAX_AGE seconds.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Hashable, Optional
+from django.apps import apps
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+logger = logging.getLogger(__name__)
+
+
+def table_version(*model_labels: str) -> Callable[[], Hashable]:
+    """
+    Probe for VersionedConfigCache: (row count, latest updated_at) of each model,
+    given as 'app_label.ModelName'. Saves move updated_at and inserts/deletes move the count.
+    """
+    def probe():
+        versions = []
+        for label in model_labels:
+            model = apps.get_model(label)
+            row = model._base_manager.aggregate(count=Count('pk'), latest=Max('updated_at'))
+            versions.append((row['count'], row['latest']))
+        return tuple(versions)
+    return probe
+
+
+class VersionedConfigCache:
+    """A lazily built, process-local snapshot invalidated through a database probe or shared version counter."""
+
+    CHECK_INTERVAL = 1.0
+    MAX_AGE = 300.0
+
+    def __init__(self, name: str, loader: Callable[[], Any], check_interval: float = None,
+                 probe: Optional[Callable[[], Hashable]] = None, max_age: float = None):
+        self.name = name
+        self.loader = loader
+        self.probe = probe
+        self.check_interval = self.CHECK_INTERVAL if check_interval is None else check_interval
+        self.max_age = self.MAX_AGE if max_age is None else max_age
+        self.version_key = f"config_version:{name}"
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = None
+        self._checked_at = 0.0
+        self._built_at = 0.0
+
+    def _current_version(self):
+        if self.probe is not None:
+            try:
+                return self.probe()
+            except Exception as e:
+                # Keep serving the current snapshot (bounded by max_age) if the probe fails
+                logger.warning(f"Version probe for {self.name} config failed: {str(e)}")
+                return self._version
+        version = cache.get(self.version_key)
+        if version is None:
+            # First use (or evicted key): start a version so other processes can detect bumps
+            cache.add(self.version_key, 1, None)
+            version = cache.get(self.version_key, 1)
+        return version
+
+    def get(self):
+        """Return the snapshot, rebuilding it if the version changed or it is older than max_age."""
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._checked_at < self.check_interval:
+            return self._snapshot
+        version = self._current_version()
+        with self._lock:
+            if self._snapshot is None or version != self._version or now - self._built_at >= self.max_age:
+                self._snapshot = self.loader()
+                self._version = version
+                self._built_at = now
+                logger.debug(f"Rebuilt {self.name} config snapshot (version {version})")
+            self._checked_at = now
+            return self._snapshot
+
+    def invalidate(self):
+        """Drop the local snapshot and bump the shared version for every other process."""
+        with self._lock:
+            self._snapshot = None
+        if self.probe is not None:
+            # Other processes see the change through the probe
+            return
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, int(time.time()), None)
@@ -0,0 +1,72 @@
+"""
+Metrics for the bank admin dashboard.
+
+Daily volume, credit revenue, reversals and top users are all read from
+DailyTransactionRollup, so the cost does not grow with the Transaction table.
+The assembled payload is cached for DASHBOARD_CACHE_TTL seconds.
+"""
+import logging
+from datetime import timedelta
+from typing import Dict
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import DailyTransactionRollup
+from .rollup_services import TransactionRollupService
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardMetricsService:
+    """Assemble (and cache) the admin dashboard time series."""
+
+    CACHE_PREFIX = 'bank_admin_dashboard'
+    DEFAULT_CACHE_TTL = 60
+
+    @classmethod
+    def get_metrics(cls, days: int = 30) -> Dict:
+        key = f"{cls.CACHE_PREFIX}:{days}:{timezone.localdate().isoformat()}"
+        try:
+            metrics = cache.get(key)
+        except Exception:
+            metrics = None
+        if metrics is None:
+            metrics = cls.build_metrics(days)
+            try:
+                cache.set(key, metrics, timeout=getattr(settings, 'DASHBOARD_CACHE_TTL', cls.DEFAULT_CACHE_TTL))
+            except Exception as e:
+                logger.warning(f"Could not cache dashboard metrics: {str(e)}")
+        return metrics
+
+    @staticmethod
+    def build_metrics(days: int = 30) -> Dict:
+        today = timezone.localdate()
+        day_list = [today - timedelta(days=i) for i in range(days - 1, -1, -1)]
+
+        per_day = {row['day']: row for row in TransactionRollupService.daily_series(day_list[0], today)}
+
+        volume_data, revenue_data, reversal_data = [], [], []
+        for day in day_list:
+            row = per_day.get(day, {})
+            label = day.strftime('%Y-%m-%d')
+            volume_data.append({'date': label, 'count': row.get('tx_count') or 0})
+            revenue_data.append({'date': label, 'revenue': float(row.get('credit_total') or 0)})
+            reversal_data.append({'date': label, 'count': row.get('reversal_count') or 0})
+
+        # Top users by volume over the dashboard window
+        top_users = list(
+            DailyTransactionRollup.objects.filter(day__gte=day_list[0])
+            .values('wallet__user__username')
+            .annotate(total=Sum(F('credit_total') + F('debit_total')))
+            .order_by('-total')[:5]
+        )
+        top_users = [{'user__username': row['wallet__user__username'], 'total': row['total']} for row in top_users]
+
+        return {
+            'volume_data': volume_data,
+            'revenue_data': revenue_data,
+            'reversal_data': reversal_data,
+            'top_users': top_users,
+        }
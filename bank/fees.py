@@ -1,7 +1,10 @@
+from bisect import bisect_left
 from decimal import Decimal
 import math
-# VATCharge/TransferChargeControl models are not available; implement safe defaults
-from typing import Optional
+from typing import NamedTuple, Optional
+
+from .config_cache import VersionedConfigCache, table_version
+
 
 class _ChargeControl:
     def __init__(self, levy_active=True, vat_active=True, fee_active=True):
@@ -9,32 +12,72 @@ class _ChargeControl:
         self.vat_active = vat_active
         self.fee_active = fee_active
 
+
 def _get_db_charge_control() -> Optional[_ChargeControl]:
     try:
         from .models import TransferChargeControl  # type: ignore
         obj = TransferChargeControl.objects.order_by('-updated_at').first()
-        return obj
+        if obj is None:
+            return None
+        return _ChargeControl(obj.levy_active, obj.vat_active, obj.fee_active)
     except Exception:
         return None
 
+
+def _get_db_vat_rate() -> Decimal:
+    try:
+        from .models import VATCharge  # type: ignore
+        vat = VATCharge.objects.filter(active=True).order_by('-updated_at').first()
+        return vat.rate if vat else DEFAULT_VAT_RATE
+    except Exception:
+        return DEFAULT_VAT_RATE
+
+
+DEFAULT_VAT_RATE = Decimal('0.075')
 LEVY_THRESHOLD = Decimal('10000')
 LEVY_AMOUNT = Decimal('50')
 
+# Inter-bank transfer fee tiers as a sorted interval table: amounts up to and
+# including FEE_TIER_BOUNDS[i] pay FEE_TIER_FEES[i]; larger amounts pay the last fee
+FEE_TIER_BOUNDS = (Decimal('5000'), Decimal('50000'))
+FEE_TIER_FEES = (Decimal('10.00'), Decimal('25.00'), Decimal('50.00'))
+
+
+class FeeConfig(NamedTuple):
+    vat_rate: Decimal
+    charge_control: _ChargeControl
+
+
+def _load_fee_config() -> FeeConfig:
+    return FeeConfig(_get_db_vat_rate(), _get_db_charge_control() or _ChargeControl())
+
+
+# VAT rate and charge toggles; rebuilt when either table changes in any process
+fee_config_cache = VersionedConfigCache(
+    'transfer_fees', _load_fee_config, probe=table_version('bank.VATCharge', 'bank.TransferChargeControl')
+)
+
+
 def get_charge_control():
-    return _get_db_charge_control() or _ChargeControl()
+    return fee_config_cache.get().charge_control
+
 
 def get_active_vat_rate():
-    try:
-        from .models import VATCharge  # type: ignore
-        vat = VATCharge.objects.filter(active=True).order_by('-updated_at').first()
-        return vat.rate if vat else Decimal('0.075')
-    except Exception:
-        return Decimal('0.075')
+    return fee_config_cache.get().vat_rate
+
+
+def tier_fee(amount: Decimal) -> Decimal:
+    """Inter-bank transfer fee for `amount` (tier boundaries are inclusive)."""
+    return FEE_TIER_FEES[bisect_left(FEE_TIER_BOUNDS, amount)]
+
 
-def calculate_transfer_fees(amount, transfer_type='intra'):
+def calculate_transfer_fees(amount, transfer_type='intra', vat_rate=None, charge_control=None):
+    """Return (fee, vat, levy). Batch callers may pass vat_rate/charge_control loaded once."""
     amount = Decimal(amount)
-    vat_rate = get_active_vat_rate()
-    charge_control = get_charge_control()
+    if vat_rate is None or charge_control is None:
+        config = fee_config_cache.get()
+        vat_rate = config.vat_rate if vat_rate is None else vat_rate
+        charge_control = config.charge_control if charge_control is None else charge_control
     levy_active = charge_control.levy_active if charge_control else True
     vat_active = charge_control.vat_active if charge_control else True
     fee_active = charge_control.fee_active if charge_control else True
@@ -43,14 +86,7 @@ def calculate_transfer_fees(amount, transfer_type='intra'):
         fee = Decimal('0.00')
         vat = amount * vat_rate if vat_active else Decimal('0.00')
     else:
-        if not fee_active:
-            fee = Decimal('0.00')
-        elif amount <= 5000:
-            fee = Decimal('10.00')
-        elif amount <= 50000:
-            fee = Decimal('25.00')
-        else:
-            fee = Decimal('50.00')
+        fee = tier_fee(amount) if fee_active else Decimal('0.00')
         vat = fee * vat_rate if vat_active else Decimal('0.00')
 
     if levy_active and amount >= LEVY_THRESHOLD:
@@ -58,4 +94,4 @@ def calculate_transfer_fees(amount, transfer_type='intra'):
         levy = LEVY_AMOUNT * blocks
     else:
         levy = Decimal('0.00')
-    return (fee, vat, levy) 
\ No newline at end of file
+    return (fee, vat, levy)
@@ -11,6 +11,7 @@ from .models import (
     FixedSavingsSource, FixedSavingsPurpose, Wallet, XySaveAccount
 )
 from notification.models import Notification, NotificationType, NotificationLevel
+from .ledger_services import WalletLedger
 
 logger = logging.getLogger(__name__)
 
@@ -105,8 +106,7 @@ class FixedSavingsService:
             wallet = user.wallet
             
             if source == FixedSavingsSource.WALLET:
-                wallet.balance -= amount
-                wallet.save()
+                WalletLedger.debit(wallet, amount)
             elif source == FixedSavingsSource.XYSAVE:
                 try:
                     xysave_account = user.xysave_account
@@ -123,19 +123,17 @@ class FixedSavingsService:
                         wallet_deduction = min(wallet.balance.amount, remaining)
                         if wallet_deduction > 0:
                             wallet_deduction_money = Money(amount=wallet_deduction, currency=amount.currency)
-                            wallet.balance -= wallet_deduction_money
+                            WalletLedger.debit(wallet, wallet_deduction_money)
                             remaining -= wallet_deduction
                     if remaining > 0:
                         xysave_deduction_money = Money(amount=remaining, currency=amount.currency)
                         xysave_account.balance -= xysave_deduction_money
                         remaining = 0
-                    wallet.save()
                     xysave_account.save()
                 except XySaveAccount.DoesNotExist:
                     # If no XySave account, deduct full amount from wallet
                     logger.warning(f"User {user.id} has no XySave account, deducting full amount from wallet")
-                    wallet.balance -= amount
-                    wallet.save()
+                    WalletLedger.debit(wallet, amount)
         except Exception as e:
             logger.error(f"Error deducting funds for user {user.id}: {str(e)}")
             raise
@@ -0,0 +1,344 @@
+"""
+Batched daily interest accrual for XySave and Spend and Save accounts.
+
+Accounts are read in primary-key order, one chunk at a time. Each chunk is
+locked, priced with the account models' own tier logic, and committed with a
+single bulk insert of interest transactions, a single bulk balance update and
+a checkpoint write, all inside one database transaction.
+
+The account-id space can be split into shards so several workers accrue the
+same product and date in parallel, each with its own checkpoint row.
+"""
+import uuid
+import logging
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from djmoney.money import Money
+
+from .models import (
+    XySaveAccount, XySaveTransaction,
+    SpendAndSaveAccount, SpendAndSaveTransaction,
+    InterestAccrualRun,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BatchInterestAccrualService:
+    """Set-based daily interest engine with resumable checkpoints"""
+
+    DEFAULT_CHUNK_SIZE = 1000
+    PRODUCTS = ('spend_and_save', 'xysave')
+
+    @classmethod
+    def run_daily_accrual(cls, accrual_date=None, chunk_size=None, products=None):
+        """
+        Accrue one day of interest for every product.
+        Returns a dict of InterestAccrualRun rows keyed by product.
+        """
+        accrual_date = accrual_date or timezone.localdate()
+        results = {}
+        for product in products or cls.PRODUCTS:
+            results[product] = cls.accrue_product(product, accrual_date, chunk_size=chunk_size)
+        return results
+
+    @classmethod
+    def accrue_product(cls, product, accrual_date=None, chunk_size=None, shard_index=0, shard_count=1):
+        """
+        Accrue interest for a single product, resuming from its checkpoint.
+        With shard_count > 1 only accounts whose id falls in the shard's range are processed.
+        """
+        accrual_date = accrual_date or timezone.localdate()
+        chunk_size = chunk_size or cls.DEFAULT_CHUNK_SIZE
+        accrue_chunk = cls._chunk_handlers()[product]
+        lower, upper = cls.shard_bounds(shard_index, shard_count)
+
+        run, _ = InterestAccrualRun.objects.get_or_create(
+            product=product, accrual_date=accrual_date,
+            shard_index=shard_index, shard_count=shard_count,
+        )
+        if run.status == 'completed':
+            logger.info(f"{run} already completed; skipping")
+            return run
+
+        if run.status == 'failed':
+            run.status = 'running'
+            run.save(update_fields=['status', 'updated_at'])
+
+        cursor = run.last_account_id
+        try:
+            while True:
+                with transaction.atomic():
+                    last_id, processed, interest = accrue_chunk(cursor, accrual_date, chunk_size, lower, upper)
+                    if last_id is None:
+                        break
+                    InterestAccrualRun.objects.filter(pk=run.pk).update(
+                        last_account_id=last_id,
+                        accounts_processed=F('accounts_processed') + processed,
+                        total_interest=F('total_interest') + interest,
+                        updated_at=timezone.now(),
+                    )
+                cursor = last_id
+        except Exception as e:
+            logger.error(f"Error in batched interest run {run}: {str(e)}")
+            InterestAccrualRun.objects.filter(pk=run.pk).update(
+                status='failed',
+                failures=F('failures') + 1,
+                last_error=str(e),
+                updated_at=timezone.now(),
+            )
+            raise
+
+        InterestAccrualRun.objects.filter(pk=run.pk).update(
+            status='completed',
+            completed_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        run.refresh_from_db()
+        logger.info(f"Processed {run}: {run.accounts_processed} accounts, {run.total_interest} credited")
+        return run
+
+    @staticmethod
+    def shard_bounds(shard_index, shard_count):
+        """
+        Return the (lower, upper) UUID bounds of a shard of the account-id space.
+        Bounds split the 128-bit id range evenly; `upper` is None for the last shard.
+        """
+        if shard_count <= 1:
+            return None, None
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f"Shard index {shard_index} is out of range for {shard_count} shards")
+        span = (1 << 128) // shard_count
+        lower = uuid.UUID(int=shard_index * span)
+        upper = None if shard_index == shard_count - 1 else uuid.UUID(int=(shard_index + 1) * span)
+        return lower, upper
+
+    @staticmethod
+    def run_summary(run):
+        """Serializable summary of a single accrual run (one shard of one product)."""
+        duration = (run.completed_at or timezone.now()) - run.started_at
+        return {
+            'product': run.product,
+            'accrual_date': run.accrual_date.isoformat(),
+            'shard_index': run.shard_index,
+            'shard_count': run.shard_count,
+            'status': run.status,
+            'accounts_processed': run.accounts_processed,
+            'total_interest': str(run.total_interest),
+            'failures': run.failures,
+            'duration_seconds': duration.total_seconds(),
+        }
+
+    @staticmethod
+    def merge_summaries(summaries, started_at=None):
+        """Merge per-shard summaries into a single run summary."""
+        total_interest = Decimal('0')
+        accounts_processed = 0
+        failures = 0
+        failed_shards = []
+        for summary in summaries:
+            accounts_processed += summary.get('accounts_processed', 0)
+            total_interest += Decimal(str(summary.get('total_interest', '0')))
+            failures += summary.get('failures', 0)
+            if summary.get('status') != 'completed':
+                failed_shards.append({
+                    'product': summary.get('product'),
+                    'shard_index': summary.get('shard_index'),
+                    'error': summary.get('error', ''),
+                })
+        if started_at is not None:
+            duration_seconds = (timezone.now() - started_at).total_seconds()
+        else:
+            duration_seconds = max((s.get('duration_seconds', 0) for s in summaries), default=0)
+        return {
+            'shards': len(summaries),
+            'accounts_processed': accounts_processed,
+            'total_interest': str(total_interest),
+            'failures': failures,
+            'failed_shards': failed_shards,
+            'duration_seconds': duration_seconds,
+        }
+
+    @classmethod
+    def _chunk_handlers(cls):
+        return {
+            'xysave': cls._accrue_xysave_chunk,
+            'spend_and_save': cls._accrue_spend_and_save_chunk,
+        }
+
+    @staticmethod
+    def _interest_reference(prefix, account_id, accrual_date):
+        """Deterministic reference so a date is never credited twice for one account."""
+        return f"{prefix}_{accrual_date:%Y%m%d}_{account_id.hex.upper()}"
+
+    @staticmethod
+    def _lock_chunk(model, cursor, chunk_size, lower=None, upper=None):
+        queryset = model.objects.select_for_update().filter(is_active=True, balance__gt=0)
+        if lower is not None:
+            queryset = queryset.filter(id__gte=lower)
+        if upper is not None:
+            queryset = queryset.filter(id__lt=upper)
+        if cursor is not None:
+            queryset = queryset.filter(id__gt=cursor)
+        return list(queryset.order_by('id')[:chunk_size])
+
+    @staticmethod
+    def _existing_references(transaction_model, references):
+        return set(
+            transaction_model.objects.filter(reference__in=references).values_list('reference', flat=True)
+        )
+
+    @classmethod
+    def _accrue_xysave_chunk(cls, cursor, accrual_date, chunk_size, lower=None, upper=None):
+        """Credit one chunk of XySave accounts. Returns (last_id, processed, interest)."""
+        accounts = cls._lock_chunk(XySaveAccount, cursor, chunk_size, lower, upper)
+        if not accounts:
+            return None, 0, Decimal('0')
+
+        references = {
+            account.id: cls._interest_reference('XS_INT', account.id, accrual_date) for account in accounts
+        }
+        already_credited = cls._existing_references(XySaveTransaction, references.values())
+        now = timezone.now()
+        transactions, updated_accounts, credited = [], [], []
+        total_interest = Decimal('0')
+
+        for account in accounts:
+            if references[account.id] in already_credited:
+                continue
+            daily_interest = account.calculate_daily_interest()
+            if daily_interest.amount <= 0:
+                continue
+            transactions.append(XySaveTransaction(
+                xysave_account=account,
+                transaction_type='interest_credit',
+                amount=daily_interest,
+                balance_before=account.balance,
+                balance_after=account.balance + daily_interest,
+                reference=references[account.id],
+                description=f"Daily interest credit ({account.get_annual_interest_rate():.2f}% p.a.)",
+                metadata={'accrual_date': accrual_date.isoformat()},
+            ))
+            account.balance += daily_interest
+            account.total_interest_earned += daily_interest
+            account.last_interest_calculation = now
+            updated_accounts.append(account)
+            credited.append((account, daily_interest))
+            total_interest += daily_interest.amount
+
+        if updated_accounts:
+            XySaveTransaction.objects.bulk_create(transactions)
+            XySaveAccount.objects.bulk_update(
+                updated_accounts, ['balance', 'total_interest_earned', 'last_interest_calculation']
+            )
+            cls._notify_interest_credited(credited, source='xysave')
+
+        return accounts[-1].id, len(updated_accounts), total_interest
+
+    @classmethod
+    def _accrue_spend_and_save_chunk(cls, cursor, accrual_date, chunk_size, lower=None, upper=None):
+        """Credit one chunk of Spend and Save accounts. Returns (last_id, processed, interest)."""
+        accounts = cls._lock_chunk(SpendAndSaveAccount, cursor, chunk_size, lower, upper)
+        if not accounts:
+            return None, 0, Decimal('0')
+
+        references = {
+            account.id: cls._interest_reference('SAS_INT', account.id, accrual_date) for account in accounts
+        }
+        already_credited = cls._existing_references(SpendAndSaveTransaction, references.values())
+        now = timezone.now()
+        transactions, updated_accounts, credited = [], [], []
+        total_interest = Decimal('0')
+
+        for account in accounts:
+            if references[account.id] in already_credited:
+                continue
+            interest_amount = account.calculate_tiered_interest()
+            if interest_amount.amount <= 0:
+                continue
+            transactions.append(SpendAndSaveTransaction(
+                spend_and_save_account=account,
+                transaction_type='interest_credit',
+                amount=interest_amount,
+                balance_before=account.balance,
+                balance_after=account.balance + interest_amount,
+                reference=references[account.id],
+                description="Daily interest credit",
+                interest_earned=interest_amount,
+                interest_breakdown=_json_safe(account.get_interest_breakdown()),
+                metadata={'accrual_date': accrual_date.isoformat()},
+            ))
+            account.balance += interest_amount
+            account.total_interest_earned += interest_amount
+            account.last_interest_calculation = now
+            updated_accounts.append(account)
+            credited.append((account, interest_amount))
+            total_interest += interest_amount.amount
+
+        if updated_accounts:
+            SpendAndSaveTransaction.objects.bulk_create(transactions)
+            SpendAndSaveAccount.objects.bulk_update(
+                updated_accounts, ['balance', 'total_interest_earned', 'last_interest_calculation']
+            )
+            cls._notify_interest_credited(credited, source='spend_and_save')
+
+        return accounts[-1].id, len(updated_accounts), total_interest
+
+    @staticmethod
+    def _notify_interest_credited(credited, source):
+        """Queue interest notifications for a chunk with one bulk insert."""
+        from notification.models import Notification, NotificationType, NotificationLevel, NotificationStatus
+
+        if source == 'xysave':
+            title = "XySave Interest Credited"
+            template = (
+                "Interest of ₦{amount:,.2f} has been credited to your XySave account. "
+                "Total interest earned: ₦{total:,.2f}."
+            )
+            action_url = None
+        else:
+            title = "💸 Interest Credited!"
+            template = (
+                "Great news! ₦{amount:,.2f} in interest has been credited to your Spend and Save account. "
+                "Total interest earned: ₦{total:,.2f}"
+            )
+            action_url = '/spend-and-save/interest'
+
+        notifications = []
+        for account, interest in credited:
+            extra_data = {
+                'interest_amount': float(interest.amount),
+                'total_interest': float(account.total_interest_earned.amount),
+                'account_number': account.account_number,
+            }
+            if action_url:
+                extra_data['action_url'] = action_url
+            notifications.append(Notification(
+                recipient_id=account.user_id,
+                title=title,
+                message=template.format(amount=interest.amount, total=account.total_interest_earned.amount),
+                notification_type=NotificationType.INTEREST_CREDITED,
+                level=NotificationLevel.SUCCESS,
+                status=NotificationStatus.PENDING,
+                source=source,
+                extra_data=extra_data,
+            ))
+        try:
+            with transaction.atomic():
+                Notification.objects.bulk_create(notifications)
+        except Exception as e:
+            # Notifications must never roll back a committed interest chunk
+            logger.error(f"Error queueing {source} interest notifications: {str(e)}")
+
+
+def _json_safe(breakdown):
+    """Convert the Decimal values of an interest breakdown for JSONField storage."""
+    if isinstance(breakdown, dict):
+        return {key: _json_safe(value) for key, value in breakdown.items()}
+    if isinstance(breakdown, Money):
+        return float(breakdown.amount)
+    if isinstance(breakdown, Decimal):
+        return float(breakdown)
+    return breakdown
@@ -5,8 +5,10 @@ import logging
 from decimal import Decimal
 from datetime import datetime, timedelta
 from django.utils import timezone
+from django.db.models import Sum
 from djmoney.money import Money
 from .models import Wallet, Transaction
+from .ledger_services import WalletLedger
 
 logger = logging.getLogger(__name__)
 
@@ -291,8 +293,7 @@ class InterestAccrualService:
             )
             
             # Update wallet balance
-            wallet.balance = wallet.balance + interest_amount
-            wallet.save()
+            WalletLedger.credit(wallet, interest_amount)
             
             logger.info(f"Applied {interest_amount} interest to wallet {wallet.id}")
             return transaction
@@ -353,7 +354,7 @@ class InterestReportService:
             status='success'
         ).order_by('timestamp')
         
-        total_interest_paid = sum(t.amount.amount for t in interest_transactions)
+        total_interest_paid = interest_transactions.aggregate(total=Sum('amount'))['total'] or Decimal('0')
         
         # Calculate what interest should have been paid
         expected_interest = InterestRateCalculator.calculate_interest_breakdown(
@@ -383,7 +384,7 @@ class InterestReportService:
                     'amount': str(t.amount),
                     'timestamp': t.timestamp,
                     'description': t.description
-                } for t in interest_transactions
+                } for t in interest_transactions.only('id', 'amount', 'amount_currency', 'timestamp', 'description')
             ]
         }
     
@@ -0,0 +1,83 @@
+"""
+KYC tier balance policy.
+
+A user's KYC tier is cached per user, so checking a balance cap usually costs
+a cache read. The KYCProfile signals invalidate the entry, but with the default
+per-process cache that only reaches the worker that saved the profile, so
+entries expire after KYC_TIER_CACHE_TTL seconds (60 by default) and other
+workers pick up a new tier within that time.
+"""
+import logging
+from decimal import Decimal
+from typing import Optional
+from django.conf import settings
+from django.core.cache import cache
+
+from accounts.models import KYCProfile
+
+logger = logging.getLogger(__name__)
+
+
+class BalanceLimitExceededError(ValueError):
+    """Raised when a credit would take a wallet above its KYC tier balance cap."""
+
+
+class KYCBalancePolicy:
+    """Cached KYC-tier lookups and balance-cap checks."""
+
+    CACHE_PREFIX = 'kyc_tier'
+    DEFAULT_CACHE_TTL = 60
+    # Cached for users without a KYC profile so they are not re-queried on every check
+    NO_PROFILE = '-'
+
+    @classmethod
+    def _key(cls, user_id) -> str:
+        return f"{cls.CACHE_PREFIX}:{user_id}"
+
+    @classmethod
+    def cache_ttl(cls) -> int:
+        return int(getattr(settings, 'KYC_TIER_CACHE_TTL', cls.DEFAULT_CACHE_TTL))
+
+    @classmethod
+    def get_tier(cls, user_id) -> Optional[str]:
+        """KYC level of a user (None without a KYC profile)."""
+        key = cls._key(user_id)
+        try:
+            tier = cache.get(key)
+        except Exception:
+            tier = None
+        if tier is None:
+            tier = KYCProfile.objects.filter(user_id=user_id).values_list('kyc_level', flat=True).first()
+            tier = tier or cls.NO_PROFILE
+            try:
+                cache.set(key, tier, timeout=cls.cache_ttl())
+            except Exception as e:
+                logger.warning(f"Could not cache KYC tier for user {user_id}: {str(e)}")
+        return None if tier == cls.NO_PROFILE else tier
+
+    @classmethod
+    def invalidate(cls, user_id) -> None:
+        try:
+            cache.delete(cls._key(user_id))
+        except Exception as e:
+            logger.warning(f"Could not invalidate KYC tier cache for user {user_id}: {str(e)}")
+
+    @classmethod
+    def max_balance(cls, user_id) -> Optional[Decimal]:
+        """Balance cap for the user's tier, or None when uncapped."""
+        tier = cls.get_tier(user_id)
+        if tier is None:
+            # Wallets can exist before KYC; no cap applies until a profile exists
+            return None
+        limit = KYCProfile(kyc_level=tier).get_tier_limits().get('max_balance_limit')
+        return Decimal(str(limit)) if limit is not None else None
+
+    @classmethod
+    def check_balance(cls, user_id, new_balance) -> None:
+        """Raise BalanceLimitExceededError if `new_balance` is above the user's tier cap."""
+        limit = cls.max_balance(user_id)
+        value = new_balance.amount if hasattr(new_balance, 'amount') else Decimal(str(new_balance))
+        if limit is not None and value > limit:
+            raise BalanceLimitExceededError(
+                f"Balance would exceed the maximum of {limit} allowed for your KYC level"
+            )
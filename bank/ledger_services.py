@@ -0,0 +1,170 @@
+"""
+Atomic wallet balance updates.
+
+Every debit is a single conditional UPDATE (``balance >= amount``) that returns the
+new balance, so concurrent debits cannot overdraw a wallet or overwrite each
+other's writes. Updates touch only ``balance`` and ``updated_at`` and bypass
+``Wallet.save()``. Credits can also enforce the owner's KYC tier balance cap
+inside the same UPDATE (see KYC_ENFORCE_BALANCE_LIMIT).
+"""
+import logging
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from djmoney.money import Money
+
+from .models import Wallet
+from .kyc_policy_services import KYCBalancePolicy, BalanceLimitExceededError
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientFundsError(ValueError):
+    """Raised when a wallet debit would take the balance below zero."""
+
+
+class WalletLedger:
+    """Conditional debit/credit primitives for Wallet.balance."""
+
+    @staticmethod
+    def _amount(amount) -> Decimal:
+        value = amount.amount if hasattr(amount, 'amount') else amount
+        value = Decimal(str(value))
+        if value < 0:
+            raise ValueError("Ledger amounts must not be negative")
+        return value
+
+    @staticmethod
+    def _wallet_id(wallet):
+        return wallet.pk if isinstance(wallet, Wallet) else wallet
+
+    @staticmethod
+    def _update_returning() -> bool:
+        """Whether the database supports UPDATE ... RETURNING (PostgreSQL, SQLite 3.35+)."""
+        if connection.vendor == 'postgresql':
+            return True
+        if connection.vendor == 'sqlite':
+            import sqlite3
+            return sqlite3.sqlite_version_info >= (3, 35, 0)
+        return False
+
+    @classmethod
+    def _apply(cls, wallet_id, delta: Decimal, minimum=None, maximum=None):
+        """
+        Add `delta` to a wallet balance, optionally only if balance >= minimum
+        and/or balance <= maximum (both checked against the balance before the update).
+        Returns the new balance as a Decimal, or None if no row matched.
+        """
+        now = timezone.now()
+        if cls._update_returning():
+            # One statement: check, update and read back the new balance
+            table = connection.ops.quote_name(Wallet._meta.db_table)
+            balance_col = connection.ops.quote_name(Wallet._meta.get_field('balance').column)
+            updated_col = connection.ops.quote_name(Wallet._meta.get_field('updated_at').column)
+            pk_col = connection.ops.quote_name(Wallet._meta.pk.column)
+            sql = (
+                f"UPDATE {table} SET {balance_col} = {balance_col} + %s, {updated_col} = %s "
+                f"WHERE {pk_col} = %s"
+            )
+            params = [
+                delta,
+                Wallet._meta.get_field('updated_at').get_db_prep_value(now, connection),
+                Wallet._meta.pk.get_db_prep_value(wallet_id, connection),
+            ]
+            if minimum is not None:
+                sql += f" AND {balance_col} >= %s"
+                params.append(minimum)
+            if maximum is not None:
+                sql += f" AND {balance_col} <= %s"
+                params.append(maximum)
+            sql += f" RETURNING {balance_col}"
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+            return Decimal(str(row[0])) if row else None
+
+        queryset = Wallet.objects.filter(pk=wallet_id)
+        if minimum is not None:
+            queryset = queryset.filter(balance__gte=minimum)
+        if maximum is not None:
+            queryset = queryset.filter(balance__lte=maximum)
+        # The UPDATE holds the row lock until the read-back at the end of the transaction
+        with transaction.atomic():
+            if not queryset.update(balance=F('balance') + delta, updated_at=now):
+                return None
+            return Decimal(str(Wallet.objects.filter(pk=wallet_id).values_list('balance', flat=True).get()))
+
+    @classmethod
+    def _sync(cls, wallet, balance: Decimal) -> Money:
+        currency = wallet.balance.currency if isinstance(wallet, Wallet) else 'NGN'
+        new_balance = Money(balance, currency)
+        if isinstance(wallet, Wallet):
+            wallet.balance = new_balance
+        return new_balance
+
+    @classmethod
+    def debit(cls, wallet, amount) -> Money:
+        """
+        Debit a wallet if it holds at least `amount`.
+        Returns the new balance and refreshes `wallet.balance` when a Wallet is passed.
+        Raises InsufficientFundsError (a ValueError) if the balance is too low.
+        """
+        value = cls._amount(amount)
+        wallet_id = cls._wallet_id(wallet)
+        balance = cls._apply(wallet_id, -value, minimum=value)
+        if balance is None:
+            if not Wallet.objects.filter(pk=wallet_id).exists():
+                raise Wallet.DoesNotExist(f"Wallet {wallet_id} not found")
+            raise InsufficientFundsError("Insufficient wallet balance")
+        return cls._sync(wallet, balance)
+
+    @classmethod
+    def credit(cls, wallet, amount, enforce_kyc_limit=None) -> Money:
+        """
+        Credit a wallet. Returns the new balance and refreshes `wallet.balance`.
+        With `enforce_kyc_limit` (default: settings.KYC_ENFORCE_BALANCE_LIMIT) the credit
+        only applies if it keeps the balance within the owner's KYC tier cap, otherwise
+        BalanceLimitExceededError (a ValueError) is raised.
+        """
+        value = cls._amount(amount)
+        wallet_id = cls._wallet_id(wallet)
+        if enforce_kyc_limit is None:
+            enforce_kyc_limit = getattr(settings, 'KYC_ENFORCE_BALANCE_LIMIT', False)
+
+        maximum = None
+        if enforce_kyc_limit:
+            if isinstance(wallet, Wallet):
+                user_id = wallet.user_id
+            else:
+                user_id = Wallet.objects.filter(pk=wallet_id).values_list('user_id', flat=True).first()
+            limit = KYCBalancePolicy.max_balance(user_id) if user_id is not None else None
+            if limit is not None:
+                maximum = limit - value
+
+        balance = cls._apply(wallet_id, value, maximum=maximum)
+        if balance is None:
+            if maximum is not None and Wallet.objects.filter(pk=wallet_id).exists():
+                raise BalanceLimitExceededError(
+                    f"Balance would exceed the maximum of {maximum + value} allowed for this KYC level"
+                )
+            raise Wallet.DoesNotExist(f"Wallet {wallet_id} not found")
+        return cls._sync(wallet, balance)
+
+    @classmethod
+    def transfer(cls, sender, receiver, amount, debit_amount=None):
+        """
+        Move `amount` from sender to receiver; the sender is debited `debit_amount`
+        (e.g. amount plus fees) when given. Rows are updated in primary-key order
+        so opposing transfers cannot deadlock. Returns (sender_balance, receiver_balance).
+        """
+        debit_amount = amount if debit_amount is None else debit_amount
+        with transaction.atomic():
+            if str(cls._wallet_id(sender)) <= str(cls._wallet_id(receiver)):
+                sender_balance = cls.debit(sender, debit_amount)
+                receiver_balance = cls.credit(receiver, amount)
+            else:
+                receiver_balance = cls.credit(receiver, amount)
+                sender_balance = cls.debit(sender, debit_amount)
+        return sender_balance, receiver_balance
@@ -0,0 +1,42 @@
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from bank.models import Bank
+from bank.name_enquiry_services import LocalStubBackend, NameEnquiryService
+
+
+class Command(BaseCommand):
+    help = 'Benchmark account name enquiry (bank search and batch lookups) offline against the local stub.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency', type=float, default=0.2, help='Simulated seconds per lookup')
+        parser.add_argument('--accounts', type=int, default=50, help='Accounts in the batch lookup')
+
+    def handle(self, *args, **options):
+        NameEnquiryService.set_backend(LocalStubBackend(latency=options['latency']))
+        try:
+            bank_codes = list(Bank.objects.values_list('code', flat=True))
+            account_number = '0123456789'
+            pairs = [
+                (bank_codes[index % len(bank_codes)] if bank_codes else '044', f"{index:010d}")
+                for index in range(options['accounts'])
+            ]
+            keys = [NameEnquiryService.cache_key(code, number) for code, number in pairs]
+            keys += [NameEnquiryService.cache_key(code, account_number) for code in bank_codes]
+            cache.delete_many(keys)
+
+            for label in ('cold', 'warm'):
+                started = time.monotonic()
+                matches = NameEnquiryService.search_banks(account_number)
+                search_ms = (time.monotonic() - started) * 1000
+                started = time.monotonic()
+                results = NameEnquiryService.lookup_many(pairs)
+                batch_ms = (time.monotonic() - started) * 1000
+                self.stdout.write(
+                    f"{label}: search across {len(bank_codes)} banks {search_ms:.0f} ms ({len(matches)} matches), "
+                    f"batch of {len(results)} accounts {batch_ms:.0f} ms"
+                )
+            serial_s = options['latency'] * (len(bank_codes) + len(pairs))
+            self.stdout.write(self.style.SUCCESS(f"Serial lookups would take about {serial_s:.1f} s"))
+        finally:
+            NameEnquiryService.set_backend(None)
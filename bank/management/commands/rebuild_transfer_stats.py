@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from bank.transfer_stats_services import TransferStatsService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild per-user transfer statistics (count, mean, variance, max, recipients) from completed transfers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='user_ids',
+            help='Only rebuild stats for this user id (can be repeated)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of transfers read per database round trip'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding user transfer stats from transfer history...')
+        result = TransferStatsService.rebuild(
+            user_ids=options['user_ids'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(f"Users rebuilt: {result['users']}")
+        self.stdout.write(f"Stale rows removed: {result['removed']}")
+        self.stdout.write(self.style.SUCCESS('User transfer stats rebuilt.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from bank.velocity_services import VelocityCounterService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the fraud velocity counters (rolling windows and completed totals) from BankTransfer history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='user_ids',
+            help='Only rebuild counters for this user id (can be repeated)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of transfers read per database round trip'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding velocity counters from transfer history...')
+        result = VelocityCounterService.rebuild(
+            user_ids=options['user_ids'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(f"Window keys written: {result['window_keys']}")
+        self.stdout.write(f"Lifetime keys written: {result['lifetime_keys']}")
+        self.stdout.write(self.style.SUCCESS('Velocity counters rebuilt.'))
@@ -0,0 +1,51 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from bank.rollup_services import TransactionRollupService
+
+
+class Command(BaseCommand):
+    help = 'Recompute daily transaction rollups (per day, wallet and channel) from the Transaction table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from',
+            dest='date_from',
+            help='First day to rebuild (YYYY-MM-DD); defaults to --days back from today'
+        )
+        parser.add_argument(
+            '--to',
+            dest='date_to',
+            help='Last day to rebuild (YYYY-MM-DD); defaults to today'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Only fold in rows changed since the last run (watermark), like the periodic job'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=2,
+            help='Number of recent days to rebuild when --from is not given'
+        )
+
+    def handle(self, *args, **options):
+        if options['incremental']:
+            result = TransactionRollupService.run_incremental()
+            self.stdout.write(f"Rollup rows written: {result['rows']}")
+            self.stdout.write(self.style.SUCCESS('Transaction rollups are up to date.'))
+            return
+
+        try:
+            date_to = date.fromisoformat(options['date_to']) if options['date_to'] else timezone.localdate()
+            date_from = date.fromisoformat(options['date_from']) if options['date_from'] else None
+        except ValueError:
+            raise CommandError('Dates must be in YYYY-MM-DD format')
+        if date_from is None:
+            date_from = date_to - timezone.timedelta(days=max(options['days'], 1) - 1)
+
+        self.stdout.write(f'Rebuilding transaction rollups from {date_from} to {date_to}...')
+        result = TransactionRollupService.refresh_days(date_from, date_to)
+        self.stdout.write(f"Rollup rows written: {result['rows']}")
+        self.stdout.write(self.style.SUCCESS('Transaction rollups rebuilt.'))
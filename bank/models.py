@@ -86,7 +86,7 @@ def generate_alternative_account_number():
 
 # Remove KYCProfile and related constants from this file.
 # Update any references to import from accounts.models instead.
-from accounts.models import KYCProfile, KYCLevelChoices
+from accounts.models import KYCProfile, KYCLevelChoices  # noqa: F401 - bank.serializers imports KYCProfile from here
 
 GOVT_ID_TYPE_CHOICES = [
     ('national_id', _('National ID Card')),
@@ -117,17 +117,8 @@ class Wallet(models.Model):
         if not self.alternative_account_number:
             self.alternative_account_number = generate_alternative_account_number()
         
-        # Validate balance against KYC level limits
-        try:
-            kyc_profile = KYCProfile.objects.get(user=self.user)
-            # TODO: Implement balance validation logic if needed
-            # can_have_balance, message = kyc_profile.can_have_balance(self.balance)
-            # if not can_have_balance:
-            #     raise ValidationError(message)
-        except KYCProfile.DoesNotExist:
-            # If no KYC profile, allow the save (wallet might be created before KYC)
-            pass
-        
+        # KYC balance caps are enforced where balances change (WalletLedger.credit via
+        # KYCBalancePolicy), so a plain save costs no extra KYC lookup
         super().save(*args, **kwargs)
 
 class Transaction(models.Model):
@@ -157,6 +148,8 @@ class Transaction(models.Model):
     )
     description = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Moves on every save (e.g. pending -> success) so rollups can pick up status changes
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     status = models.CharField(
         max_length=10,
         choices=[
@@ -178,6 +171,10 @@ class Transaction(models.Model):
         verbose_name = _('Transaction')
         verbose_name_plural = _('Transactions')
         ordering = ['-timestamp']
+        indexes = [
+            # Keyset pagination of a wallet's history: WHERE wallet = ? AND (timestamp, id) < (?, ?)
+            models.Index(fields=['wallet', 'timestamp', 'id']),
+        ]
     def __str__(self):
         return f"Transaction - {self.reference} ({self.amount} {self.currency})"
 
@@ -248,6 +245,8 @@ class BankTransfer(models.Model):
     fraud_flags = models.JSONField(default=dict, blank=True, help_text=_('Fraud detection flags'))
     is_suspicious = models.BooleanField(default=False, help_text=_('Whether transfer was flagged as suspicious'))
     reviewed_by_fraud_team = models.BooleanField(default=False, help_text=_('Whether fraud team has reviewed'))
+    velocity_recorded_at = models.DateTimeField(null=True, blank=True, help_text=_('When the completed transfer was added to the velocity counters'))
+    stats_recorded_at = models.DateTimeField(null=True, blank=True, help_text=_('When the completed transfer was folded into the user transfer stats'))
     
     # Device & Location Tracking
     device_fingerprint = models.CharField(max_length=255, blank=True, null=True, help_text=_('Device fingerprint for security'))
@@ -293,6 +292,7 @@ class BankTransfer(models.Model):
         indexes = [
             models.Index(fields=['user', 'status', 'created_at']),
             models.Index(fields=['account_number', 'bank_code']),
+            models.Index(fields=['user', 'account_number', 'status']),
             models.Index(fields=['idempotency_key']),
             models.Index(fields=['bulk_transfer_id', 'bulk_index']),
             models.Index(fields=['scheduled_at']),
@@ -2268,6 +2268,8 @@ class ScheduledTransfer(models.Model):
             models.Index(fields=['user', 'is_active']),
             models.Index(fields=['next_execution']),
             models.Index(fields=['status']),
+            # Due-schedule claims: is_active AND status = pending AND next_execution <= now
+            models.Index(fields=['is_active', 'status', 'next_execution']),
         ]
 
 class BulkTransfer(models.Model):
@@ -2288,6 +2290,8 @@ class BulkTransfer(models.Model):
         ('failed', 'Failed'),
         ('cancelled', 'Cancelled'),
     ], default='pending')
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -2309,6 +2313,7 @@ class BulkTransferItem(models.Model):
     bank_name = models.CharField(max_length=255)
     amount = MoneyField(max_digits=19, decimal_places=4, default_currency='NGN')
     description = models.TextField(blank=True)
+    bulk_index = models.PositiveIntegerField(default=0)
     status = models.CharField(max_length=20, choices=TransferStatus.CHOICES, default=TransferStatus.PENDING)
     error_message = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -2317,6 +2322,7 @@ class BulkTransferItem(models.Model):
         db_table = 'bank_bulk_transfer_item'
         indexes = [
             models.Index(fields=['bulk_transfer', 'status']),
+            models.Index(fields=['bulk_transfer', 'bulk_index']),
         ]
 
 class EscrowService(models.Model):
@@ -2477,6 +2483,49 @@ class TransferFailure(models.Model):
         }
 
 
+# Tier boundaries shared by XySave and Spend and Save daily interest
+TIERED_INTEREST_THRESHOLDS = (Decimal('10000'), Decimal('100000'))
+
+# XySave daily rates: 20%, 16% and 8% p.a. spread over 365 days
+XYSAVE_DAILY_TIER_RATES = (
+    Decimal('0.20') / Decimal('365'),
+    Decimal('0.16') / Decimal('365'),
+    Decimal('0.08') / Decimal('365'),
+)
+
+
+def calculate_daily_tiered_interest(balance_amount, daily_rates):
+    """
+    Calculate one day of interest for a balance split across the three tiers.
+    `daily_rates` is a (tier_1, tier_2, tier_3) tuple of daily rates.
+    Returns a Decimal so callers can wrap it in Money or aggregate it in bulk.
+    """
+    balance = Decimal(balance_amount)
+    if balance <= 0:
+        return Decimal('0')
+
+    tier_1_threshold, tier_2_threshold = TIERED_INTEREST_THRESHOLDS
+    tier_1_rate, tier_2_rate, tier_3_rate = (Decimal(str(rate)) for rate in daily_rates)
+    total_interest = Decimal('0')
+
+    # Tier 1
+    tier_1_amount = min(balance, tier_1_threshold)
+    total_interest += tier_1_amount * tier_1_rate
+    balance -= tier_1_amount
+
+    # Tier 2
+    if balance > 0:
+        tier_2_amount = min(balance, tier_2_threshold - tier_1_threshold)
+        total_interest += tier_2_amount * tier_2_rate
+        balance -= tier_2_amount
+
+    # Tier 3
+    if balance > 0:
+        total_interest += balance * tier_3_rate
+
+    return total_interest
+
+
 class XySaveAccount(models.Model):
     """
     XySave Account - Savings and Investment feature
@@ -2511,38 +2560,10 @@ class XySaveAccount(models.Model):
           - Next up to 100,000 at 16% p.a
           - Above 100,000 at 8% p.a
         """
-        from decimal import Decimal
         if self.balance.amount <= 0:
             return Money(0, self.balance.currency)
 
-        balance = self.balance.amount
-        # Define thresholds and daily rates as Decimals to avoid float math
-        TIER_1_THRESHOLD = Decimal('10000')
-        TIER_2_THRESHOLD = Decimal('100000')
-        DAILY_TIER_1_RATE = Decimal('0.20') / Decimal('365')
-        DAILY_TIER_2_RATE = Decimal('0.16') / Decimal('365')
-        DAILY_TIER_3_RATE = Decimal('0.08') / Decimal('365')
-
-        total_interest = Decimal('0')
-
-        # Tier 1
-        tier_1_amount = min(balance, TIER_1_THRESHOLD)
-        if tier_1_amount > 0:
-            total_interest += tier_1_amount * DAILY_TIER_1_RATE
-            balance -= tier_1_amount
-
-        # Tier 2
-        if balance > 0:
-            tier_2_cap = TIER_2_THRESHOLD - TIER_1_THRESHOLD
-            tier_2_amount = min(balance, tier_2_cap)
-            if tier_2_amount > 0:
-                total_interest += tier_2_amount * DAILY_TIER_2_RATE
-                balance -= tier_2_amount
-
-        # Tier 3
-        if balance > 0:
-            total_interest += balance * DAILY_TIER_3_RATE
-
+        total_interest = calculate_daily_tiered_interest(self.balance.amount, XYSAVE_DAILY_TIER_RATES)
         return Money(total_interest, self.balance.currency)
     
     def get_annual_interest_rate(self):
@@ -2773,28 +2794,10 @@ class SpendAndSaveAccount(models.Model):
         if self.balance.amount <= 0:
             return Money(0, self.balance.currency)
         
-        balance = self.balance.amount
-        total_interest = 0
-        
-        # Tier 1: First 10,000 at 20% p.a
-        if balance > 0:
-            tier_1_amount = min(balance, self.TIER_1_THRESHOLD)
-            tier_1_interest = tier_1_amount * self.daily_tier_1_rate
-            total_interest += tier_1_interest
-            balance -= tier_1_amount
-        
-        # Tier 2: 10,001 - 100,000 at 16% p.a
-        if balance > 0:
-            tier_2_amount = min(balance, self.TIER_2_THRESHOLD - self.TIER_1_THRESHOLD)
-            tier_2_interest = tier_2_amount * self.daily_tier_2_rate
-            total_interest += tier_2_interest
-            balance -= tier_2_amount
-        
-        # Tier 3: Above 100,000 at 8% p.a
-        if balance > 0:
-            tier_3_interest = balance * self.daily_tier_3_rate
-            total_interest += tier_3_interest
-        
+        total_interest = calculate_daily_tiered_interest(
+            self.balance.amount,
+            (self.daily_tier_1_rate, self.daily_tier_2_rate, self.daily_tier_3_rate),
+        )
         return Money(total_interest, self.balance.currency)
     
     def get_interest_breakdown(self):
@@ -3052,6 +3055,202 @@ def calculate_tiered_interest_rate(balance_amount):
     
     return breakdown
 
+class InterestAccrualRun(models.Model):
+    """
+    Checkpoint for a batched daily interest run.
+    One row per product, accrual date and account-id shard; `last_account_id`
+    records the last account committed so a crashed run resumes where it stopped.
+    """
+    PRODUCT_CHOICES = [
+        ('xysave', 'XySave'),
+        ('spend_and_save', 'Spend and Save'),
+    ]
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    product = models.CharField(max_length=20, choices=PRODUCT_CHOICES)
+    accrual_date = models.DateField()
+    shard_index = models.PositiveIntegerField(default=0)
+    shard_count = models.PositiveIntegerField(default=1)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    last_account_id = models.UUIDField(null=True, blank=True, help_text=_('Last account committed by this run'))
+    accounts_processed = models.PositiveIntegerField(default=0)
+    total_interest = models.DecimalField(max_digits=19, decimal_places=4, default=0)
+    failures = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Interest Accrual Run"
+        verbose_name_plural = "Interest Accrual Runs"
+        ordering = ['-accrual_date', 'product']
+        unique_together = ('product', 'accrual_date', 'shard_index', 'shard_count')
+
+    def __str__(self):
+        shard = f" [{self.shard_index + 1}/{self.shard_count}]" if self.shard_count > 1 else ""
+        return f"{self.get_product_display()} interest - {self.accrual_date}{shard} ({self.status})"
+
+
+class UserTransferStats(models.Model):
+    """
+    Running statistics of a user's completed transfers, used for amount-anomaly scoring.
+    Mean and variance are maintained incrementally (Welford) so reads cost one row
+    regardless of how long the user's transfer history is.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='transfer_stats')
+    count = models.PositiveIntegerField(default=0)
+    mean_amount = models.FloatField(default=0)
+    m2 = models.FloatField(default=0, help_text=_('Sum of squared deviations from the mean'))
+    max_amount = models.DecimalField(max_digits=19, decimal_places=4, default=0)
+    distinct_recipients = models.PositiveIntegerField(default=0)
+    last_seen_at = models.DateTimeField(null=True, blank=True, help_text=_('Time of the last completed transfer'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "User Transfer Stats"
+        verbose_name_plural = "User Transfer Stats"
+
+    def __str__(self):
+        return f"{self.user.username} - {self.count} transfers, mean {self.mean_amount:.2f}"
+
+    def add_sample(self, amount, seen_at=None, new_recipient=False):
+        """Fold one completed transfer amount into the running statistics."""
+        value = float(amount.amount if hasattr(amount, 'amount') else amount)
+        self.count += 1
+        delta = value - self.mean_amount
+        self.mean_amount += delta / self.count
+        self.m2 += delta * (value - self.mean_amount)
+        if Decimal(str(value)) > self.max_amount:
+            self.max_amount = Decimal(str(value))
+        if new_recipient:
+            self.distinct_recipients += 1
+        if seen_at and (self.last_seen_at is None or seen_at > self.last_seen_at):
+            self.last_seen_at = seen_at
+
+    @property
+    def variance(self):
+        """Sample variance of completed transfer amounts (0 with fewer than two transfers)."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std_dev(self):
+        return math.sqrt(self.variance)
+
+
+class VelocityCounter(models.Model):
+    """
+    One rolling-window bucket (or lifetime total) of transfer counts for fraud scoring.
+    Rows are updated with F() expressions so every worker sees the same totals;
+    window buckets carry an expiry and are purged once they fall out of their window.
+    """
+    key = models.CharField(max_length=255, primary_key=True)
+    count = models.BigIntegerField(default=0)
+    amount = models.BigIntegerField(default=0, help_text=_('Amount in 1/10000 currency units'))
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Velocity Counter"
+        verbose_name_plural = "Velocity Counters"
+
+    def __str__(self):
+        return f"{self.key}: {self.count}"
+
+
+class DailyTransactionRollup(models.Model):
+    """
+    Pre-aggregated activity per day, wallet and channel.
+    Counts and sums come from Transaction (credit/debit totals only count successful
+    rows); fee_total and failure_count come from the wallet owner's BankTransfers,
+    reported on the 'transfer' channel. Reporting reads these rows instead of
+    scanning the raw tables.
+    """
+    day = models.DateField()
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='daily_rollups')
+    channel = models.CharField(max_length=20)
+    tx_count = models.PositiveIntegerField(default=0)
+    credit_total = models.DecimalField(max_digits=19, decimal_places=4, default=0)
+    debit_total = models.DecimalField(max_digits=19, decimal_places=4, default=0)
+    reversal_count = models.PositiveIntegerField(default=0)
+    fee_total = models.DecimalField(max_digits=19, decimal_places=4, default=0, help_text=_('Fee, VAT and levy of completed transfers'))
+    failure_count = models.PositiveIntegerField(default=0, help_text=_('Failed bank transfers'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Daily Transaction Rollup"
+        verbose_name_plural = "Daily Transaction Rollups"
+        ordering = ['-day']
+        unique_together = ('day', 'wallet', 'channel')
+        indexes = [
+            models.Index(fields=['day', 'wallet']),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.wallet_id} {self.channel}: {self.tx_count} transactions"
+
+
+class RollupWatermark(models.Model):
+    """High-water mark of an incremental rollup job: rows changed after `position` are still to be folded in."""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.DateTimeField(null=True, blank=True)
+    last_run_rows = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Rollup Watermark"
+        verbose_name_plural = "Rollup Watermarks"
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+class OutboxEvent(models.Model):
+    """
+    A side effect (notification, auto-save, sweep) recorded in the same database
+    transaction as the change that caused it, and delivered later by the outbox relay.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DELIVERED = 'delivered'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_PROCESSING, _('Processing')),
+        (STATUS_DELIVERED, _('Delivered')),
+        (STATUS_FAILED, _('Failed')),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    event_type = models.CharField(max_length=100)
+    aggregate_type = models.CharField(max_length=50)
+    aggregate_id = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now, help_text=_('Not delivered before this time (retry backoff)'))
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Outbox Event"
+        verbose_name_plural = "Outbox Events"
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+            models.Index(fields=['aggregate_type', 'aggregate_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.aggregate_type}:{self.aggregate_id} ({self.status})"
+
+
 class TargetSavingCategory(models.TextChoices):
     """Categories for target savings"""
     ACCOMMODATION = 'accommodation', _('Accommodation')
@@ -0,0 +1,202 @@
+"""
+Account name enquiry (NIBSS NE) with caching and concurrent fan-out.
+
+Results are cached per (bank_code, account_number): found accounts for
+NAME_ENQUIRY_CACHE_TTL seconds and "not found" answers for the shorter
+NAME_ENQUIRY_NEGATIVE_TTL. Timeouts and transport errors are never cached.
+Cache misses are resolved concurrently on a shared thread pool, each lookup
+bounded by NAME_ENQUIRY_TIMEOUT, so searching every bank for an account or
+resolving a whole bulk transfer costs roughly one round trip.
+
+The backend is pluggable (NAME_ENQUIRY_BACKEND). The default LocalStubBackend
+answers from the simulated bank mapping, with NAME_ENQUIRY_STUB_LATENCY seconds
+of artificial delay per lookup for offline benchmarking. Its "not found" answers
+are not authoritative, so callers must not reject money movement on them
+(see NameEnquiryService.rejects_unknown_accounts).
+"""
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from .bank_directory_services import BankDirectory
+
+logger = logging.getLogger(__name__)
+
+
+class NameEnquiryBackend:
+    """Resolves the account name of an account at one bank."""
+
+    # Whether a None from resolve() means the bank really has no such account
+    authoritative = True
+
+    def resolve(self, bank_code: str, account_number: str) -> Optional[str]:
+        """Return the account name, or None if the bank has no such account. Raise on transport errors."""
+        raise NotImplementedError
+
+
+class LocalStubBackend(NameEnquiryBackend):
+    """Offline stand-in for NIBSS answering from the simulated bank/account mapping."""
+
+    authoritative = False
+
+    def __init__(self, latency: float = None):
+        self.latency = getattr(settings, 'NAME_ENQUIRY_STUB_LATENCY', 0.0) if latency is None else latency
+
+    def resolve(self, bank_code: str, account_number: str) -> Optional[str]:
+        from .services import BankAccountService
+
+        if self.latency:
+            time.sleep(self.latency)
+        if not BankAccountService._verify_account_with_bank(bank_code, account_number):
+            return None
+        return BankAccountService._get_account_name(bank_code, account_number)
+
+
+class NameEnquiryService:
+    """Cached, concurrent account name lookups."""
+
+    CACHE_PREFIX = 'name_enquiry'
+    DEFAULT_CACHE_TTL = 6 * 60 * 60
+    DEFAULT_NEGATIVE_TTL = 10 * 60
+    DEFAULT_TIMEOUT = 3.0
+    DEFAULT_MAX_WORKERS = 16
+
+    _backend = None
+    _executor = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def backend(cls) -> NameEnquiryBackend:
+        if cls._backend is None:
+            path = getattr(settings, 'NAME_ENQUIRY_BACKEND', 'bank.name_enquiry_services.LocalStubBackend')
+            cls._backend = import_string(path)()
+        return cls._backend
+
+    @classmethod
+    def set_backend(cls, backend: Optional[NameEnquiryBackend]):
+        """Swap the backend (None restores the configured one), e.g. for benchmarks."""
+        cls._backend = backend
+
+    @classmethod
+    def rejects_unknown_accounts(cls) -> bool:
+        """Whether "not found" answers may be used to reject a transfer (only with a real backend)."""
+        return getattr(cls.backend(), 'authoritative', True)
+
+    @classmethod
+    def _max_workers(cls) -> int:
+        return max(int(getattr(settings, 'NAME_ENQUIRY_MAX_WORKERS', cls.DEFAULT_MAX_WORKERS)), 1)
+
+    @classmethod
+    def executor(cls) -> ThreadPoolExecutor:
+        if cls._executor is None:
+            with cls._lock:
+                if cls._executor is None:
+                    cls._executor = ThreadPoolExecutor(max_workers=cls._max_workers(), thread_name_prefix='name-enquiry')
+        return cls._executor
+
+    @classmethod
+    def cache_key(cls, bank_code: str, account_number: str) -> str:
+        return f"{cls.CACHE_PREFIX}:{bank_code}:{account_number}"
+
+    @staticmethod
+    def _result(bank_code, account_number, account_name=None, found=False, error=None) -> Dict:
+        result = {
+            'bank_code': bank_code,
+            'account_number': account_number,
+            'account_name': account_name,
+            'found': found,
+        }
+        if error:
+            result['error'] = error
+        return result
+
+    @classmethod
+    def lookup_many(cls, pairs: Iterable[Tuple[str, str]], timeout: float = None) -> Dict[Tuple[str, str], Dict]:
+        """
+        Resolve many (bank_code, account_number) pairs in one call.
+        Returns {pair: result}; result['found'] is False for unknown accounts, and
+        result['error'] is set when the lookup timed out or failed (not cached).
+        """
+        pairs = list(dict.fromkeys((str(bank_code), str(account_number)) for bank_code, account_number in pairs))
+        if not pairs:
+            return {}
+        timeout = getattr(settings, 'NAME_ENQUIRY_TIMEOUT', cls.DEFAULT_TIMEOUT) if timeout is None else timeout
+
+        keys = {cls.cache_key(*pair): pair for pair in pairs}
+        cached = cache.get_many(list(keys))
+        results = {keys[key]: value for key, value in cached.items()}
+        misses = [pair for pair in pairs if pair not in results]
+        if not misses:
+            return results
+
+        backend = cls.backend()
+        futures = {cls.executor().submit(backend.resolve, *pair): pair for pair in misses}
+        # Every lookup gets `timeout` seconds once a worker picks it up
+        waves = math.ceil(len(misses) / cls._max_workers())
+        done, _ = wait(futures, timeout=timeout * waves)
+
+        found, not_found = {}, {}
+        for future, pair in futures.items():
+            if future not in done:
+                future.cancel()
+                logger.warning(f"Name enquiry timed out for account {pair[1]} at bank {pair[0]}")
+                results[pair] = cls._result(*pair, error='timeout')
+                continue
+            try:
+                account_name = future.result()
+            except Exception as e:
+                logger.error(f"Name enquiry failed for account {pair[1]} at bank {pair[0]}: {str(e)}")
+                results[pair] = cls._result(*pair, error=str(e))
+                continue
+            result = cls._result(*pair, account_name=account_name, found=account_name is not None)
+            results[pair] = result
+            (found if result['found'] else not_found)[cls.cache_key(*pair)] = result
+
+        if found:
+            cache.set_many(found, getattr(settings, 'NAME_ENQUIRY_CACHE_TTL', cls.DEFAULT_CACHE_TTL))
+        if not_found:
+            cache.set_many(not_found, getattr(settings, 'NAME_ENQUIRY_NEGATIVE_TTL', cls.DEFAULT_NEGATIVE_TTL))
+        return results
+
+    @classmethod
+    def lookup(cls, bank_code: str, account_number: str, timeout: float = None) -> Dict:
+        """Resolve one account at one bank (cached)."""
+        return cls.lookup_many([(bank_code, account_number)], timeout=timeout)[(str(bank_code), str(account_number))]
+
+    @classmethod
+    def search_banks(cls, account_number: str, timeout: float = None) -> List[Dict]:
+        """Look the account number up at every bank concurrently; returns the banks that know it."""
+        banks = [(bank['code'], bank['name']) for bank in BankDirectory.snapshot().banks]
+        results = cls.lookup_many(((code, account_number) for code, _ in banks), timeout=timeout)
+        matches = []
+        for code, name in banks:
+            result = results.get((str(code), str(account_number)))
+            if result and result['found']:
+                matches.append({**result, 'bank_name': name})
+        return matches
+
+    @classmethod
+    def validate_account(cls, account_number: str) -> Dict:
+        """NIBSSClient.validate_account_number (bank detected from the number itself), cached."""
+        from .nibss import NIBSSClient
+
+        key = cls.cache_key('any', account_number)
+        result = cache.get(key)
+        if result is None:
+            result = NIBSSClient().validate_account_number(account_number)
+            ttl_setting, default = (
+                ('NAME_ENQUIRY_CACHE_TTL', cls.DEFAULT_CACHE_TTL) if result.get('valid')
+                else ('NAME_ENQUIRY_NEGATIVE_TTL', cls.DEFAULT_NEGATIVE_TTL)
+            )
+            cache.set(key, result, getattr(settings, ttl_setting, default))
+        return result
+
+    @classmethod
+    def invalidate(cls, bank_code: str, account_number: str):
+        cache.delete(cls.cache_key(bank_code, account_number))
@@ -0,0 +1,328 @@
+"""
+Batched SMS, push and WebSocket delivery.
+
+Messages are queued per thread and flushed together: SMS go out over one pooled
+keep-alive Twilio HTTP session, push messages as one concurrent FCM multi-device
+request per chunk, and WebSocket messages as one ``group_send`` per user. Outside
+a ``NotificationDispatcher.batch()`` block every message is flushed as soon as it
+is queued, so callers that send a single notification behave as before.
+
+Identical messages to the same recipient are dropped within DEDUP_WINDOW seconds
+(shared through the cache), each channel is throttled to its per-second rate
+limit (per worker process, across its threads), and send counts and latencies
+are accumulated in the cache, one atomically incremented key per counter, for
+NotificationDispatcher.metrics().
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Dict, List
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+# Per-channel (window start, sends in window), shared by every thread of the process
+_rate_windows = {}
+_rate_lock = threading.Lock()
+
+
+class NotificationDispatcher:
+    """Queue notifications per channel and flush them in batches."""
+
+    CHANNELS = ('sms', 'push', 'websocket')
+    # Messages per second and channel, overridable with settings.NOTIFICATION_RATE_LIMITS
+    DEFAULT_RATE_LIMITS = {'sms': 20, 'push': 500, 'websocket': 2000}
+    DEFAULT_DEDUP_WINDOW = 60
+    # A batch flushes a channel early once this many messages are queued on it
+    MAX_QUEUED = 500
+    PUSH_TIMEOUT = 10
+    DEDUP_PREFIX = 'notification_dedup'
+    METRICS_KEY = 'notification_dispatch_metrics'
+    COUNTERS = ('sent', 'failed', 'deduplicated', 'batches', 'latency_ms_total')
+
+    _clients = {}
+    _clients_lock = threading.Lock()
+
+    # Clients
+
+    @classmethod
+    def sms_client(cls):
+        """Twilio client on a pooled keep-alive HTTP session, or None if SMS is not configured."""
+        if 'sms' not in cls._clients:
+            with cls._clients_lock:
+                client = None
+                if settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN and getattr(settings, 'TWILIO_PHONE_NUMBER', None):
+                    try:
+                        from twilio.http.http_client import TwilioHttpClient
+                        from twilio.rest import Client
+                        client = Client(
+                            settings.TWILIO_ACCOUNT_SID,
+                            settings.TWILIO_AUTH_TOKEN,
+                            http_client=TwilioHttpClient(pool_connections=True, timeout=10),
+                        )
+                    except Exception as e:
+                        logger.warning(f"Twilio not configured - SMS notifications disabled: {str(e)}")
+                cls._clients['sms'] = client
+        return cls._clients['sms']
+
+    @classmethod
+    def fcm_client(cls):
+        """FCM HTTP v1 client, or None if push is not configured."""
+        if 'push' not in cls._clients:
+            with cls._clients_lock:
+                client = None
+                service_account_file = getattr(settings, 'FCM_SERVICE_ACCOUNT_FILE', None)
+                if service_account_file:
+                    try:
+                        from pyfcm import FCMNotification
+                        client = FCMNotification(
+                            service_account_file=service_account_file,
+                            project_id=getattr(settings, 'FCM_PROJECT_ID', None),
+                        )
+                    except Exception as e:
+                        logger.warning(f"FCM not configured - push notifications disabled: {str(e)}")
+                cls._clients['push'] = client
+        return cls._clients['push']
+
+    # Queueing
+
+    @classmethod
+    def _queues(cls) -> Dict[str, OrderedDict]:
+        if not hasattr(_state, 'queues'):
+            _state.queues = {channel: OrderedDict() for channel in cls.CHANNELS}
+            _state.deduplicated = defaultdict(int)
+            _state.depth = 0
+        return _state.queues
+
+    @classmethod
+    @contextmanager
+    def batch(cls):
+        """Collect notifications queued inside the block and flush them together at the end."""
+        cls._queues()
+        _state.depth += 1
+        try:
+            yield cls
+        finally:
+            _state.depth -= 1
+            if _state.depth == 0:
+                cls.flush()
+
+    @classmethod
+    def dedup_window(cls) -> int:
+        return int(getattr(settings, 'NOTIFICATION_DEDUP_WINDOW', cls.DEFAULT_DEDUP_WINDOW))
+
+    @classmethod
+    def rate_limit(cls, channel: str) -> int:
+        limits = getattr(settings, 'NOTIFICATION_RATE_LIMITS', None) or {}
+        return max(int(limits.get(channel, cls.DEFAULT_RATE_LIMITS[channel])), 1)
+
+    @classmethod
+    def _queue(cls, channel: str, recipient, content, message: Dict) -> bool:
+        """Queue a message unless an identical one went to the same recipient recently."""
+        queues = cls._queues()
+        key = hashlib.sha1(
+            json.dumps([channel, str(recipient), content], sort_keys=True, default=str).encode()
+        ).hexdigest()
+        window = cls.dedup_window()
+        if key in queues[channel] or (window > 0 and not cache.add(f"{cls.DEDUP_PREFIX}:{key}", 1, window)):
+            _state.deduplicated[channel] += 1
+            if not _state.depth:
+                cls.flush(channel)
+            return False
+
+        queues[channel][key] = message
+        if not _state.depth or len(queues[channel]) >= cls.MAX_QUEUED:
+            cls.flush(channel)
+        return True
+
+    @classmethod
+    def queue_sms(cls, phone_number, text: str) -> bool:
+        return cls._queue('sms', phone_number, text, {'to': str(phone_number), 'body': text})
+
+    @classmethod
+    def queue_push(cls, user, title: str, body: str, data: Dict = None) -> bool:
+        """Queue a push message to the user's FCM token; False if the user has none."""
+        fcm_token = getattr(user, 'fcm_token', None)
+        if not fcm_token:
+            profile = getattr(user, 'profile', None)
+            fcm_token = getattr(profile, 'fcm_token', None)
+        if not fcm_token:
+            logger.warning(f"No FCM token for user {user.id}")
+            return False
+        # FCM data payload values must be strings
+        data = {str(k): str(v) for k, v in (data or {}).items()}
+        return cls._queue('push', fcm_token, [title, body, data], {
+            'fcm_token': fcm_token,
+            'notification_title': title,
+            'notification_body': body,
+            'data_payload': data,
+        })
+
+    @classmethod
+    def queue_websocket(cls, user_id, title: str, message: str, extra_data: Dict = None) -> bool:
+        """Queue a message for the user's NotificationConsumer group."""
+        extra_data = extra_data or {}
+        return cls._queue('websocket', user_id, [title, message, extra_data], {
+            'user_id': user_id,
+            'title': title,
+            'message': message,
+            'extra_data': extra_data,
+        })
+
+    # Flushing
+
+    @classmethod
+    def _throttle(cls, channel: str, count: int):
+        """Fixed one-second window limiter per channel and process; sleeps until `count` more sends fit."""
+        limit = cls.rate_limit(channel)
+        while True:
+            with _rate_lock:
+                started, used = _rate_windows.get(channel, (0.0, 0))
+                now = time.monotonic()
+                if now - started >= 1:
+                    started, used = now, 0
+                # A chunk larger than the limit gets a window of its own
+                if used + count <= limit or used == 0:
+                    _rate_windows[channel] = (started, used + count)
+                    return
+                wait = started + 1 - now
+            time.sleep(max(wait, 0))
+
+    @classmethod
+    def flush(cls, channel: str = None) -> Dict[str, Dict[str, int]]:
+        """Send everything queued (on one channel or all of them)."""
+        queues = cls._queues()
+        senders = {'sms': cls._send_sms, 'push': cls._send_push, 'websocket': cls._send_websocket}
+        results = {}
+        for name in ([channel] if channel else cls.CHANNELS):
+            messages = list(queues[name].values())
+            queues[name].clear()
+            deduplicated = _state.deduplicated.pop(name, 0)
+            if deduplicated:
+                cls._record(name, deduplicated=deduplicated)
+            if not messages:
+                continue
+            limit = cls.rate_limit(name)
+            totals = defaultdict(int)
+            for start in range(0, len(messages), limit):
+                chunk = messages[start:start + limit]
+                cls._throttle(name, len(chunk))
+                started = time.monotonic()
+                try:
+                    sent, failed = senders[name](chunk)
+                except Exception as e:
+                    logger.error(f"{name} notification batch failed: {str(e)}")
+                    sent, failed = 0, len(chunk)
+                latency_ms = int((time.monotonic() - started) * 1000)
+                cls._record(name, sent=sent, failed=failed, batches=1, latency_ms=latency_ms)
+                totals['sent'] += sent
+                totals['failed'] += failed
+            results[name] = dict(totals)
+        return results
+
+    @classmethod
+    def _send_sms(cls, messages: List[Dict]):
+        client = cls.sms_client()
+        if client is None:
+            logger.warning(f"{len(messages)} SMS notification(s) skipped - Twilio not configured")
+            return 0, len(messages)
+        sent = failed = 0
+        for message in messages:
+            try:
+                client.messages.create(body=message['body'], from_=settings.TWILIO_PHONE_NUMBER, to=message['to'])
+                sent += 1
+            except Exception as e:
+                logger.error(f"SMS sending failed: {str(e)}")
+                failed += 1
+        return sent, failed
+
+    @classmethod
+    def _send_push(cls, messages: List[Dict]):
+        client = cls.fcm_client()
+        if client is None:
+            logger.warning(f"{len(messages)} push notification(s) skipped - FCM not configured")
+            return 0, len(messages)
+        responses = client.async_notify_multiple_devices(params_list=messages, timeout=cls.PUSH_TIMEOUT)
+        failed = sum(1 for response in responses if not isinstance(response, dict) or 'error' in response)
+        return len(messages) - failed, failed
+
+    @classmethod
+    def _send_websocket(cls, messages: List[Dict]):
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return 0, len(messages)
+        by_user = OrderedDict()
+        for message in messages:
+            by_user.setdefault(message['user_id'], []).append(
+                {'title': message['title'], 'message': message['message'], 'extra_data': message['extra_data']}
+            )
+        sent = failed = 0
+        for user_id, items in by_user.items():
+            if len(items) == 1:
+                event = {'type': 'notify', **items[0]}
+            else:
+                event = {'type': 'notify.batch', 'messages': items}
+            try:
+                async_to_sync(channel_layer.group_send)(f"user_{user_id}", event)
+                sent += len(items)
+            except Exception as e:
+                logger.error(f"WebSocket notification failed for user {user_id}: {str(e)}")
+                failed += len(items)
+        return sent, failed
+
+    # Metrics
+
+    @classmethod
+    def _metric_key(cls, channel: str, name: str) -> str:
+        return f"{cls.METRICS_KEY}:{channel}:{name}"
+
+    @classmethod
+    def _record(cls, channel: str, **counts):
+        """Add counts to the channel's metrics (latency_ms also updates the maximum)."""
+        try:
+            latency_ms = counts.pop('latency_ms', None)
+            if latency_ms is not None:
+                counts['latency_ms_total'] = latency_ms
+                key = cls._metric_key(channel, 'latency_ms_max')
+                # The maximum cannot be incremented; a racing writer can only lose a smaller value
+                if latency_ms > (cache.get(key) or 0):
+                    cache.set(key, latency_ms, None)
+            for name, value in counts.items():
+                key = cls._metric_key(channel, name)
+                cache.add(key, 0, None)
+                cache.incr(key, value)
+            cache.set(cls._metric_key(channel, 'updated_at'), timezone.now().isoformat(), None)
+        except Exception as e:
+            logger.warning(f"Failed to record notification metrics: {str(e)}")
+
+    @classmethod
+    def _metric_keys(cls) -> Dict[str, tuple]:
+        names = cls.COUNTERS + ('latency_ms_max', 'updated_at')
+        return {cls._metric_key(channel, name): (channel, name) for channel in cls.CHANNELS for name in names}
+
+    @classmethod
+    def metrics(cls) -> Dict[str, Dict]:
+        """Send counts and batch latencies per channel since the metrics were last reset."""
+        keys = cls._metric_keys()
+        metrics = {}
+        for key, value in cache.get_many(list(keys)).items():
+            channel, name = keys[key]
+            metrics.setdefault(channel, dict.fromkeys(cls.COUNTERS + ('latency_ms_max',), 0))[name] = value
+        for entry in metrics.values():
+            batches = entry.get('batches') or 0
+            entry['latency_ms_avg'] = round(entry['latency_ms_total'] / batches, 1) if batches else 0
+        return metrics
+
+    @classmethod
+    def reset_metrics(cls):
+        cache.delete_many(list(cls._metric_keys()))
@@ -0,0 +1,222 @@
+"""
+Transactional outbox.
+
+Side effects of a write (notifications, SMS/push/websocket sends, auto-save and
+sweeps) are recorded as OutboxEvent rows in the same database transaction as the
+write itself, so they exist exactly when the write commits. After the commit a
+relay run is kicked off on a worker; the relay claims due events in batches with
+``SELECT ... FOR UPDATE SKIP LOCKED`` on the ``(status, available_at)`` index,
+runs the registered handler of each event and records the outcome in bulk.
+Failed events are retried with exponential backoff up to MAX_ATTEMPTS.
+
+Delivery is at least once: handlers must tolerate being run again for the same
+event. Handlers registered with ``atomic=True`` (database-only side effects) are
+marked delivered in the same transaction as their work, so they run once.
+"""
+import logging
+import threading
+from datetime import timedelta
+from typing import Callable, Dict, List
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import OutboxEvent
+from .notification_dispatch_services import NotificationDispatcher
+from .task_queue import enqueue
+
+logger = logging.getLogger(__name__)
+
+# Set while this thread runs the relay; events enqueued by handlers are picked up by that run
+_relay_state = threading.local()
+
+
+class OutboxService:
+    """Record side effects as OutboxEvent rows and relay them to their handlers."""
+
+    DEFAULT_BATCH_SIZE = 100
+    MAX_ATTEMPTS = 8
+    BASE_BACKOFF = timedelta(seconds=30)
+    MAX_BACKOFF = timedelta(hours=1)
+    # Claims older than this are assumed to belong to a dead worker
+    CLAIM_TIMEOUT = timedelta(minutes=10)
+
+    _handlers: Dict[str, tuple] = {}
+
+    @classmethod
+    def handler(cls, event_type: str, atomic: bool = False) -> Callable:
+        """Decorator registering the function that delivers `event_type` events."""
+        def register(func):
+            cls._handlers[event_type] = (func, atomic)
+            return func
+        return register
+
+    @classmethod
+    def enqueue(cls, event_type: str, instance, payload: Dict = None) -> OutboxEvent:
+        """
+        Record an event about `instance` in the current transaction and relay it
+        once that transaction commits.
+        """
+        event = OutboxEvent.objects.create(
+            event_type=event_type,
+            aggregate_type=instance._meta.model_name,
+            aggregate_id=str(instance.pk),
+            payload=payload or {},
+        )
+        cls._kick_on_commit()
+        return event
+
+    @classmethod
+    def enqueue_many(cls, event_type: str, instances) -> List[OutboxEvent]:
+        """`enqueue` for many instances with one INSERT (for rows written with bulk_create)."""
+        events = OutboxEvent.objects.bulk_create([
+            OutboxEvent(
+                event_type=event_type,
+                aggregate_type=instance._meta.model_name,
+                aggregate_id=str(instance.pk),
+                payload={},
+            )
+            for instance in instances
+        ])
+        if events:
+            cls._kick_on_commit()
+        return events
+
+    @classmethod
+    def _kick_on_commit(cls):
+        # One relay kick per transaction, however many events it records
+        if not any(callback[1] == cls.kick for callback in connection.run_on_commit):
+            transaction.on_commit(cls.kick)
+
+    @classmethod
+    def kick(cls):
+        """Start a relay run on a worker (inline if the task cannot be queued)."""
+        if getattr(_relay_state, 'running', False):
+            return
+        from .tasks import relay_outbox_events
+        if enqueue(relay_outbox_events):
+            return
+        try:
+            cls.relay()
+        except Exception as e:
+            logger.error(f"Inline outbox relay failed: {str(e)}")
+
+    @classmethod
+    def backoff(cls, attempts: int) -> timedelta:
+        """Delay before retrying an event that has failed `attempts` times."""
+        return min(cls.BASE_BACKOFF * (2 ** max(attempts - 1, 0)), cls.MAX_BACKOFF)
+
+    @classmethod
+    def release_stale_claims(cls, now=None) -> int:
+        """Return events stuck in processing (dead worker) to the queue."""
+        now = now or timezone.now()
+        released = OutboxEvent.objects.filter(
+            status=OutboxEvent.STATUS_PROCESSING,
+            updated_at__lt=now - cls.CLAIM_TIMEOUT,
+        ).update(status=OutboxEvent.STATUS_PENDING, updated_at=now)
+        if released:
+            logger.warning(f"Released {released} stale outbox claims")
+        return released
+
+    @classmethod
+    def claim_batch(cls, batch_size: int, now=None) -> List[OutboxEvent]:
+        """Claim up to `batch_size` events due at `now`, oldest first."""
+        now = now or timezone.now()
+        with transaction.atomic():
+            due = OutboxEvent.objects.filter(
+                status=OutboxEvent.STATUS_PENDING,
+                available_at__lte=now,
+            ).order_by('available_at')
+            if connection.features.has_select_for_update_skip_locked:
+                due = due.select_for_update(skip_locked=True)
+            ids = list(due.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return []
+            # The status guard keeps the claim exclusive on backends without SKIP LOCKED
+            OutboxEvent.objects.filter(
+                id__in=ids, status=OutboxEvent.STATUS_PENDING
+            ).update(status=OutboxEvent.STATUS_PROCESSING, updated_at=now)
+        return list(
+            OutboxEvent.objects.filter(id__in=ids, status=OutboxEvent.STATUS_PROCESSING).order_by('created_at')
+        )
+
+    @classmethod
+    def _mark_delivered(cls, event: OutboxEvent, now):
+        event.status = OutboxEvent.STATUS_DELIVERED
+        event.attempts += 1
+        event.delivered_at = now
+        event.last_error = ''
+        event.updated_at = now
+
+    @classmethod
+    def _mark_failed(cls, event: OutboxEvent, error: str, now):
+        event.attempts += 1
+        event.last_error = error[:2000]
+        event.updated_at = now
+        if event.attempts >= cls.MAX_ATTEMPTS:
+            event.status = OutboxEvent.STATUS_FAILED
+            logger.error(f"Outbox event {event.id} ({event.event_type}) gave up after {event.attempts} attempts: {error}")
+        else:
+            event.status = OutboxEvent.STATUS_PENDING
+            event.available_at = now + cls.backoff(event.attempts)
+
+    @classmethod
+    def deliver_batch(cls, events: List[OutboxEvent]) -> Dict[str, int]:
+        """Run the handlers of claimed events and record the outcomes."""
+        fields = ['status', 'attempts', 'available_at', 'last_error', 'delivered_at', 'updated_at']
+        pending_updates = []
+        delivered = failed = 0
+        for event in events:
+            registered = cls._handlers.get(event.event_type)
+            if registered is None:
+                cls._mark_failed(event, f"No handler registered for {event.event_type}", timezone.now())
+                event.status = OutboxEvent.STATUS_FAILED  # retrying cannot help
+                pending_updates.append(event)
+                failed += 1
+                continue
+
+            func, atomic = registered
+            try:
+                if atomic:
+                    with transaction.atomic():
+                        func(event)
+                        cls._mark_delivered(event, timezone.now())
+                        OutboxEvent.objects.bulk_update([event], fields)
+                else:
+                    func(event)
+                    cls._mark_delivered(event, timezone.now())
+                    pending_updates.append(event)
+                delivered += 1
+            except Exception as e:
+                logger.warning(f"Outbox event {event.id} ({event.event_type}) failed: {str(e)}")
+                cls._mark_failed(event, f"{type(e).__name__}: {str(e)}", timezone.now())
+                pending_updates.append(event)
+                failed += 1
+
+        if pending_updates:
+            OutboxEvent.objects.bulk_update(pending_updates, fields, batch_size=500)
+        return {'delivered': delivered, 'failed': failed}
+
+    @classmethod
+    def relay(cls, batch_size: int = None, max_batches: int = None) -> Dict[str, int]:
+        """Deliver due events batch by batch until none are left (or `max_batches` ran)."""
+        batch_size = batch_size or getattr(settings, 'OUTBOX_RELAY_BATCH_SIZE', cls.DEFAULT_BATCH_SIZE)
+        cls.release_stale_claims()
+
+        summary = {'delivered': 0, 'failed': 0, 'batches': 0}
+        _relay_state.running = True
+        try:
+            while max_batches is None or summary['batches'] < max_batches:
+                # Retried events are pushed past `now` by their backoff, so the loop ends
+                events = cls.claim_batch(batch_size)
+                if not events:
+                    break
+                summary['batches'] += 1
+                # Notifications sent by the handlers go out together when the batch is done
+                with NotificationDispatcher.batch():
+                    result = cls.deliver_batch(events)
+                summary['delivered'] += result['delivered']
+                summary['failed'] += result['failed']
+        finally:
+            _relay_state.running = False
+        return summary
@@ -0,0 +1,119 @@
+"""
+Keyset (cursor) pagination for append-mostly histories.
+
+Pages are fetched with ``WHERE timestamp <= ts AND (timestamp, id) < (ts, id)``
+over an index on ``(wallet, timestamp, id)``, so every page costs the same no
+matter how deep the client has scrolled, and rows inserted meanwhile never shift
+a page.
+"""
+import base64
+import json
+from collections import OrderedDict
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Newest-first keyset pagination on (timestamp_field, id).
+
+    Opt-in per request: without `cursor` or `page_size` in the query string the
+    view returns its unpaginated response, so existing clients keep working.
+    """
+    timestamp_field = 'timestamp'
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.request = None
+        self.page_size_used = self.page_size
+        self.next_cursor = None
+
+    def is_requested(self, request) -> bool:
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, obj) -> str:
+        value = getattr(obj, self.timestamp_field)
+        payload = json.dumps({'ts': value.isoformat(), 'id': str(obj.pk)})
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor: str):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            timestamp = parse_datetime(payload['ts'])
+            if timestamp is None:
+                raise ValueError
+            return timestamp, payload['id']
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+        self.request = request
+        self.page_size_used = self.get_page_size(request)
+
+        # Keyset pages are always newest first; other orderings cannot be resumed from a cursor
+        queryset = queryset.order_by(f'-{self.timestamp_field}', '-pk')
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            timestamp, pk = self.decode_cursor(cursor)
+            try:
+                pk = queryset.model._meta.pk.to_python(pk)
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+            # The leading bound lets an index scan on (timestamp, id) start at the cursor
+            queryset = queryset.filter(
+                Q(**{f'{self.timestamp_field}__lt': timestamp})
+                | Q(**{self.timestamp_field: timestamp, 'pk__lt': pk}),
+                **{f'{self.timestamp_field}__lte': timestamp},
+            )
+
+        rows = list(queryset[:self.page_size_used + 1])
+        has_next = len(rows) > self.page_size_used
+        rows = rows[:self.page_size_used]
+        self.next_cursor = self.encode_cursor(rows[-1]) if has_next else None
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri() if self.request else ''
+        url = replace_query_param(url, self.page_size_query_param, self.page_size_used)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('next_cursor', self.next_cursor),
+            ('page_size', self.page_size_used),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'page_size': {'type': 'integer'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,180 @@
+"""
+Daily transaction rollups.
+
+DailyTransactionRollup holds one row per day, wallet and channel. A (day, wallet)
+slice is always recomputed as a whole from Transaction and BankTransfer with
+grouped queries and swapped in atomically, so refreshes are idempotent.
+
+The periodic job is incremental: a RollupWatermark records how far it has
+read, each run recomputes only the (day, wallet) slices touched by rows
+created or updated since then (minus WATERMARK_LAG, to pick up transactions
+that committed late), including transactions whose status changed, and a
+nightly refresh_recent() repairs anything changed by bulk updates that skip
+``updated_at``. Both run from the APScheduler started in bank/apps.py (or the
+Celery beat entries when a broker is configured).
+"""
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, Optional
+from django.db import transaction
+from django.db.models import Count, F, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import BankTransfer, DailyTransactionRollup, RollupWatermark, Transaction
+
+logger = logging.getLogger(__name__)
+
+
+class TransactionRollupService:
+    """Build, refresh and read DailyTransactionRollup rows."""
+
+    WATERMARK_NAME = 'daily_transaction_rollup'
+    WATERMARK_LAG = timedelta(minutes=5)
+    TRANSFER_CHANNEL = 'transfer'
+
+    @classmethod
+    def _build_rows(cls, start: date, end: date, wallet_ids: Optional[Iterable] = None):
+        """Rollup rows for the days start..end, optionally only for some wallets."""
+        txs = Transaction.objects.filter(timestamp__date__gte=start, timestamp__date__lte=end)
+        transfers = BankTransfer.objects.filter(created_at__date__gte=start, created_at__date__lte=end)
+        if wallet_ids is not None:
+            wallet_ids = list(wallet_ids)
+            txs = txs.filter(wallet_id__in=wallet_ids)
+            transfers = transfers.filter(user__wallet__in=wallet_ids)
+
+        rows = {}
+
+        def row_for(day, wallet_id, channel):
+            key = (day, wallet_id, channel)
+            if key not in rows:
+                rows[key] = DailyTransactionRollup(day=day, wallet_id=wallet_id, channel=channel)
+            return rows[key]
+
+        tx_groups = (
+            txs.annotate(day=TruncDate('timestamp'))
+            .values('day', 'wallet_id', 'channel')
+            .annotate(
+                tx_count=Count('id'),
+                credit_total=Sum('amount', filter=Q(type='credit', status='success')),
+                debit_total=Sum('amount', filter=Q(type='debit', status='success')),
+                reversal_count=Count('id', filter=Q(parent__isnull=False)),
+            )
+            .order_by()
+        )
+        for group in tx_groups.iterator():
+            row = row_for(group['day'], group['wallet_id'], group['channel'])
+            row.tx_count = group['tx_count']
+            row.credit_total = group['credit_total'] or Decimal('0')
+            row.debit_total = group['debit_total'] or Decimal('0')
+            row.reversal_count = group['reversal_count']
+
+        transfer_groups = (
+            transfers.filter(user__wallet__isnull=False)
+            .annotate(day=TruncDate('created_at'))
+            .values('day', 'user__wallet')
+            .annotate(
+                fee_total=Sum(F('fee') + F('vat') + F('levy'), filter=Q(status='completed')),
+                failure_count=Count('id', filter=Q(status='failed')),
+            )
+            .order_by()
+        )
+        for group in transfer_groups.iterator():
+            if not group['fee_total'] and not group['failure_count']:
+                continue
+            row = row_for(group['day'], group['user__wallet'], cls.TRANSFER_CHANNEL)
+            row.fee_total = group['fee_total'] or Decimal('0')
+            row.failure_count = group['failure_count']
+
+        return list(rows.values())
+
+    @classmethod
+    def refresh_days(cls, start: date, end: Optional[date] = None, wallet_ids: Optional[Iterable] = None) -> Dict[str, int]:
+        """Recompute the rollups of every day from `start` to `end` (inclusive, default today)."""
+        end = end or timezone.localdate()
+        if wallet_ids is not None:
+            wallet_ids = list(wallet_ids)
+        rows = cls._build_rows(start, end, wallet_ids)
+        with transaction.atomic():
+            stale = DailyTransactionRollup.objects.filter(day__gte=start, day__lte=end)
+            if wallet_ids is not None:
+                stale = stale.filter(wallet_id__in=wallet_ids)
+            stale.delete()
+            DailyTransactionRollup.objects.bulk_create(rows, batch_size=1000)
+        logger.info(f"Refreshed transaction rollups {start} to {end}: {len(rows)} rows")
+        return {'rows': len(rows), 'days': (end - start).days + 1}
+
+    @classmethod
+    def refresh_recent(cls, days: int = 2) -> Dict[str, int]:
+        """Recompute today and the previous `days - 1` days (late status changes land here)."""
+        today = timezone.localdate()
+        return cls.refresh_days(today - timedelta(days=max(days, 1) - 1), today)
+
+    @classmethod
+    def _touched_slices(cls, since) -> Dict[date, set]:
+        """(day -> wallet ids) changed since `since`: created/updated transactions and transfers."""
+        touched = defaultdict(set)
+        changed_txs = (
+            Transaction.objects.filter(updated_at__gt=since)
+            .annotate(day=TruncDate('timestamp'))
+            .values_list('day', 'wallet_id')
+            .distinct()
+        )
+        for day, wallet_id in changed_txs.iterator():
+            touched[day].add(wallet_id)
+        changed_transfers = (
+            BankTransfer.objects.filter(updated_at__gt=since, user__wallet__isnull=False)
+            .annotate(day=TruncDate('created_at'))
+            .values_list('day', 'user__wallet')
+            .distinct()
+        )
+        for day, wallet_id in changed_transfers.iterator():
+            touched[day].add(wallet_id)
+        return touched
+
+    @classmethod
+    def run_incremental(cls) -> Dict[str, int]:
+        """
+        Fold everything that changed since the watermark into the rollups.
+        Runs are serialized on the watermark row; the first run backfills all history.
+        """
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.get_or_create(name=cls.WATERMARK_NAME)
+            watermark = RollupWatermark.objects.select_for_update().get(pk=watermark.pk)
+            run_started = timezone.now()
+
+            if watermark.position is None:
+                first_day = Transaction.objects.aggregate(first=Min('timestamp'))['first']
+                result = cls.refresh_days(timezone.localdate(first_day) if first_day else timezone.localdate())
+                rows, slices = result['rows'], result['days']
+            else:
+                rows = slices = 0
+                for day, wallet_ids in sorted(cls._touched_slices(watermark.position - cls.WATERMARK_LAG).items()):
+                    rows += cls.refresh_days(day, day, wallet_ids)['rows']
+                    slices += len(wallet_ids)
+
+            watermark.position = run_started
+            watermark.last_run_rows = rows
+            watermark.save(update_fields=['position', 'last_run_rows', 'updated_at'])
+        return {'rows': rows, 'slices': slices}
+
+    @staticmethod
+    def daily_series(start: date, end: Optional[date] = None, **filters):
+        """Per-day totals across wallets/channels, read from the rollups."""
+        queryset = DailyTransactionRollup.objects.filter(day__gte=start, **filters)
+        if end is not None:
+            queryset = queryset.filter(day__lte=end)
+        return (
+            queryset.values('day')
+            .annotate(
+                tx_count=Sum('tx_count'),
+                credit_total=Sum('credit_total'),
+                debit_total=Sum('debit_total'),
+                reversal_count=Sum('reversal_count'),
+                fee_total=Sum('fee_total'),
+                failure_count=Sum('failure_count'),
+            )
+            .order_by('day')
+        )
@@ -0,0 +1,257 @@
+"""
+Scheduled transfer dispatcher.
+
+Due schedules are claimed in batches with ``SELECT ... FOR UPDATE SKIP LOCKED``
+(on the ``(is_active, status, next_execution)`` index) and flipped to
+``processing`` in the same transaction, so overlapping dispatcher runs and
+workers never pick up the same schedule. Claimed batches are executed inline or
+fanned out to Celery workers, and each batch advances ``next_execution`` with a
+single bulk update. Claims left behind by a crashed worker are released after
+CLAIM_TIMEOUT; the per-occurrence idempotency key on the created BankTransfer,
+together with the debit rows linked to it, keeps a released occurrence from
+being paid twice. A failed occurrence is retried on later runs until its
+transfer has used up its retries (or tripped its circuit breaker); the transfer
+is then marked failed and the schedule moves on to its next occurrence.
+"""
+import logging
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .constants import TransferStatus
+from .models import BankTransfer, GeneralStatusChoices, ScheduledTransfer, Transaction
+from .task_queue import enqueue
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledTransferDispatcher:
+    """Claim, execute and reschedule due ScheduledTransfer rows in batches."""
+
+    DEFAULT_BATCH_SIZE = 200
+    # Claims older than this are assumed to belong to a dead worker
+    CLAIM_TIMEOUT = timedelta(minutes=30)
+
+    FREQUENCY_STEPS = {
+        'daily': timedelta(days=1),
+        'weekly': timedelta(weeks=1),
+        # Simple monthly/yearly steps, as used since scheduled transfers were introduced
+        'monthly': timedelta(days=30),
+        'yearly': timedelta(days=365),
+    }
+
+    @classmethod
+    def next_schedule(cls, scheduled_transfer: ScheduledTransfer) -> Optional[Tuple]:
+        """
+        (next_execution, is_active, status) after the current occurrence has run,
+        or None for an unknown frequency (the schedule is left unchanged).
+        """
+        current_next = scheduled_transfer.next_execution
+        if scheduled_transfer.frequency == 'once':
+            return current_next, False, TransferStatus.COMPLETED
+        step = cls.FREQUENCY_STEPS.get(scheduled_transfer.frequency)
+        if step is None:
+            return None
+        next_execution = current_next + step
+        if scheduled_transfer.end_date and next_execution > scheduled_transfer.end_date:
+            return current_next, False, TransferStatus.COMPLETED
+        return next_execution, True, TransferStatus.PENDING
+
+    @staticmethod
+    def occurrence_key(scheduled_transfer: ScheduledTransfer) -> str:
+        """Idempotency key of the BankTransfer for the schedule's current occurrence."""
+        return f"sched-{scheduled_transfer.id.hex}-{int(scheduled_transfer.next_execution.timestamp())}"
+
+    @classmethod
+    def release_stale_claims(cls, now=None) -> int:
+        """Return schedules stuck in processing (dead worker) to the due queue."""
+        now = now or timezone.now()
+        released = ScheduledTransfer.objects.filter(
+            is_active=True,
+            status=TransferStatus.PROCESSING,
+            updated_at__lt=now - cls.CLAIM_TIMEOUT,
+        ).update(status=TransferStatus.PENDING, updated_at=now)
+        if released:
+            logger.warning(f"Released {released} stale scheduled transfer claims")
+        return released
+
+    @classmethod
+    def claim_batch(cls, batch_size: int, now=None) -> List:
+        """
+        Claim up to `batch_size` schedules due at `now` and return their ids.
+        Schedules touched after `now` (e.g. released by a failed attempt in this run)
+        are left for the next run.
+        """
+        now = now or timezone.now()
+        with transaction.atomic():
+            due = ScheduledTransfer.objects.filter(
+                is_active=True,
+                status=TransferStatus.PENDING,
+                next_execution__lte=now,
+                updated_at__lte=now,
+            ).order_by('next_execution')
+            if connection.features.has_select_for_update_skip_locked:
+                due = due.select_for_update(skip_locked=True)
+            ids = list(due.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return []
+            # The status guard keeps the claim exclusive on backends without SKIP LOCKED
+            ScheduledTransfer.objects.filter(
+                id__in=ids, status=TransferStatus.PENDING
+            ).update(status=TransferStatus.PROCESSING, updated_at=now)
+        return ids
+
+    @classmethod
+    def _run_occurrence(cls, scheduled_transfer: ScheduledTransfer) -> Dict:
+        """Create (or resume) the BankTransfer for the current occurrence and process it."""
+        from .transfer_services import TransferProcessingService
+
+        key = cls.occurrence_key(scheduled_transfer)
+        transfer = BankTransfer.objects.filter(idempotency_key=key).first()
+        if transfer is None:
+            transfer = BankTransfer.objects.create(
+                user=scheduled_transfer.user,
+                bank_name=scheduled_transfer.recipient_bank_code,  # You might want to get actual bank name
+                bank_code=scheduled_transfer.recipient_bank_code,
+                account_number=scheduled_transfer.recipient_account,
+                amount=scheduled_transfer.amount,
+                description=scheduled_transfer.description,
+                transfer_type=scheduled_transfer.transfer_type,
+                status='pending',
+                is_scheduled=True,
+                scheduled_at=scheduled_transfer.next_execution,
+                idempotency_key=key,
+            )
+            # The post_save handler may already have paid an internal transfer
+            transfer.refresh_from_db()
+        if cls._already_paid(transfer):
+            return {'success': True}
+        if not cls._gave_up(transfer):
+            result = TransferProcessingService.process_transfer(transfer)
+            if result['success'] or not cls._gave_up(transfer):
+                return result
+        # Retrying this occurrence cannot succeed any more
+        if transfer.status != TransferStatus.FAILED:
+            transfer.mark_as_failed(transfer.failure_reason or 'Maximum retry attempts exceeded')
+        return {'success': False, 'terminal': True, 'error': transfer.failure_reason}
+
+    @staticmethod
+    def _gave_up(transfer: BankTransfer) -> bool:
+        """Whether process_transfer will refuse the transfer from now on."""
+        return transfer.circuit_breaker_tripped or transfer.retry_count >= transfer.max_retries
+
+    @staticmethod
+    def _already_paid(transfer: BankTransfer) -> bool:
+        """
+        Whether the occurrence's transfer has been debited. Status alone is not enough:
+        external transfers are moved to processing before any money moves, so anything
+        short of completed/successful is decided by the debit rows linked to the transfer.
+        """
+        if transfer.status in (TransferStatus.COMPLETED, GeneralStatusChoices.SUCCESSFUL):
+            return True
+        return Transaction.objects.filter(
+            content_type=ContentType.objects.get_for_model(BankTransfer),
+            object_id=str(transfer.id),
+            type='debit',
+        ).exists()
+
+    @classmethod
+    def execute_batch(cls, scheduled_ids: List) -> Dict:
+        """
+        Execute a claimed batch. Successful schedules are advanced and failed ones
+        are returned to pending (due again on the next run), both in bulk. Occurrences
+        that failed for good are skipped: the schedule advances, or is deactivated as
+        failed when there is no next occurrence.
+        """
+        schedules = list(
+            ScheduledTransfer.objects.filter(id__in=scheduled_ids, status=TransferStatus.PROCESSING)
+            .select_related('user')
+        )
+        advanced, released, given_up = [], [], []
+        processed_count = failed_count = 0
+        for scheduled_transfer in schedules:
+            try:
+                result = cls._run_occurrence(scheduled_transfer)
+            except Exception as e:
+                logger.error(f"Error processing scheduled transfer {scheduled_transfer.id}: {str(e)}")
+                result = {'success': False, 'error': str(e)}
+
+            if result['success']:
+                processed_count += 1
+                advanced.append(scheduled_transfer)
+            elif result.get('terminal'):
+                failed_count += 1
+                given_up.append(scheduled_transfer)
+                logger.error(
+                    f"Scheduled transfer {scheduled_transfer.id} occurrence at "
+                    f"{scheduled_transfer.next_execution} failed for good: {result.get('error')}"
+                )
+            else:
+                failed_count += 1
+                released.append(scheduled_transfer)
+                logger.error(f"Scheduled transfer failed: {result.get('error')}")
+
+        now = timezone.now()
+        updates = []
+        for scheduled_transfer in advanced:
+            schedule = cls.next_schedule(scheduled_transfer)
+            if schedule is None:
+                released.append(scheduled_transfer)
+                continue
+            (scheduled_transfer.next_execution,
+             scheduled_transfer.is_active,
+             scheduled_transfer.status) = schedule
+            scheduled_transfer.updated_at = now
+            updates.append(scheduled_transfer)
+        for scheduled_transfer in given_up:
+            schedule = cls.next_schedule(scheduled_transfer)
+            if schedule is None or not schedule[1]:
+                schedule = (scheduled_transfer.next_execution, False, TransferStatus.FAILED)
+            (scheduled_transfer.next_execution,
+             scheduled_transfer.is_active,
+             scheduled_transfer.status) = schedule
+            scheduled_transfer.updated_at = now
+            updates.append(scheduled_transfer)
+        for scheduled_transfer in released:
+            scheduled_transfer.status = TransferStatus.PENDING
+            scheduled_transfer.updated_at = now
+            updates.append(scheduled_transfer)
+        if updates:
+            ScheduledTransfer.objects.bulk_update(
+                updates, ['next_execution', 'is_active', 'status', 'updated_at'], batch_size=500
+            )
+
+        return {
+            'processed_count': processed_count,
+            'failed_count': failed_count,
+            'total_due': len(schedules),
+        }
+
+    @classmethod
+    def dispatch(cls, batch_size: int = None, max_batches: int = None, concurrent: bool = False) -> Dict:
+        """
+        Drain due schedules batch by batch. With `concurrent`, claimed batches are
+        handed to Celery workers instead of being executed in this process.
+        """
+        batch_size = batch_size or getattr(settings, 'SCHEDULED_TRANSFER_BATCH_SIZE', cls.DEFAULT_BATCH_SIZE)
+        now = timezone.now()
+        cls.release_stale_claims(now)
+
+        summary = {'processed_count': 0, 'failed_count': 0, 'total_due': 0, 'batches': 0}
+        while max_batches is None or summary['batches'] < max_batches:
+            ids = cls.claim_batch(batch_size, now=now)
+            if not ids:
+                break
+            summary['batches'] += 1
+            summary['total_due'] += len(ids)
+            if concurrent:
+                from .tasks import execute_scheduled_transfer_batch
+                if enqueue(execute_scheduled_transfer_batch, [str(pk) for pk in ids]):
+                    continue
+            result = cls.execute_batch(ids)
+            summary['processed_count'] += result['processed_count']
+            summary['failed_count'] += result['failed_count']
+        return summary
@@ -12,7 +12,7 @@ from django.utils import timezone
 from django.conf import settings
 from django.core.cache import cache
 from django.db import transaction
-from django.db.models import Q, Count, Sum
+from django.db.models import Q, Sum
 from .models import (
     TwoFactorAuthentication, IPWhitelist, DeviceFingerprint, 
     FraudDetection, SecurityAlert, TransferLimit, BankTransfer,
@@ -22,6 +22,8 @@ from .constants import (
     SecurityLevel, FraudFlag, TransferLimits, ResponseCodes,
     DeviceFingerprint as DeviceFingerprintEnum
 )
+from .velocity_services import VelocityCounterService
+from .transfer_stats_services import TransferStatsService
 
 logger = logging.getLogger(__name__)
 
@@ -244,27 +246,13 @@ class FraudDetectionService:
     
     @staticmethod
     def _check_velocity(user: User, amount) -> Dict:
-        """Check transfer velocity (frequency and amount)."""
+        """Check transfer velocity (frequency and amount) from the rolling-window counters."""
         try:
-            now = timezone.now()
-            hour_ago = now - timedelta(hours=1)
-            day_ago = now - timedelta(days=1)
-            
             # Check hourly velocity
-            hourly_transfers = BankTransfer.objects.filter(
-                user=user,
-                created_at__gte=hour_ago
-            )
-            hourly_count = hourly_transfers.count()
-            hourly_amount = hourly_transfers.aggregate(total=Sum('amount'))['total'] or 0
+            hourly_count, hourly_amount = VelocityCounterService.get_user_window(user.id, 'hour')
             
             # Check daily velocity
-            daily_transfers = BankTransfer.objects.filter(
-                user=user,
-                created_at__gte=day_ago
-            )
-            daily_count = daily_transfers.count()
-            daily_amount = daily_transfers.aggregate(total=Sum('amount'))['total'] or 0
+            daily_count, daily_amount = VelocityCounterService.get_user_window(user.id, 'day')
             
             flags = []
             score = 0
@@ -274,7 +262,7 @@ class FraudDetectionService:
                 flags.append('high_hourly_frequency')
                 score += 20
             
-            if hourly_amount.amount > TransferLimits.MAX_AMOUNT_PER_HOUR:
+            if hourly_amount > TransferLimits.MAX_AMOUNT_PER_HOUR:
                 flags.append('high_hourly_amount')
                 score += 25
             
@@ -283,7 +271,7 @@ class FraudDetectionService:
                 flags.append('high_daily_frequency')
                 score += 15
             
-            if daily_amount.amount > TransferLimits.MAX_AMOUNT_PER_DAY:
+            if daily_amount > TransferLimits.MAX_AMOUNT_PER_DAY:
                 flags.append('high_daily_amount')
                 score += 20
             
@@ -301,10 +289,7 @@ class FraudDetectionService:
             score = 0
             
             # Check if amount is unusually high for this user
-            user_avg = BankTransfer.objects.filter(
-                user=transfer.user,
-                status='completed'
-            ).aggregate(avg=Sum('amount') / Count('id'))['avg'] or 0
+            user_avg = Decimal(str(TransferStatsService.get_mean_amount(transfer.user_id)))
             
             if user_avg > 0 and transfer.amount.amount > user_avg * 5:
                 flags.append('unusually_high_amount')
@@ -329,22 +314,18 @@ class FraudDetectionService:
             score = 0
             
             # Check if this is a new recipient
-            previous_transfers = BankTransfer.objects.filter(
-                user=transfer.user,
-                account_number=transfer.account_number,
-                status='completed'
-            ).count()
+            previous_transfers = VelocityCounterService.get_recipient_completed_count(
+                transfer.user_id, transfer.account_number
+            )
             
             if previous_transfers == 0:
                 flags.append('new_recipient')
                 score += 10
             
             # Check for multiple transfers to same recipient in short time
-            recent_transfers = BankTransfer.objects.filter(
-                user=transfer.user,
-                account_number=transfer.account_number,
-                created_at__gte=timezone.now() - timedelta(hours=1)
-            ).count()
+            recent_transfers = VelocityCounterService.get_recipient_hourly_count(
+                transfer.user_id, transfer.account_number
+            )
             
             if recent_transfers > 3:
                 flags.append('multiple_transfers_to_same_recipient')
@@ -912,3 +893,208 @@ class NightGuardService:
         except Exception as e:
             logger.error(f"Error verifying Night Guard face: {str(e)}")
             return False
+
+
+class TransferGuardPipeline:
+    """Evaluate Night Guard, Large Transaction Shield and Location Guard in a single pass.
+
+    All three settings rows are loaded with the user in one query and the shield's
+    day/month totals in one aggregate. The outcome is kept on the transfer instance
+    so later callers in the same flow (signal, processing service) reuse it instead
+    of re-running the guards. It is only written to the database, under
+    ``transfer.metadata['guard_evaluation']``, when a guard is required; a transfer
+    that no guard applies to costs no extra UPDATE.
+    """
+
+    METADATA_KEY = 'guard_evaluation'
+    PASSED_STATUSES = {'face_passed', 'fallback_passed'}
+    # (result key, metadata status key, display name) in enforcement order
+    GUARDS = (
+        ('night_guard', 'night_guard_status', 'Night Guard'),
+        ('large_tx_shield', 'large_tx_shield_status', 'Large Transaction Shield'),
+        ('location_guard', 'location_guard_status', 'Location Guard'),
+    )
+
+    @staticmethod
+    def _fingerprint(transfer: BankTransfer) -> dict:
+        """Inputs that invalidate a stored evaluation when they change."""
+        return {
+            'amount': f"{Decimal(str(transfer.amount.amount if hasattr(transfer.amount, 'amount') else transfer.amount)):.4f}",
+            'ip_address': transfer.ip_address or '',
+            'device_fingerprint': transfer.device_fingerprint or '',
+            'state': ((transfer.location_data or {}).get('state') or '').strip().lower(),
+        }
+
+    @classmethod
+    def evaluate(cls, transfer: BankTransfer, refresh: bool = False) -> dict:
+        """Return {'night_guard': {...}, 'large_tx_shield': {...}, 'location_guard': {...}}.
+
+        Each entry has the same shape as the individual guard services' results.
+        """
+        metadata = transfer.metadata or {}
+        fingerprint = cls._fingerprint(transfer)
+        # The in-memory copy survives refresh_from_db(), which reloads metadata
+        stored = getattr(transfer, '_guard_evaluation', None) or metadata.get(cls.METADATA_KEY)
+        if not refresh and stored and stored.get('inputs') == fingerprint:
+            return stored['results']
+
+        not_required = {'required': False}
+        results = {key: dict(not_required) for key, _, _ in cls.GUARDS}
+        try:
+            if NightGuardService._is_app_initiated(transfer):
+                results = cls._evaluate_guards(transfer, metadata)
+        except Exception as e:
+            logger.error(f"Error evaluating transfer guards for {transfer.id}: {str(e)}")
+            results = {key: {'required': False, 'error': str(e)} for key, _, _ in cls.GUARDS}
+
+        evaluation = {
+            'inputs': fingerprint,
+            'results': results,
+            'evaluated_at': timezone.now().isoformat(),
+        }
+        transfer._guard_evaluation = evaluation
+        if not any(result.get('required') for result in results.values()):
+            return results
+
+        # A required guard has to survive into the verification requests
+        metadata[cls.METADATA_KEY] = evaluation
+        transfer.metadata = metadata
+        transfer.requires_2fa = True
+        try:
+            transfer.save(update_fields=['requires_2fa', 'metadata', 'updated_at'])
+        except Exception as e:
+            logger.error(f"Error storing guard evaluation for transfer {transfer.id}: {str(e)}")
+        return results
+
+    @classmethod
+    def pending_guard(cls, transfer: BankTransfer, results: dict) -> Optional[Tuple[str, str, str]]:
+        """First required guard whose verification has not passed, as (key, status, name); None if clear."""
+        metadata = transfer.metadata or {}
+        for key, status_key, name in cls.GUARDS:
+            if results.get(key, {}).get('required'):
+                status = metadata.get(status_key)
+                if status not in cls.PASSED_STATUSES:
+                    return key, status, name
+        return None
+
+    @staticmethod
+    def _related_or_none(user, attr):
+        try:
+            return getattr(user, attr)
+        except Exception:
+            return None
+
+    @classmethod
+    def _evaluate_guards(cls, transfer: BankTransfer, metadata: dict) -> dict:
+        user = User.objects.select_related(
+            'night_guard_settings', 'large_tx_shield_settings', 'location_guard_settings'
+        ).get(pk=transfer.user_id)
+        night_settings = cls._related_or_none(user, 'night_guard_settings')
+        shield_settings = cls._related_or_none(user, 'large_tx_shield_settings')
+        location_settings = cls._related_or_none(user, 'location_guard_settings')
+
+        return {
+            'night_guard': cls._night_guard(night_settings, metadata),
+            'large_tx_shield': cls._large_tx_shield(transfer, shield_settings, metadata),
+            'location_guard': cls._location_guard(transfer, location_settings, metadata),
+        }
+
+    @staticmethod
+    def _night_guard(settings_obj, metadata: dict) -> dict:
+        if not settings_obj or not settings_obj.enabled:
+            return {'required': False}
+        now_time = timezone.now().time()
+        if not NightGuardService._within_window(settings_obj.start_time, settings_obj.end_time, now_time):
+            return {'required': False}
+
+        metadata.update({
+            'night_guard_required': True,
+            'night_guard_status': metadata.get('night_guard_status', 'pending'),
+            'night_guard_primary': settings_obj.primary_method,
+            'night_guard_fallback': settings_obj.fallback_method,
+            'night_guard_window': {
+                'start_time': settings_obj.start_time.isoformat() if settings_obj.start_time else None,
+                'end_time': settings_obj.end_time.isoformat() if settings_obj.end_time else None,
+            },
+            'night_guard_face_enrolled': bool(settings_obj.face_template_hash),
+        })
+        return {
+            'required': True,
+            'primary': settings_obj.primary_method,
+            'fallback': settings_obj.fallback_method,
+        }
+
+    @staticmethod
+    def _as_float(value) -> float:
+        try:
+            return float(value.amount) if hasattr(value, 'amount') else float(value or 0)
+        except Exception:
+            return 0.0
+
+    @classmethod
+    def _large_tx_shield(cls, transfer: BankTransfer, settings_obj, metadata: dict) -> dict:
+        if not settings_obj or not settings_obj.enabled:
+            return {'required': False}
+
+        amount_value = cls._as_float(transfer.amount)
+        exceeded = (
+            settings_obj.per_transaction_limit is not None
+            and amount_value > float(settings_obj.per_transaction_limit)
+        )
+
+        if not exceeded and (settings_obj.daily_limit is not None or settings_obj.monthly_limit is not None):
+            now = timezone.now()
+            start_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            totals = BankTransfer.objects.filter(
+                user_id=transfer.user_id,
+                status='completed',
+                created_at__gte=start_month,
+            ).aggregate(
+                day_total=Sum('amount', filter=Q(created_at__date=now.date())),
+                month_total=Sum('amount'),
+            )
+            if settings_obj.daily_limit is not None:
+                day_total = cls._as_float(totals['day_total'])
+                exceeded = day_total + amount_value > float(settings_obj.daily_limit)
+            if not exceeded and settings_obj.monthly_limit is not None:
+                month_total = cls._as_float(totals['month_total'])
+                exceeded = month_total + amount_value > float(settings_obj.monthly_limit)
+
+        if not exceeded:
+            return {'required': False}
+
+        metadata.update({
+            'large_tx_shield_required': True,
+            'large_tx_shield_status': metadata.get('large_tx_shield_status', 'pending'),
+            'large_tx_face_enrolled': bool(settings_obj.face_template_hash),
+        })
+        return {'required': True}
+
+    @staticmethod
+    def _location_guard(transfer: BankTransfer, settings_obj, metadata: dict) -> dict:
+        location_data = transfer.location_data or {}
+        try:
+            ip_state = LocationGuardService._get_state_from_ip(transfer.ip_address)
+        except Exception:
+            ip_state = None
+
+        client_state = (location_data.get('state') or '').strip().lower()
+        mismatch = bool(ip_state and client_state and (ip_state != client_state))
+
+        out_of_allowed = False
+        if settings_obj and settings_obj.enabled and client_state:
+            allowed = [str(s).strip().lower() for s in (settings_obj.allowed_states or [])]
+            out_of_allowed = client_state not in allowed
+
+        if not out_of_allowed and not mismatch:
+            return {'required': False}
+
+        metadata.update({
+            'location_guard_required': True,
+            'location_guard_status': metadata.get('location_guard_status', 'pending'),
+            'location_guard_face_enrolled': bool(settings_obj.face_template_hash) if settings_obj else False,
+            'location_ip_state': ip_state,
+            'location_client_state': client_state,
+            'location_state_mismatch': mismatch,
+        })
+        return {'required': True}
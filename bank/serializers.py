@@ -25,6 +25,14 @@ class TransactionSerializer(serializers.ModelSerializer):
     amount = serializers.SerializerMethodField()
     balance_after = serializers.SerializerMethodField()
     
+    def __init__(self, *args, **kwargs):
+        # Optional projection, e.g. fields=['id', 'amount', 'timestamp'] (unknown names are ignored)
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+    
     class Meta:
         model = Transaction
         fields = [
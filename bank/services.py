@@ -6,12 +6,12 @@ import requests
 import os
 import secrets
 import uuid
-import statistics
 from typing import List, Dict, Optional
 from django.conf import settings
-from django.db import models
 from django.utils import timezone
-from .models import Bank, Wallet, BankTransfer
+from .models import Wallet, BankTransfer
+from .transfer_stats_services import TransferStatsService
+from .name_enquiry_services import NameEnquiryService
 
 logger = logging.getLogger(__name__)
 
@@ -35,27 +35,18 @@ class BankAccountService:
             return []
         
         try:
-            # In production, you would integrate with NIBSS API or individual bank APIs
-            # For now, we'll use a mock implementation
-            
-            # Get all available banks from database
-            banks = Bank.objects.all()
-            
-            matching_banks = []
-            
-            for bank in banks:
-                # Mock verification - in real scenario, call bank API
-                if BankAccountService._verify_account_with_bank(bank.code, account_number):
-                    matching_banks.append({
-                        'bank_code': bank.code,
-                        'bank_name': bank.name,
-                        'account_number': account_number,
-                        'account_name': BankAccountService._get_account_name(bank.code, account_number),
-                        'is_verified': True,
-                        'verification_method': 'api' if settings.DEBUG else 'nibss'
-                    })
-            
-            return matching_banks
+            # Name enquiry against every bank at once (cached per bank and account)
+            return [
+                {
+                    'bank_code': match['bank_code'],
+                    'bank_name': match['bank_name'],
+                    'account_number': account_number,
+                    'account_name': match['account_name'],
+                    'is_verified': True,
+                    'verification_method': 'api' if settings.DEBUG else 'nibss'
+                }
+                for match in NameEnquiryService.search_banks(account_number)
+            ]
             
         except Exception as e:
             logger.error(f"Error searching banks by account number: {str(e)}")
@@ -164,17 +155,20 @@ class BankAccountService:
             Dict: Verification result
         """
         try:
-            # This is where you would integrate with NIBSS API
-            # For now, return mock data
-            
-            # In production, you would:
-            # 1. Call NIBSS API with bank_code and account_number
-            # 2. Get real account holder name
-            # 3. Verify account exists
+            result = NameEnquiryService.lookup(bank_code, account_number)
+            if result.get('error'):
+                raise RuntimeError(result['error'])
+            
+            if not result['found'] and not NameEnquiryService.rejects_unknown_accounts():
+                # The offline stub cannot say an account does not exist; keep accepting it
+                result = {
+                    'found': True,
+                    'account_name': BankAccountService._get_account_name(bank_code, account_number),
+                }
             
             return {
-                'is_valid': True,
-                'account_name': BankAccountService._get_account_name(bank_code, account_number),
+                'is_valid': result['found'],
+                'account_name': result['account_name'],
                 'bank_code': bank_code,
                 'account_number': account_number,
                 'verification_method': 'nibss'
@@ -197,14 +191,15 @@ class BankAccountService:
             List[Dict]: List of all banks
         """
         try:
-            banks = Bank.objects.all().order_by('name')
+            from .bank_directory_services import BankDirectory
+
             return [
                 {
-                    'bank_code': bank.code,
-                    'bank_name': bank.name,
-                    'is_active': bank.is_active
+                    'bank_code': bank['code'],
+                    'bank_name': bank['name'],
+                    'is_active': bank['is_active']
                 }
-                for bank in banks
+                for bank in BankDirectory.snapshot().banks
             ]
         except Exception as e:
             logger.error(f"Error getting all banks: {str(e)}")
@@ -260,18 +255,14 @@ class FraudDetectionService:
                 })
                 risk_score += 30
             
-            # 2. Amount Pattern Analysis
-            user_transactions = BankTransfer.objects.filter(
-                user=user,
-                status='completed',
-                created_at__gte=timezone.now() - timezone.timedelta(minutes=FraudDetectionService.LONG_WINDOW)
-            ).values_list('amount', flat=True)
+            # 2. Amount Pattern Analysis (running stats of the user's completed transfers)
+            stats = TransferStatsService.get_stats(user.id)
             
-            if user_transactions:
-                mean_amount = statistics.mean(user_transactions)
-                std_dev = statistics.stdev(user_transactions) if len(user_transactions) > 1 else mean_amount
+            if stats and stats.count:
+                mean_amount = stats.mean_amount
+                std_dev = stats.std_dev if stats.count > 1 else mean_amount
                 
-                if amount > mean_amount + (std_dev * FraudDetectionService.AMOUNT_VARIANCE_THRESHOLD):
+                if float(amount) > mean_amount + (std_dev * FraudDetectionService.AMOUNT_VARIANCE_THRESHOLD):
                     risk_factors.append({
                         'type': 'amount_anomaly',
                         'severity': 'medium',
@@ -311,7 +302,7 @@ class FraudDetectionService:
             
             # 5. Recipient Risk Analysis
             recipient_history = BankTransfer.objects.filter(
-                recipient_account=recipient_account,
+                account_number=recipient_account,
                 status='completed'
             ).values('user').distinct().count()
             
@@ -370,10 +361,7 @@ class FraudDetectionService:
             
             # Check if amount is unusually high for the user
             try:
-                avg_transfer = BankTransfer.objects.filter(
-                    user=user,
-                    status='completed'
-                ).aggregate(avg_amount=models.Avg('amount'))['avg_amount'] or 0
+                avg_transfer = TransferStatsService.get_mean_amount(user.id)
                 
                 if amount > (avg_transfer * 3):  # If amount is 3x higher than average
                     score += 20
@@ -386,7 +374,7 @@ class FraudDetectionService:
             try:
                 previous_transfers = BankTransfer.objects.filter(
                     user=user,
-                    recipient_account=recipient_account,
+                    account_number=recipient_account,
                     bank_code=recipient_bank_code,
                     status='completed'
                 ).count()
@@ -441,10 +429,7 @@ class FraudDetectionService:
         """
         try:
             # Get user's average transfer amount
-            avg_transfer = BankTransfer.objects.filter(
-                user=user,
-                status='completed'
-            ).aggregate(avg_amount=models.Avg('amount'))['avg_amount'] or 0
+            avg_transfer = TransferStatsService.get_mean_amount(user.id)
             
             # Require 2FA if:
             # 1. Fraud score is high (>70)
@@ -475,10 +460,7 @@ class FraudDetectionService:
         """
         try:
             # Get user's average transfer amount
-            avg_transfer = BankTransfer.objects.filter(
-                user=user,
-                status='completed'
-            ).aggregate(avg_amount=models.Avg('amount'))['avg_amount'] or 0
+            avg_transfer = TransferStatsService.get_mean_amount(user.id)
             
             # Require approval if:
             # 1. Fraud score is very high (>85)
@@ -511,10 +493,7 @@ class FraudDetectionService:
         
         try:
             # Check if amount is unusually high
-            avg_transfer = BankTransfer.objects.filter(
-                user=user,
-                status='completed'
-            ).aggregate(avg_amount=models.Avg('amount'))['avg_amount'] or 0
+            avg_transfer = TransferStatsService.get_mean_amount(user.id)
             
             if amount > (avg_transfer * 3):
                 flags.append('unusual_amount')
@@ -522,7 +501,7 @@ class FraudDetectionService:
             # Check if recipient is new
             if not BankTransfer.objects.filter(
                 user=user,
-                recipient_account=recipient_account,
+                account_number=recipient_account,
                 status='completed'
             ).exists():
                 flags.append('new_recipient')
@@ -1,4 +1,6 @@
 from .transaction_signals import *
 from .kyc_signals import *
+from .fee_signals import *
+from .bank_directory_signals import *
 from .staff_signals import *
 from .notification_signals import * 
\ No newline at end of file
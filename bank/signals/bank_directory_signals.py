@@ -0,0 +1,12 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from bank.models import Bank
+from bank.bank_directory_services import bank_directory_cache
+
+
+@receiver(post_save, sender=Bank)
+@receiver(post_delete, sender=Bank)
+def invalidate_bank_directory(sender, instance, **kwargs):
+    """Rebuild this process's bank directory snapshot once the change commits; others pick it up through the version probe."""
+    transaction.on_commit(bank_directory_cache.invalidate)
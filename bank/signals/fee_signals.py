@@ -0,0 +1,14 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from bank.models import VATCharge, TransferChargeControl
+from bank.fees import fee_config_cache
+
+
+@receiver(post_save, sender=VATCharge)
+@receiver(post_delete, sender=VATCharge)
+@receiver(post_save, sender=TransferChargeControl)
+@receiver(post_delete, sender=TransferChargeControl)
+def invalidate_fee_config_cache(sender, instance, **kwargs):
+    """Rebuild this process's VAT rate and charge toggles once the change commits; others pick it up through the version probe."""
+    transaction.on_commit(fee_config_cache.invalidate)
@@ -8,6 +8,7 @@ from django.utils import timezone
 from decimal import Decimal
 from bank.models import BankTransfer, Transaction, Wallet, GeneralStatusChoices
 from bank.utils import safe_money_calculation, handle_service_error
+from bank.ledger_services import WalletLedger
 
 logger = logging.getLogger(__name__)
 
@@ -82,14 +83,14 @@ class BaseSignalHandler:
             # Update wallet balance
             if hasattr(transfer.user, 'wallet'):
                 wallet = transfer.user.wallet
-                wallet.balance -= transfer.amount
+                total = transfer.amount
                 if transfer.fee:
-                    wallet.balance -= transfer.fee
+                    total += transfer.fee
                 if transfer.vat:
-                    wallet.balance -= transfer.vat
+                    total += transfer.vat
                 if transfer.levy:
-                    wallet.balance -= transfer.levy
-                wallet.save()
+                    total += transfer.levy
+                WalletLedger.debit(wallet, total)
                 
             return True
         except Exception as e:
@@ -1,14 +1,25 @@
 print('Loaded kyc_signals')
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from bank.models import Wallet, generate_alternative_account_number, StaffProfile, StaffActivity
 from accounts.models import KYCProfile
+from bank.kyc_policy_services import KYCBalancePolicy
 from django.utils import timezone
 from djmoney.money import Money
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+@receiver(post_save, sender=KYCProfile)
+@receiver(post_delete, sender=KYCProfile)
+def invalidate_kyc_tier_cache(sender, instance, **kwargs):
+    """Drop the cached KYC tier so balance-cap checks see tier changes once they commit."""
+    user_id = instance.user_id
+    transaction.on_commit(lambda: KYCBalancePolicy.invalidate(user_id))
+
+
 @receiver(post_save, sender=KYCProfile)
 def create_wallet_on_kyc_approval(sender, instance, created, **kwargs):
     """Create wallet automatically when KYC is approved."""
@@ -6,99 +6,80 @@ from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils import timezone
-from twilio.rest import Client
-from pyfcm import FCMNotification
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 
 from bank.models import CustomerEscalation, StaffActivity, Transaction, BankTransfer
+from bank.outbox_services import OutboxService
+from bank.notification_dispatch_services import NotificationDispatcher
 from notification.models import Notification, NotificationType, NotificationLevel, NotificationStatus
 
 logger = logging.getLogger(__name__)
 
-# Initialize Twilio client for SMS
-try:
-    twilio_client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
-except:
-    twilio_client = None
-    logger.warning("Twilio not configured - SMS notifications disabled")
-
-# Initialize FCM for push notifications
-try:
-    fcm_client = FCMNotification(api_key=settings.FCM_API_KEY)
-except:
-    fcm_client = None
-    logger.warning("FCM not configured - push notifications disabled")
-
 
 def send_sms_notification(phone_number, message):
-    """Send SMS notification using Twilio."""
-    if not twilio_client or not hasattr(settings, 'TWILIO_PHONE_NUMBER'):
-        logger.warning("SMS notification skipped - Twilio not configured")
-        return False
-    
-    try:
-        message = twilio_client.messages.create(
-            body=message,
-            from_=settings.TWILIO_PHONE_NUMBER,
-            to=phone_number
-        )
-        logger.info(f"SMS sent successfully: {message.sid}")
-        return True
-    except Exception as e:
-        logger.error(f"SMS sending failed: {str(e)}")
-        return False
+    """Queue an SMS on the notification dispatcher (sent in the current batch)."""
+    return NotificationDispatcher.queue_sms(phone_number, message)
 
 
 def send_push_notification(user, title, message, data=None):
-    """Send push notification using FCM."""
-    if not fcm_client:
-        logger.warning("Push notification skipped - FCM not configured")
-        return False
-    
-    try:
-        # Get user's FCM token (you'll need to implement this)
-        fcm_token = getattr(user, 'fcm_token', None)
-        if not fcm_token:
-            logger.warning(f"No FCM token for user {user.id}")
-            return False
-        
-        result = fcm_client.notify_single_device(
-            registration_id=fcm_token,
-            message_title=title,
-            message_body=message,
-            data_message=data or {}
-        )
-        logger.info(f"Push notification sent: {result}")
-        return True
-    except Exception as e:
-        logger.error(f"Push notification failed: {str(e)}")
-        return False
+    """Queue a push notification on the notification dispatcher (sent in the current batch)."""
+    return NotificationDispatcher.queue_push(user, title, message, data)
 
 
 def send_websocket_notification(user, notification_data):
-    """Send real-time notification via WebSocket."""
-    try:
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"user_{user.id}",
-            {
-                "type": "notification.message",
-                "message": notification_data
-            }
-        )
-        logger.info(f"WebSocket notification sent to user {user.id}")
-        return True
-    except Exception as e:
-        logger.error(f"WebSocket notification failed: {str(e)}")
-        return False
+    """Queue a real-time notification for the user's WebSocket group."""
+    return NotificationDispatcher.queue_websocket(
+        user.id,
+        notification_data.get('title', ''),
+        notification_data.get('message', ''),
+        notification_data,
+    )
+
+
+def claim_channel(notification, channel):
+    """
+    Mark `channel` ('email', 'sms' or 'push') as sent for the notification.
+    False if an earlier delivery of the same event already claimed it.
+    """
+    field = f'{channel}_sent_at'
+    now = timezone.now()
+    claimed = Notification.objects.filter(pk=notification.pk, **{f'{field}__isnull': True}).update(**{field: now})
+    if claimed:
+        setattr(notification, field, now)
+    return bool(claimed)
+
+
+def release_channel(notification, channel):
+    """Undo a claim whose send failed, so the retried event sends it again."""
+    field = f'{channel}_sent_at'
+    Notification.objects.filter(pk=notification.pk).update(**{field: None})
+    setattr(notification, field, None)
 
 
 @receiver(post_save, sender=Transaction)
 def handle_transaction_notifications(sender, instance, created, **kwargs):
-    """Handle notifications for all transaction types."""
+    """Queue notifications for all transaction types; the outbox relay delivers them."""
     if not created:
         return
+    OutboxService.enqueue('transaction.notify', instance)
+
+
+@OutboxService.handler('transaction.notify')
+def deliver_transaction_notifications(event):
+    """
+    Outbox handler: in-app, email, SMS, push and WebSocket notifications for a transaction.
+    The event is delivered at least once, so the in-app notification is reused and each
+    out-of-band channel is claimed on it before sending; a redelivery only sends the
+    channels that never went out. The WebSocket message only refreshes open sessions
+    and is sent again.
+    """
+    instance = (
+        Transaction.objects.select_related('wallet__user__profile', 'receiver__user')
+        .filter(pk=event.aggregate_id)
+        .first()
+    )
+    if instance is None:
+        logger.warning(f"Skipping notifications for transaction {event.aggregate_id}: it no longer exists")
+        return
 
     logger.info(f"Creating comprehensive notifications for transaction {instance.id} - type: {instance.type}")
 
@@ -128,8 +109,10 @@ def handle_transaction_notifications(sender, instance, created, **kwargs):
         email_subject = f"Transaction {instance.status.title()}: {instance.reference}"
         is_credit = False
 
-    # Create in-app notification
-    notification = Notification.objects.create(
+    # Create in-app notification (a redelivered event reuses the one already created)
+    notification = Notification.objects.filter(
+        recipient=user, transaction=instance, notification_type=notification_type
+    ).first() or Notification.objects.create(
         recipient=user,
         title=title,
         message=message,
@@ -148,68 +131,85 @@ def handle_transaction_notifications(sender, instance, created, **kwargs):
     )
     logger.info(f"Created {instance.type} notification for user: {user.email}")
 
+    # Channels that failed are released and make the event retry (sent channels are skipped then)
+    failed_channels = []
+
     # Send email notification
-    try:
-        context = {
-            'subject': email_subject,
-            'user_full_name': user_full_name,
-            'amount': instance.amount,
-            'currency': instance.currency,
-            'description': instance.description,
-            'status': instance.status.title(),
-            'reference': instance.reference,
-            'type': instance.type.title(),
-            'channel': instance.channel.title(),
-            'balance_after': instance.balance_after,
-            'is_credit': is_credit,
-            'sender_name': instance.receiver.user.get_full_name() if instance.receiver else '',
-        }
+    if not claim_channel(notification, 'email'):
+        logger.info(f"Email for transaction {instance.id} already sent - skipped")
+    else:
+        try:
+            context = {
+                'subject': email_subject,
+                'user_full_name': user_full_name,
+                'amount': instance.amount,
+                'currency': instance.currency,
+                'description': instance.description,
+                'status': instance.status.title(),
+                'reference': instance.reference,
+                'type': instance.type.title(),
+                'channel': instance.channel.title(),
+                'balance_after': instance.balance_after,
+                'is_credit': is_credit,
+                'sender_name': instance.receiver.user.get_full_name() if instance.receiver else '',
+            }
         
-        html_message = render_to_string('bank/transaction_email.html', context)
-        plain_message = (
-            f"Dear {user_full_name},\n\n"
-            f"Your transaction of {context['amount']} {context['currency']} "
-            f"({context['description']}) is now '{context['status']}'.\n\n"
-            f"Reference: {context['reference']}\n"
-            f"Type: {context['type']}\n"
-            f"Channel: {context['channel']}\n"
-            f"Balance after transaction: {context['balance_after']}\n\n"
-            "Thank you for banking with us."
-        )
+            html_message = render_to_string('bank/transaction_email.html', context)
+            plain_message = (
+                f"Dear {user_full_name},\n\n"
+                f"Your transaction of {context['amount']} {context['currency']} "
+                f"({context['description']}) is now '{context['status']}'.\n\n"
+                f"Reference: {context['reference']}\n"
+                f"Type: {context['type']}\n"
+                f"Channel: {context['channel']}\n"
+                f"Balance after transaction: {context['balance_after']}\n\n"
+                "Thank you for banking with us."
+            )
         
-        send_mail(
-            email_subject,
-            plain_message,
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            html_message=html_message,
-            fail_silently=True,
-        )
-        logger.info(f"Email sent to: {user.email}")
-    except Exception as e:
-        logger.error(f"Email sending failed: {str(e)}")
+            send_mail(
+                email_subject,
+                plain_message,
+                settings.DEFAULT_FROM_EMAIL,
+                [user.email],
+                html_message=html_message,
+            )
+            logger.info(f"Email sent to: {user.email}")
+        except Exception as e:
+            logger.error(f"Email sending failed: {str(e)}")
+            release_channel(notification, 'email')
+            failed_channels.append('email')
 
     # Send SMS notification (if phone number exists)
     try:
         # Check if user has a profile with phone number
         if hasattr(user, 'profile') and hasattr(user.profile, 'phone') and user.profile.phone:
-            sms_message = f"{title}: {message}"
-            send_sms_notification(str(user.profile.phone), sms_message)
+            if claim_channel(notification, 'sms'):
+                sms_message = f"{title}: {message}"
+                send_sms_notification(str(user.profile.phone), sms_message)
+            else:
+                logger.info(f"SMS for transaction {instance.id} already sent - skipped")
         else:
             logger.info(f"No phone number found for user {user.id} - SMS skipped")
     except Exception as e:
         logger.error(f"SMS sending failed: {str(e)}")
+        release_channel(notification, 'sms')
+        failed_channels.append('sms')
 
     # Send push notification
     try:
-        send_push_notification(user, title, message, {
-            'transaction_id': instance.id,
-            'reference': instance.reference,
-            'amount': str(instance.amount),
-            'type': instance.type
-        })
+        if claim_channel(notification, 'push'):
+            send_push_notification(user, title, message, {
+                'transaction_id': instance.id,
+                'reference': instance.reference,
+                'amount': str(instance.amount),
+                'type': instance.type
+            })
+        else:
+            logger.info(f"Push notification for transaction {instance.id} already sent - skipped")
     except Exception as e:
         logger.error(f"Push notification failed: {str(e)}")
+        release_channel(notification, 'push')
+        failed_channels.append('push')
 
     # Send WebSocket notification
     try:
@@ -223,6 +223,9 @@ def handle_transaction_notifications(sender, instance, created, **kwargs):
     except Exception as e:
         logger.error(f"WebSocket notification failed: {str(e)}")
 
+    if failed_channels:
+        raise RuntimeError(f"Notification channels failed for transaction {instance.id}: {', '.join(failed_channels)}")
+
 
 @receiver(post_save, sender=CustomerEscalation)
 def handle_escalation_status_change(sender, instance, created, **kwargs):
@@ -310,14 +313,25 @@ def handle_escalation_status_change(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=BankTransfer)
 def handle_bank_transfer_notifications(sender, instance, created, **kwargs):
-    """Handle notifications for bank transfer status changes."""
-    if not created:
-        # Handle status changes for existing transfers
-        if instance.status == 'completed':
-            # Send completion notification
+    """Queue notifications for bank transfer status changes; the outbox relay delivers them."""
+    if not created and instance.status in ('completed', 'failed'):
+        OutboxService.enqueue('bank_transfer.status_changed', instance, {'status': instance.status})
+
+
+@OutboxService.handler('bank_transfer.status_changed')
+def deliver_bank_transfer_notifications(event):
+    """Outbox handler: in-app notification for a completed or failed bank transfer."""
+    instance = BankTransfer.objects.select_related('user').filter(pk=event.aggregate_id).first()
+    if instance is None:
+        return
+
+    if event.payload.get('status') == 'completed':
+        title = "Transfer Completed"
+        # Send completion notification (once per transfer, however often it is saved)
+        if not Notification.objects.filter(bank_transfer=instance, title=title).exists():
             Notification.objects.create(
                 recipient=instance.user,
-                title="Transfer Completed",
+                title=title,
                 message=f"Your transfer of {instance.amount} to {instance.account_number} has been completed successfully.",
                 notification_type=NotificationType.BANK_TRANSFER,
                 level=NotificationLevel.SUCCESS,
@@ -330,11 +344,13 @@ def handle_bank_transfer_notifications(sender, instance, created, **kwargs):
                     'reference': instance.reference
                 }
             )
-        elif instance.status == 'failed':
-            # Send failure notification
+    elif event.payload.get('status') == 'failed':
+        title = "Transfer Failed"
+        # Send failure notification (once per transfer, however often it is saved)
+        if not Notification.objects.filter(bank_transfer=instance, title=title).exists():
             Notification.objects.create(
                 recipient=instance.user,
-                title="Transfer Failed",
+                title=title,
                 message=f"Your transfer of {instance.amount} to {instance.account_number} has failed. Please contact support.",
                 notification_type=NotificationType.BANK_TRANSFER,
                 level=NotificationLevel.ERROR,
@@ -347,4 +363,4 @@ def handle_bank_transfer_notifications(sender, instance, created, **kwargs):
                     'reference': instance.reference,
                     'failure_reason': instance.failure_reason
                 }
-            ) 
\ No newline at end of file
+            )
@@ -2,7 +2,7 @@ import logging
 import uuid
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.db import models
+from django.db import models, transaction
 from bank.models import BankTransfer, Transaction, Wallet, TransferFailure, GeneralStatusChoices, XySaveTransaction
 from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
@@ -12,7 +12,11 @@ from bank.xysave_services import (
     XySaveAccountService,
     XySaveTransactionService,
 )
-from bank.security_services import NightGuardService, LargeTransactionShieldService, LocationGuardService
+from bank.security_services import TransferGuardPipeline
+from bank.velocity_services import VelocityCounterService
+from bank.ledger_services import WalletLedger, InsufficientFundsError
+from bank.transfer_stats_services import TransferStatsService
+from bank.outbox_services import OutboxService
 
 logger = logging.getLogger(__name__)
 
@@ -143,6 +147,36 @@ def send_transfer_notifications(sender_wallet, receiver_wallet, amount, transfer
         # Don't fail the transfer if notifications fail
 
 
+@receiver(post_save, sender=BankTransfer)
+def update_transfer_velocity_counters(sender, instance, created, **kwargs):
+    """Keep the fraud velocity counters in step with BankTransfer writes once they commit."""
+    def _update():
+        try:
+            if created:
+                VelocityCounterService.record_transfer_created(instance)
+            if instance.status == GeneralStatusChoices.COMPLETED:
+                VelocityCounterService.record_transfer_completed(instance)
+        except Exception as e:
+            logger.warning(f"Failed to update velocity counters for transfer {instance.id}: {str(e)}")
+
+    transaction.on_commit(_update)
+
+
+@receiver(post_save, sender=BankTransfer)
+def update_user_transfer_stats(sender, instance, **kwargs):
+    """Fold completed transfers into the user's running amount statistics once they commit."""
+    if instance.status != GeneralStatusChoices.COMPLETED:
+        return
+
+    def _update():
+        try:
+            TransferStatsService.record_transfer_completed(instance)
+        except Exception as e:
+            logger.warning(f"Failed to update transfer stats for transfer {instance.id}: {str(e)}")
+
+    transaction.on_commit(_update)
+
+
 @receiver(post_save, sender=BankTransfer)
 def handle_bank_transfer(sender, instance, created, **kwargs):
     """Handle bank transfer processing with comprehensive failure tracking."""
@@ -152,29 +186,14 @@ def handle_bank_transfer(sender, instance, created, **kwargs):
     logger.info(f"Processing bank transfer {instance.id} - amount: {instance.amount}, account: {instance.account_number}")
     
     try:
-        # Night Guard: If required and not yet verified, don't process further
-        ng = NightGuardService.apply_night_guard(instance)
-        if ng.get('required'):
-            status = (instance.metadata or {}).get('night_guard_status')
-            if status not in {'face_passed', 'fallback_passed'}:
-                logger.info(f"Night Guard active for transfer {instance.id}; awaiting verification. status={status}")
-                return
-
-        # Large Transaction Shield: gate if required and not verified
-        lts = LargeTransactionShieldService.apply_shield(instance)
-        if lts.get('required'):
-            lts_status = (instance.metadata or {}).get('large_tx_shield_status')
-            if lts_status not in {'face_passed', 'fallback_passed'}:
-                logger.info(f"Large Transaction Shield active for transfer {instance.id}; awaiting verification. status={lts_status}")
-                return
-
-        # Location Guard: gate if required and not verified
-        lg = LocationGuardService.apply_guard(instance)
-        if lg.get('required'):
-            lg_status = (instance.metadata or {}).get('location_guard_status')
-            if lg_status not in {'face_passed', 'fallback_passed'}:
-                logger.info(f"Location Guard active for transfer {instance.id}; awaiting verification. status={lg_status}")
-                return
+        # Security guards (Night Guard, Large Transaction Shield, Location Guard) in one pass;
+        # stop here if any of them still awaits verification
+        guards = TransferGuardPipeline.evaluate(instance)
+        pending = TransferGuardPipeline.pending_guard(instance, guards)
+        if pending:
+            _, status, name = pending
+            logger.info(f"{name} active for transfer {instance.id}; awaiting verification. status={status}")
+            return
 
         # Find sender wallet
         sender_wallet = Wallet.objects.filter(user=instance.user).first()
@@ -252,19 +271,20 @@ def handle_bank_transfer(sender, instance, created, **kwargs):
             logger.info(f"Found internal receiver by {account_type} account: {instance.account_number}")
             # Internal transfer
             try:
-                # Deduct from sender
-                sender_wallet.balance -= instance.amount
-                sender_wallet.save()
-                
-                # Add to receiver
-                receiver_wallet.balance += instance.amount
-                receiver_wallet.save()
-                
-                # Create transaction records
-                description = f"Transfer to {receiver_wallet.account_number}"
-                sender_transaction, receiver_transaction = create_transaction_records(
-                    sender_wallet, receiver_wallet, instance.amount, instance, description
-                )
+                with transaction.atomic():
+                    # Debit sender (only if the balance still covers it) and credit receiver
+                    WalletLedger.transfer(sender_wallet, receiver_wallet, instance.amount)
+                    
+                    # Create transaction records
+                    description = f"Transfer to {receiver_wallet.account_number}"
+                    sender_transaction, receiver_transaction = create_transaction_records(
+                        sender_wallet, receiver_wallet, instance.amount, instance, description
+                    )
+                    # Notifications are delivered by the outbox relay once the ledger commit is done
+                    OutboxService.enqueue('bank_transfer.internal_completed', instance, {
+                        'sender_wallet_id': str(sender_wallet.id),
+                        'receiver_wallet_id': str(receiver_wallet.id),
+                    })
                 # Mark that this debit was prefunded from XySave to help downstream logic
                 if prefunded_from_xysave:
                     try:
@@ -274,10 +294,7 @@ def handle_bank_transfer(sender, instance, created, **kwargs):
                         sender_transaction.save(update_fields=['metadata'])
                     except Exception as e:
                         logger.warning(f"Failed to annotate transaction {sender_transaction.id} with XySave prefund flag: {str(e)}")
-                
-                # Send notifications
-                send_transfer_notifications(sender_wallet, receiver_wallet, instance.amount, instance)
-                
+
                 # Mark as successful
                 instance.status = GeneralStatusChoices.SUCCESSFUL
                 instance.processing_completed_at = timezone.now()
@@ -286,6 +303,16 @@ def handle_bank_transfer(sender, instance, created, **kwargs):
                 logger.info(f"Internal transfer completed successfully: {instance.id}")
                 logger.info(f"Created transactions - Sender: {sender_transaction.id}, Receiver: {receiver_transaction.id}")
                 
+            except InsufficientFundsError:
+                logger.warning(f"Insufficient funds in sender wallet {sender_wallet.account_number} for transfer {instance.id}")
+                instance.mark_as_failed(
+                    reason='Insufficient funds in sender wallet',
+                    error_code=TransferErrorCodes.INSUFFICIENT_FUNDS,
+                    technical_details={
+                        'sender_account': sender_wallet.account_number,
+                        'required_amount': float(instance.amount.amount) if hasattr(instance.amount, 'amount') else float(instance.amount),
+                    }
+                )
             except Exception as e:
                 logger.error(f"Error processing internal transfer {instance.id}: {str(e)}")
                 instance.mark_as_failed(
@@ -322,47 +349,62 @@ def handle_bank_transfer(sender, instance, created, **kwargs):
         ) 
 
 
+@OutboxService.handler('bank_transfer.internal_completed')
+def deliver_transfer_notifications(event):
+    """Outbox handler: send the email/SMS notifications of a completed internal transfer."""
+    transfer = BankTransfer.objects.filter(pk=event.aggregate_id).first()
+    wallets = {
+        str(wallet.id): wallet
+        for wallet in Wallet.objects.select_related('user').filter(
+            id__in=[event.payload['sender_wallet_id'], event.payload['receiver_wallet_id']]
+        )
+    }
+    sender_wallet = wallets.get(event.payload['sender_wallet_id'])
+    receiver_wallet = wallets.get(event.payload['receiver_wallet_id'])
+    if transfer is None or sender_wallet is None or receiver_wallet is None:
+        logger.warning(f"Skipping transfer notifications for {event.aggregate_id}: transfer or wallet no longer exists")
+        return
+    send_transfer_notifications(sender_wallet, receiver_wallet, transfer.amount, transfer)
+
+
 @receiver(post_save, sender=Transaction)
 def process_spend_and_save_on_transaction(sender, instance, created, **kwargs):
     """
-    Automatically process Spend and Save when a debit transaction is created.
-    This signal will trigger the automatic saving functionality.
+    Queue Spend and Save processing when a successful debit transaction is created.
+    The outbox relay runs the automatic saving after the transaction commits.
     """
-    logger.info(f"🔍 Signal triggered for transaction {instance.id} - created: {created}, type: {instance.type}, status: {instance.status}")
-    
     if not created:
-        logger.info(f"⏭️ Skipping - not a new transaction")
         return
     
-    # Only process debit transactions (spending transactions)
-    if instance.type != GeneralStatusChoices.DEBIT:
-        logger.info(f"⏭️ Skipping - not a debit transaction (type: {instance.type})")
+    # Only process successful debit transactions (spending transactions)
+    if instance.type != GeneralStatusChoices.DEBIT or instance.status != GeneralStatusChoices.SUCCESS:
         return
     
-    # Only process successful transactions
-    if instance.status != GeneralStatusChoices.SUCCESS:
-        logger.info(f"⏭️ Skipping - not a successful transaction (status: {instance.status})")
+    OutboxService.enqueue('transaction.spend_and_save', instance)
+
+
+@OutboxService.handler('transaction.spend_and_save', atomic=True)
+def deliver_spend_and_save(event):
+    """Outbox handler: process Spend and Save for a spending transaction."""
+    instance = Transaction.objects.select_related('wallet__user').filter(pk=event.aggregate_id).first()
+    if instance is None:
+        logger.warning(f"Skipping Spend and Save for transaction {event.aggregate_id}: it no longer exists")
         return
+
+    logger.info(f"✅ Processing Spend and Save for transaction {instance.id} - amount: {instance.amount}")
     
-    try:
-        logger.info(f"✅ Processing Spend and Save for transaction {instance.id} - amount: {instance.amount}")
-        
-        # Process the spending transaction for auto-save
-        auto_save_tx = SpendAndSaveService.process_spending_transaction(instance)
-        
-        if auto_save_tx:
-            logger.info(f"✅ Successfully processed auto-save for transaction {instance.id}. Auto-save amount: {auto_save_tx.amount}")
-        else:
-            logger.info(f"⚠️ No auto-save processed for transaction {instance.id} (user may not have active Spend and Save account)")
-            
-    except Exception as e:
-        logger.error(f"❌ Error processing Spend and Save for transaction {instance.id}: {str(e)}")
-        # Don't fail the transaction if Spend and Save processing fails 
+    # Process the spending transaction for auto-save
+    auto_save_tx = SpendAndSaveService.process_spending_transaction(instance)
+    
+    if auto_save_tx:
+        logger.info(f"✅ Successfully processed auto-save for transaction {instance.id}. Auto-save amount: {auto_save_tx.amount}")
+    else:
+        logger.info(f"⚠️ No auto-save processed for transaction {instance.id} (user may not have active Spend and Save account)")
 
 
 @receiver(post_save, sender=Transaction)
 def auto_sweep_to_xysave_on_credit(sender, instance, created, **kwargs):
-    """Auto-sweep wallet credits to XySave when enabled."""
+    """Queue an auto-sweep of wallet credits to XySave; the outbox relay performs it."""
     if not created:
         return
     if instance.type != GeneralStatusChoices.CREDIT:
@@ -370,22 +412,33 @@ def auto_sweep_to_xysave_on_credit(sender, instance, created, **kwargs):
     if instance.status != GeneralStatusChoices.SUCCESS:
         return
 
-    try:
-        # Ensure account exists and is enabled
-        xysave_account = XySaveAccountService.get_xysave_account(instance.wallet.user)
-        if not getattr(xysave_account, 'auto_save_enabled', False):
-            return
+    OutboxService.enqueue('transaction.auto_sweep', instance)
 
-        logger.info(
-            f"Auto-sweeping {instance.amount} from wallet {instance.wallet.account_number} to XySave for user {instance.wallet.user.id}"
-        )
+
+@OutboxService.handler('transaction.auto_sweep', atomic=True)
+def deliver_auto_sweep(event):
+    """Outbox handler: sweep a wallet credit to XySave when auto-save is enabled."""
+    instance = Transaction.objects.select_related('wallet__user').filter(pk=event.aggregate_id).first()
+    if instance is None:
+        return
+
+    # Ensure account exists and is enabled
+    xysave_account = XySaveAccountService.get_xysave_account(instance.wallet.user)
+    if not getattr(xysave_account, 'auto_save_enabled', False):
+        return
+
+    logger.info(
+        f"Auto-sweeping {instance.amount} from wallet {instance.wallet.account_number} to XySave for user {instance.wallet.user.id}"
+    )
+    try:
         # Deposit full credited amount to XySave (sweeps from wallet)
         XySaveTransactionService().deposit_to_xysave(
             instance.wallet.user,
             instance.amount,
             description=f"Auto-sweep from wallet credit {instance.reference}"
         )
-    except Exception as e:
+    except ValueError as e:
+        # e.g. the credit was already spent; retrying will not help
         logger.error(f"Failed to auto-sweep credit to XySave for transaction {instance.id}: {str(e)}")
 
 
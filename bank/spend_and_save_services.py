@@ -11,6 +11,7 @@ from .models import (
     GeneralStatusChoices
 )
 from .spend_and_save_notifications import SpendAndSaveNotificationService
+from .ledger_services import WalletLedger, InsufficientFundsError
 
 logger = logging.getLogger(__name__)
 
@@ -75,8 +76,7 @@ class SpendAndSaveService:
                     raise ValidationError(f"Insufficient wallet balance. Available: {wallet.balance}, Required: {amount}")
                 
                 # Deduct from wallet
-                wallet.balance -= amount
-                wallet.save()
+                WalletLedger.debit(wallet, amount)
                 
                 # Create wallet transaction
                 Transaction.objects.create(
@@ -126,8 +126,7 @@ class SpendAndSaveService:
                         raise ValidationError(f"Insufficient wallet balance. Available: {wallet.balance}, Required: {wallet_money}")
                     
                     # Deduct from wallet
-                    wallet.balance -= wallet_money
-                    wallet.save()
+                    WalletLedger.debit(wallet, wallet_money)
                     
                     # Create wallet transaction
                     Transaction.objects.create(
@@ -391,8 +390,11 @@ class SpendAndSaveService:
                             f"Insufficient wallet balance for auto-save. Required: {auto_save_amount}, Available: {wallet.balance}"
                         )
                         return None
-                    wallet.balance -= auto_save_amount
-                    wallet.save()
+                    try:
+                        WalletLedger.debit(wallet, auto_save_amount)
+                    except InsufficientFundsError:
+                        logger.warning(f"Insufficient wallet balance for auto-save. Required: {auto_save_amount}")
+                        return None
                     logger.info(f"  Deducted {auto_save_amount} from wallet. New balance: {wallet.balance}")
                 
                 # Create auto-save transaction
@@ -473,8 +475,7 @@ class SpendAndSaveService:
                 # Transfer to destination
                 if destination == 'wallet':
                     wallet = Wallet.objects.get(user=user)
-                    wallet.balance += amount
-                    wallet.save()
+                    WalletLedger.credit(wallet, amount)
                     
                     # Create wallet transaction
                     Transaction.objects.create(
@@ -658,26 +659,20 @@ class SpendAndSaveInterestService:
     """
     
     @staticmethod
-    def process_daily_interest_payout():
+    def process_daily_interest_payout(accrual_date=None, chunk_size=None):
         """
         Process daily interest payout for all active Spend and Save accounts
         This should be called by a scheduled task (e.g., cron job)
+        Accounts are credited in chunks by the batched engine; re-running for
+        the same date resumes from the checkpoint instead of paying twice.
         """
+        from .interest_batch_services import BatchInterestAccrualService
         try:
-            active_accounts = SpendAndSaveAccount.objects.filter(is_active=True)
-            processed_count = 0
-            
-            for account in active_accounts:
-                try:
-                    interest_tx = SpendAndSaveService.calculate_and_credit_interest(account.user)
-                    if interest_tx:
-                        processed_count += 1
-                except Exception as e:
-                    logger.error(f"Error processing interest for account {account.id}: {str(e)}")
-                    continue
-            
-            logger.info(f"Processed daily interest payout for {processed_count} accounts")
-            return processed_count
+            run = BatchInterestAccrualService.accrue_product(
+                'spend_and_save', accrual_date=accrual_date, chunk_size=chunk_size
+            )
+            logger.info(f"Processed daily interest payout for {run.accounts_processed} accounts")
+            return run.accounts_processed
             
         except Exception as e:
             logger.error(f"Error processing daily interest payout: {str(e)}")
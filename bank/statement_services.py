@@ -0,0 +1,331 @@
+"""
+Account statement pipeline.
+
+Statements never hold the whole range as model instances: rows are read with
+``.iterator(chunk_size=...)`` as plain values, totals and opening/closing
+balances come from aggregate queries, CSV is streamed straight to the client
+and PDFs are rendered by a background job into default storage. Every request
+is keyed by a content hash of the wallet, the filters and a fingerprint of the
+matching rows, so an identical request is served from the stored file.
+"""
+import csv
+import hashlib
+import json
+import logging
+from decimal import Decimal
+from typing import Dict, Iterator, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import (
+    Case, Count, DecimalField, Exists, F, Max, OuterRef, Q, Subquery, Sum, When
+)
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from .models import Transaction, Wallet
+
+logger = logging.getLogger(__name__)
+
+
+class _Echo:
+    """File-like object whose write() just returns the value, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+class StatementService:
+    """Build, fingerprint and render account statements."""
+
+    DEFAULT_CHUNK_SIZE = 2000
+    CACHE_PREFIX = 'statement'
+    CACHE_TTL = 7 * 24 * 3600
+    PENDING_TTL = 15 * 60
+    FILTER_KEYS = ('date_from', 'date_to', 'min_amount', 'max_amount', 'channel', 'status', 'meta_key', 'meta_value')
+    CSV_COLUMNS = ('timestamp', 'reference', 'description', 'type', 'channel', 'status', 'amount', 'balance_after')
+
+    @classmethod
+    def chunk_size(cls) -> int:
+        return getattr(settings, 'STATEMENT_CHUNK_SIZE', cls.DEFAULT_CHUNK_SIZE)
+
+    @classmethod
+    def normalize_params(cls, params) -> Dict[str, str]:
+        """Keep only statement filters, so unrelated query params don't change the cache key."""
+        return {key: params.get(key) for key in cls.FILTER_KEYS if params.get(key)}
+
+    @staticmethod
+    def get_queryset(wallet: Wallet, params: Dict, from_date, to_date):
+        txs = Transaction.objects.filter(wallet=wallet, timestamp__date__gte=from_date, timestamp__date__lte=to_date)
+        if params.get('min_amount'):
+            txs = txs.filter(amount__gte=float(params['min_amount']))
+        if params.get('max_amount'):
+            txs = txs.filter(amount__lte=float(params['max_amount']))
+        if params.get('channel'):
+            txs = txs.filter(channel=params['channel'])
+        if params.get('status'):
+            txs = txs.filter(status=params['status'])
+        if params.get('meta_key') and params.get('meta_value'):
+            txs = txs.filter(metadata__contains={params['meta_key']: params['meta_value']})
+        return txs
+
+    @staticmethod
+    def summarize(txs) -> Dict:
+        """Totals and opening/closing balances computed in the database (three small queries)."""
+        summary = txs.aggregate(
+            count=Count('id'),
+            total_credits=Sum('amount', filter=Q(type='credit')),
+            total_debits=Sum('amount', filter=Q(type='debit')),
+            last_timestamp=Max('timestamp'),
+        )
+        summary['total_credits'] = summary['total_credits'] or Decimal('0')
+        summary['total_debits'] = summary['total_debits'] or Decimal('0')
+
+        first = txs.order_by('timestamp', 'id').values('amount', 'balance_after', 'type').first()
+        last = txs.order_by('-timestamp', '-id').values('balance_after').first()
+        opening_balance = Decimal('0')
+        if first and first['balance_after'] is not None:
+            # Balance before the first row: undo its effect
+            if first['type'] == 'debit':
+                opening_balance = first['balance_after'] + first['amount']
+            else:
+                opening_balance = first['balance_after'] - first['amount']
+        closing_balance = last['balance_after'] if last and last['balance_after'] is not None else Decimal('0')
+        summary['opening_balance'] = opening_balance
+        summary['closing_balance'] = closing_balance
+        return summary
+
+    @classmethod
+    def content_hash(cls, wallet: Wallet, params: Dict, summary: Dict, fmt: str) -> str:
+        """Hash of what the statement would contain; changes when matching rows change."""
+        payload = {
+            'wallet': str(wallet.pk),
+            'format': fmt,
+            'params': cls.normalize_params(params),
+            'count': summary['count'],
+            'last_timestamp': summary['last_timestamp'].isoformat() if summary['last_timestamp'] else None,
+            'credits': str(summary['total_credits']),
+            'debits': str(summary['total_debits']),
+            'closing': str(summary['closing_balance']),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    @classmethod
+    def _cache_key(cls, digest: str) -> str:
+        return f"{cls.CACHE_PREFIX}:{digest}"
+
+    @classmethod
+    def iter_rows(cls, txs) -> Iterator[Dict]:
+        """Statement rows as plain dicts, fetched in chunks in timestamp order."""
+        type_labels = dict(Transaction._meta.get_field('type').flatchoices)
+        channel_labels = dict(Transaction._meta.get_field('channel').flatchoices)
+        status_labels = dict(Transaction._meta.get_field('status').flatchoices)
+        rows = txs.order_by('timestamp', 'id').values(
+            'timestamp', 'reference', 'description', 'type', 'channel', 'status', 'amount', 'balance_after'
+        )
+        for row in rows.iterator(chunk_size=cls.chunk_size()):
+            row['type_display'] = type_labels.get(row['type'], row['type'])
+            row['channel_display'] = channel_labels.get(row['channel'], row['channel'])
+            row['status_display'] = status_labels.get(row['status'], row['status'])
+            yield row
+
+    @classmethod
+    def stream_csv(cls, txs) -> Iterator[str]:
+        writer = csv.writer(_Echo())
+        yield writer.writerow(cls.CSV_COLUMNS)
+        for row in cls.iter_rows(txs):
+            yield writer.writerow([
+                row['timestamp'].isoformat(),
+                row['reference'],
+                row['description'],
+                row['type'],
+                row['channel'],
+                row['status'],
+                row['amount'],
+                row['balance_after'] if row['balance_after'] is not None else '',
+            ])
+
+    @classmethod
+    def render_html(cls, user, wallet: Wallet, txs, from_date, to_date, summary: Dict) -> str:
+        """Statement HTML; rows are rendered chunk by chunk so no queryset is materialized."""
+        parts, chunk = [], []
+        for row in cls.iter_rows(txs):
+            chunk.append(row)
+            if len(chunk) >= cls.chunk_size():
+                parts.append(render_to_string('bank/statement_pdf_rows.html', {'rows': chunk}))
+                chunk = []
+        if chunk:
+            parts.append(render_to_string('bank/statement_pdf_rows.html', {'rows': chunk}))
+        return render_to_string('bank/statement_pdf.html', {
+            'user': user,
+            'wallet': wallet,
+            'rows_html': mark_safe(''.join(parts)),
+            'date_from': from_date,
+            'date_to': to_date,
+            'opening_balance': summary['opening_balance'],
+            'closing_balance': summary['closing_balance'],
+            'total_credits': summary['total_credits'],
+            'total_debits': summary['total_debits'],
+            'now': timezone.now(),
+        })
+
+    @classmethod
+    def stored_pdf(cls, digest: str) -> Optional[str]:
+        """Storage path of an already rendered statement, if it is still available."""
+        path = cache.get(cls._cache_key(digest))
+        if path and default_storage.exists(path):
+            return path
+        return None
+
+    @classmethod
+    def mark_pending(cls, digest: str) -> bool:
+        """Claim rendering of a statement; False if a job for it is already queued."""
+        return cache.add(f"{cls._cache_key(digest)}:pending", 1, timeout=cls.PENDING_TTL)
+
+    @classmethod
+    def clear_pending(cls, digest: str) -> None:
+        cache.delete(f"{cls._cache_key(digest)}:pending")
+
+    @classmethod
+    def render_pdf(cls, wallet: Wallet, params: Dict, digest: str) -> str:
+        """Render the statement PDF, store it and remember it under `digest`. Returns the storage path."""
+        from weasyprint import HTML
+
+        from_date = timezone.datetime.strptime(params['date_from'], '%Y-%m-%d').date()
+        to_date = timezone.datetime.strptime(params['date_to'], '%Y-%m-%d').date()
+        txs = cls.get_queryset(wallet, params, from_date, to_date)
+        summary = cls.summarize(txs)
+        html = cls.render_html(wallet.user, wallet, txs, from_date, to_date, summary)
+        pdf_file = HTML(string=html).write_pdf()
+
+        path = f"statements/{wallet.user_id}/{digest}.pdf"
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        path = default_storage.save(path, ContentFile(pdf_file))
+        cache.set(cls._cache_key(digest), path, timeout=cls.CACHE_TTL)
+        return path
+
+    @staticmethod
+    def filename(wallet: Wallet, params: Dict, extension: str) -> str:
+        return f"statement_{wallet.account_number}_{params['date_from']}_{params['date_to']}.{extension}"
+
+    @staticmethod
+    def notify_ready(user, wallet: Wallet, params: Dict, download_url: str, success: bool = True) -> None:
+        """Tell the user their statement can be downloaded (or that it failed)."""
+        try:
+            from notification.models import Notification, NotificationType, NotificationLevel, NotificationStatus
+
+            period = f"{params['date_from']} to {params['date_to']}"
+            Notification.objects.create(
+                recipient=user,
+                title="Account statement ready" if success else "Account statement failed",
+                message=(
+                    f"Your statement for {period} is ready to download."
+                    if success else
+                    f"We could not generate your statement for {period}. Please try again later."
+                ),
+                notification_type=NotificationType.ACCOUNT_UPDATE,
+                level=NotificationLevel.SUCCESS if success else NotificationLevel.WARNING,
+                status=NotificationStatus.PENDING,
+                source='bank',
+                extra_data={
+                    'event': 'statement_ready' if success else 'statement_failed',
+                    'account_number': wallet.account_number,
+                    'date_from': params['date_from'],
+                    'date_to': params['date_to'],
+                    'action_url': download_url,
+                }
+            )
+        except Exception as e:
+            logger.error(f"Error sending statement notification to user {user.id}: {str(e)}")
+
+
+class WeeklyStatementBatch:
+    """Set-based weekly statement run: find active wallets and summarize them per chunk."""
+
+    DEFAULT_CHUNK_SIZE = 500
+
+    @staticmethod
+    def period(today=None):
+        today = today or timezone.now().date()
+        return today - timezone.timedelta(days=7), today
+
+    @staticmethod
+    def _period_transactions(from_date, to_date):
+        return Transaction.objects.filter(timestamp__date__gte=from_date, timestamp__date__lte=to_date)
+
+    @classmethod
+    def iter_wallet_id_chunks(cls, from_date, to_date, chunk_size: int = None) -> Iterator[list]:
+        """Ids of active users' wallets with activity in the period (one EXISTS query), chunked."""
+        chunk_size = chunk_size or cls.DEFAULT_CHUNK_SIZE
+        wallet_ids = Wallet.objects.filter(user__is_active=True).filter(
+            Exists(cls._period_transactions(from_date, to_date).filter(wallet_id=OuterRef('pk')))
+        ).order_by('pk').values_list('pk', flat=True)
+        chunk = []
+        for wallet_id in wallet_ids.iterator(chunk_size=chunk_size):
+            chunk.append(wallet_id)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @classmethod
+    def summarize_wallets(cls, wallet_ids, from_date, to_date):
+        """
+        Wallets (with user) annotated with the period's credits, debits and
+        opening/closing balances, all from a single grouped query.
+        """
+        in_period = Q(transaction__timestamp__date__gte=from_date, transaction__timestamp__date__lte=to_date)
+        wallet_txs = cls._period_transactions(from_date, to_date).filter(wallet_id=OuterRef('pk'))
+        money = DecimalField(max_digits=19, decimal_places=4)
+        opening = wallet_txs.order_by('timestamp', 'id').annotate(
+            balance_before=Case(
+                When(type='debit', then=F('balance_after') + F('amount')),
+                default=F('balance_after') - F('amount'),
+                output_field=money,
+            )
+        ).values('balance_before')[:1]
+        closing = wallet_txs.order_by('-timestamp', '-id').values('balance_after')[:1]
+        return Wallet.objects.filter(pk__in=wallet_ids).select_related('user').annotate(
+            total_credits=Sum('transaction__amount', filter=in_period & Q(transaction__type='credit')),
+            total_debits=Sum('transaction__amount', filter=in_period & Q(transaction__type='debit')),
+            opening_balance=Subquery(opening, output_field=money),
+            closing_balance=Subquery(closing, output_field=money),
+        ).order_by('pk')
+
+    @staticmethod
+    def emails_enabled() -> bool:
+        return bool(getattr(settings, 'WEEKLY_STATEMENT_EMAILS_ENABLED', False))
+
+    @classmethod
+    def process_chunk(cls, wallet_ids, from_date, to_date) -> Dict[str, int]:
+        """Render and email the statements of one chunk of wallets (WEEKLY_STATEMENT_EMAILS_ENABLED)."""
+        if not cls.emails_enabled():
+            return {'sent': 0, 'failed': 0}
+        sent = failed = 0
+        for wallet in cls.summarize_wallets(wallet_ids, from_date, to_date):
+            try:
+                summary = {
+                    'opening_balance': wallet.opening_balance or Decimal('0'),
+                    'closing_balance': wallet.closing_balance or Decimal('0'),
+                    'total_credits': wallet.total_credits or Decimal('0'),
+                    'total_debits': wallet.total_debits or Decimal('0'),
+                }
+                txs = cls._period_transactions(from_date, to_date).filter(wallet=wallet)
+                html = StatementService.render_html(wallet.user, wallet, txs, from_date, to_date, summary)
+                email = EmailMessage(
+                    subject=f"Your Weekly Account Statement ({from_date} to {to_date})",
+                    body=html,
+                    to=[wallet.user.email],
+                )
+                email.content_subtype = 'html'
+                email.send()
+                sent += 1
+            except Exception as e:
+                logger.error(f"Weekly statement failed for wallet {wallet.pk}: {str(e)}")
+                failed += 1
+        return {'sent': sent, 'failed': failed}
@@ -6,6 +6,7 @@ from django.core.exceptions import ValidationError
 from djmoney.money import Money
 from notification.models import Notification, NotificationType, NotificationLevel, NotificationStatus
 from .models import TargetSaving, TargetSavingDeposit, TargetSavingCategory, TargetSavingFrequency
+from .ledger_services import WalletLedger
 
 logger = logging.getLogger(__name__)
 
@@ -399,8 +400,7 @@ class TargetSavingService:
                 
                 # Credit user's wallet or XySave based on destination
                 if destination == 'wallet':
-                    user.wallet.balance += amount
-                    user.wallet.save()
+                    WalletLedger.credit(user.wallet, amount)
                     destination_account = 'wallet'
                 elif destination == 'xysave':
                     xysave_account = user.xysave_account
@@ -0,0 +1,35 @@
+"""
+Queueing Celery tasks with an inline fallback.
+
+Work that can run on a worker (outbox relays, bulk transfers, statement PDFs,
+similarity refreshes) is queued with `enqueue`; when it returns False the
+caller runs the work in the current process instead. Without a broker
+(CELERY_BROKER_URL unset) nothing is attempted, so a request does not wait for
+a connection to a broker that is not there; with one, a single publish attempt
+is made without retries.
+"""
+import logging
+from celery import current_app
+
+logger = logging.getLogger(__name__)
+
+
+def queue_available() -> bool:
+    """Whether tasks can be handed to a worker (a broker is configured or tasks run eagerly)."""
+    conf = current_app.conf
+    return bool(conf.broker_url or conf.task_always_eager)
+
+
+def enqueue(task, *args, **kwargs) -> bool:
+    """
+    Queue `task` with the given arguments. Returns False, and the caller should run
+    the work inline, when no broker is configured or the publish fails.
+    """
+    if not queue_available():
+        return False
+    try:
+        task.apply_async(args=args, kwargs=kwargs, retry=False)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not queue {task.name}, running inline: {str(e)}")
+        return False
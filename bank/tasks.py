@@ -1,65 +1,136 @@
-from django.contrib.auth import get_user_model
-from django.core.mail import EmailMessage
-from django.template.loader import render_to_string
 from django.utils import timezone
-from celery import shared_task
+from celery import shared_task, chord, group
 
 @shared_task(bind=True, ignore_result=True)
-def send_weekly_statements(self):
-    from .models import Wallet, Transaction
-    User = get_user_model()
-    today = timezone.now().date()
-    week_ago = today - timezone.timedelta(days=7)
-    for user in User.objects.filter(is_active=True):
-        try:
-            wallet = Wallet.objects.get(user=user)
-        except Wallet.DoesNotExist:
-            continue
-        txs = Transaction.objects.filter(wallet=wallet, timestamp__date__gte=week_ago, timestamp__date__lte=today).order_by('timestamp')
-        if not txs.exists():
-            continue
-        opening_balance = txs.first().balance_after - txs.first().amount if txs.first().balance_after is not None else 0
-        closing_balance = txs.last().balance_after if txs.last().balance_after is not None else 0
-        total_credits = sum(t.amount for t in txs if t.type == 'credit')
-        total_debits = sum(t.amount for t in txs if t.type == 'debit')
-        html = render_to_string('bank/statement_pdf.html', {
-            'user': user,
-            'wallet': wallet,
-            'transactions': txs,
-            'date_from': week_ago,
-            'date_to': today,
-            'opening_balance': opening_balance,
-            'closing_balance': closing_balance,
-            'total_credits': total_credits,
-            'total_debits': total_debits,
-            'now': timezone.now(),
-        })
-        # Hook: render html to PDF and email (intentionally disabled in dev)
-        # email = EmailMessage(
-        #     subject=f"Your Weekly Account Statement ({week_ago} to {today})",
-        #     body=html,
-        #     from_email=None,
-        #     to=[user.email],
-        # )
-        # email.send()
+def send_weekly_statements(self, chunk_size=None):
+    """
+    Send last week's statements (when WEEKLY_STATEMENT_EMAILS_ENABLED). Wallets with
+    activity are found with one EXISTS query and fanned out to workers in chunks;
+    each chunk is summarized with a single grouped query before rendering.
+    """
+    import logging
+    from .statement_services import WeeklyStatementBatch
+
+    if not WeeklyStatementBatch.emails_enabled():
+        return None
+    week_ago, today = WeeklyStatementBatch.period()
+    chunks = list(WeeklyStatementBatch.iter_wallet_id_chunks(week_ago, today, chunk_size=chunk_size))
+    if not chunks:
+        return None
+    try:
+        group(
+            send_weekly_statement_chunk.s([str(pk) for pk in chunk], week_ago.isoformat(), today.isoformat())
+            for chunk in chunks
+        ).apply_async()
+    except Exception as e:
+        # No worker pool available: run the chunks here
+        logging.getLogger(__name__).warning(f"Could not queue weekly statement chunks, running inline: {str(e)}")
+        for chunk in chunks:
+            WeeklyStatementBatch.process_chunk(chunk, week_ago, today)
 
 
 @shared_task(bind=True, ignore_result=True)
-def process_daily_interest(self):
-    """Process daily interest for Spend & Save and XySave."""
-    from .spend_and_save_services import SpendAndSaveInterestService
-    from .xysave_services import XySaveInterestService
+def send_weekly_statement_chunk(self, wallet_ids, date_from, date_to):
+    """Render and email the weekly statements of one chunk of wallets."""
+    from datetime import date
+    from .statement_services import WeeklyStatementBatch
 
-    try:
-        SpendAndSaveInterestService.process_daily_interest_payout()
-    except Exception:
-        # swallow errors to keep task idempotent across retries
-        pass
+    return WeeklyStatementBatch.process_chunk(wallet_ids, date.fromisoformat(date_from), date.fromisoformat(date_to))
+
+
+@shared_task(bind=True, ignore_result=True, max_retries=3, default_retry_delay=300)
+def process_daily_interest(self, shard_count=None, chunk_size=None):
+    """
+    Process daily interest for Spend & Save and XySave.
+    With more than one shard (INTEREST_ACCRUAL_SHARDS) the run fans out to one
+    subtask per product shard and a chord callback merges the results.
+    A failed product does not stop the others; the task is then retried, and the
+    retry resumes each run from its last committed chunk.
+    """
+    import logging
+    from django.conf import settings
+    from .interest_batch_services import BatchInterestAccrualService
+
+    shard_count = shard_count or getattr(settings, 'INTEREST_ACCRUAL_SHARDS', 1)
+    if shard_count > 1:
+        return dispatch_sharded_daily_interest(shard_count=shard_count, chunk_size=chunk_size)
+
+    error = None
+    for product in BatchInterestAccrualService.PRODUCTS:
+        try:
+            BatchInterestAccrualService.accrue_product(product, chunk_size=chunk_size)
+        except Exception as e:
+            logging.getLogger(__name__).exception(f"Daily interest accrual failed for {product}: {str(e)}")
+            error = e
+    if error is not None:
+        # Called directly (no worker), retry() re-raises the error
+        raise self.retry(exc=error)
+
+
+def dispatch_sharded_daily_interest(accrual_date=None, shard_count=8, chunk_size=None):
+    """Fan the daily interest run out across workers, one subtask per product shard."""
+    from .interest_batch_services import BatchInterestAccrualService
+
+    accrual_date = accrual_date or timezone.localdate()
+    shard_tasks = group(
+        accrue_interest_shard.s(product, accrual_date.isoformat(), shard_index, shard_count, chunk_size)
+        for product in BatchInterestAccrualService.PRODUCTS
+        for shard_index in range(shard_count)
+    )
+    callback = summarize_daily_interest_run.s(accrual_date.isoformat(), timezone.now().isoformat())
+    return chord(shard_tasks)(callback)
+
+
+@shared_task(bind=True)
+def accrue_interest_shard(self, product, accrual_date, shard_index, shard_count, chunk_size=None):
+    """
+    Accrue one product's interest for one shard of the account-id space.
+    Safe to re-run for the same date: completed shards are skipped and partially
+    processed shards resume from their checkpoint.
+    """
+    from datetime import date
+    from .interest_batch_services import BatchInterestAccrualService
 
     try:
-        XySaveInterestService.calculate_daily_interest_for_all_accounts()
-    except Exception:
-        pass
+        run = BatchInterestAccrualService.accrue_product(
+            product,
+            accrual_date=date.fromisoformat(accrual_date),
+            chunk_size=chunk_size,
+            shard_index=shard_index,
+            shard_count=shard_count,
+        )
+        return BatchInterestAccrualService.run_summary(run)
+    except Exception as e:
+        return {
+            'product': product,
+            'accrual_date': accrual_date,
+            'shard_index': shard_index,
+            'shard_count': shard_count,
+            'status': 'failed',
+            'accounts_processed': 0,
+            'total_interest': '0',
+            'failures': 1,
+            'error': str(e),
+        }
+
+
+@shared_task(bind=True)
+def summarize_daily_interest_run(self, shard_results, accrual_date, started_at):
+    """Chord callback: merge per-shard results into a single run summary."""
+    import logging
+    from datetime import datetime
+    from .interest_batch_services import BatchInterestAccrualService
+
+    summary = BatchInterestAccrualService.merge_summaries(
+        shard_results, started_at=datetime.fromisoformat(started_at)
+    )
+    summary['accrual_date'] = accrual_date
+    logging.getLogger(__name__).info(
+        f"Daily interest run {accrual_date}: {summary['accounts_processed']} accounts, "
+        f"{summary['total_interest']} credited, {summary['failures']} failures "
+        f"across {summary['shards']} shards in {summary['duration_seconds']:.1f}s"
+    )
+    return summary
 
 
 @shared_task(bind=True, ignore_result=True)
@@ -86,17 +157,13 @@ def send_spend_save_daily_summaries(self):
 
 # APScheduler-friendly wrapper (no Celery context required)
 def run_daily_interest_job():
-    from .spend_and_save_services import SpendAndSaveInterestService
-    from .xysave_services import XySaveInterestService
+    from .interest_batch_services import BatchInterestAccrualService
     from .fixed_savings_services import FixedSavingsService
-    try:
-        SpendAndSaveInterestService.process_daily_interest_payout()
-    except Exception:
-        pass
-    try:
-        XySaveInterestService.calculate_daily_interest_for_all_accounts()
-    except Exception:
-        pass
+    for product in BatchInterestAccrualService.PRODUCTS:
+        try:
+            BatchInterestAccrualService.accrue_product(product)
+        except Exception:
+            pass
     try:
         # Process matured fixed savings payouts and auto-renewals
         from .models import FixedSavingsAccount
@@ -111,4 +178,95 @@ def run_daily_interest_job():
             except Exception:
                 continue
     except Exception:
-        pass
\ No newline at end of file
+        pass
+
+@shared_task(bind=True, ignore_result=True)
+def process_bulk_transfer_job(self, bulk_transfer_id, chunk_size=None):
+    """Run a queued bulk transfer, streaming progress to the owner's notification channel."""
+    from .models import BulkTransfer
+    from .bulk_transfer_services import BulkTransferProgress
+    from .transfer_services import BulkTransferService
+
+    try:
+        bulk_transfer = BulkTransfer.objects.get(pk=bulk_transfer_id)
+    except BulkTransfer.DoesNotExist:
+        return None
+    result = BulkTransferService.process_bulk_transfer(
+        bulk_transfer, chunk_size=chunk_size, progress_callback=BulkTransferProgress.publish
+    )
+    bulk_transfer.refresh_from_db()
+    BulkTransferProgress.publish(bulk_transfer)
+    return result
+
+
+@shared_task(bind=True, ignore_result=True)
+def dispatch_scheduled_transfers(self, batch_size=None):
+    """Claim due scheduled transfers and fan the claimed batches out to workers."""
+    from .scheduled_transfer_services import ScheduledTransferDispatcher
+
+    return ScheduledTransferDispatcher.dispatch(batch_size=batch_size, concurrent=True)
+
+
+@shared_task(bind=True, ignore_result=True)
+def execute_scheduled_transfer_batch(self, scheduled_ids):
+    """Execute one claimed batch of scheduled transfers and advance their schedules."""
+    from .scheduled_transfer_services import ScheduledTransferDispatcher
+
+    return ScheduledTransferDispatcher.execute_batch(scheduled_ids)
+
+
+@shared_task(bind=True, ignore_result=True)
+def generate_statement_pdf(self, wallet_id, params, digest, download_url):
+    """Render a PDF statement into storage and notify the owner that it can be downloaded."""
+    import logging
+    from .models import Wallet
+    from .statement_services import StatementService
+
+    try:
+        wallet = Wallet.objects.select_related('user').get(pk=wallet_id)
+    except Wallet.DoesNotExist:
+        StatementService.clear_pending(digest)
+        return None
+    try:
+        StatementService.render_pdf(wallet, params, digest)
+        StatementService.notify_ready(wallet.user, wallet, params, download_url)
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Statement generation failed for wallet {wallet_id}: {str(e)}")
+        StatementService.notify_ready(wallet.user, wallet, params, download_url, success=False)
+    finally:
+        StatementService.clear_pending(digest)
+
+
+@shared_task(bind=True, ignore_result=True)
+def refresh_transaction_rollups(self, days=None):
+    """
+    Fold changes since the last run into DailyTransactionRollup.
+    With `days`, recompute that many recent days in full instead (nightly repair).
+    """
+    from .rollup_services import TransactionRollupService
+
+    if days:
+        return TransactionRollupService.refresh_recent(days=days)
+    return TransactionRollupService.run_incremental()
+
+
+# APScheduler-friendly wrapper (no Celery context required)
+def run_transaction_rollup_job(days=None):
+    import logging
+    from .rollup_services import TransactionRollupService
+
+    try:
+        if days:
+            TransactionRollupService.refresh_recent(days=days)
+        else:
+            TransactionRollupService.run_incremental()
+    except Exception:
+        logging.getLogger(__name__).exception("Transaction rollup job failed")
+
+
+@shared_task(bind=True, ignore_result=True)
+def relay_outbox_events(self, batch_size=None):
+    """Deliver due outbox events (post-commit side effects) to their handlers."""
+    from .outbox_services import OutboxService
+
+    return OutboxService.relay(batch_size=batch_size)
@@ -1,6 +1,7 @@
 """
-Test examples for the new account validation endpoints.
-These are not actual tests but examples of how to use the API.
+Tests for the bank app.
+
+The examples below show how to use the account validation endpoints.
 """
 
 # Example API calls for account validation:
@@ -148,3 +149,633 @@ document.getElementById('account-number-input').addEventListener('blur', functio
     }
 });
 """
+import base64
+import json
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from djmoney.money import Money
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from .bulk_transfer_services import BulkTransferEngine
+from .interest_batch_services import BatchInterestAccrualService
+from .kyc_policy_services import BalanceLimitExceededError, KYCBalancePolicy
+from .ledger_services import InsufficientFundsError, WalletLedger
+from .constants import TransferStatus
+from .models import (
+    BankTransfer, BulkTransfer, BulkTransferItem, InterestAccrualRun, OutboxEvent, Transaction, VelocityCounter, Wallet, XySaveAccount, XySaveTransaction,
+)
+from .outbox_services import OutboxService
+from .pagination import KeysetPagination
+from .velocity_services import VelocityCounterService
+
+
+def make_user(username='alice'):
+    return get_user_model().objects.create_user(username, f'{username}@example.com', 'password')
+
+
+def make_wallet(user, account_number, balance='0'):
+    wallet, _ = Wallet.objects.get_or_create(user=user, defaults={'account_number': account_number})
+    Wallet.objects.filter(pk=wallet.pk).update(balance=Decimal(balance))
+    wallet.refresh_from_db()
+    return wallet
+
+
+def make_transfers(user, count, amount='100.00', account_number='2000000001', status='pending', created_at=None):
+    """BankTransfer rows created without running the post_save handlers."""
+    transfers = BankTransfer.objects.bulk_create([
+        BankTransfer(
+            user=user,
+            bank_name='Test Bank',
+            bank_code='044',
+            account_number=account_number,
+            amount=Money(Decimal(amount), 'NGN'),
+            status=status,
+            reference=f'test-{user.pk}-{account_number}-{index}-{status}',
+        )
+        for index in range(count)
+    ])
+    if created_at is not None:
+        BankTransfer.objects.filter(pk__in=[t.pk for t in transfers]).update(created_at=created_at)
+    return transfers
+
+
+class VelocityCounterServiceTests(TestCase):
+    # Start of a day bucket, so the hour window of NOW holds only the buckets recorded below
+    NOW = datetime(2026, 3, 2, 12, 0, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.user = make_user()
+
+    def at(self, moment):
+        return mock.patch('bank.velocity_services.timezone.now', return_value=moment)
+
+    def created(self, amount, created_at, account_number='2000000001'):
+        return SimpleNamespace(
+            user_id=self.user.pk,
+            account_number=account_number,
+            amount=Money(Decimal(amount), 'NGN'),
+            created_at=created_at,
+        )
+
+    def test_hour_window_drops_buckets_older_than_an_hour(self):
+        with self.at(self.NOW):
+            VelocityCounterService.record_transfer_created(self.created('100', self.NOW - timedelta(minutes=61)))
+            VelocityCounterService.record_transfer_created(self.created('50', self.NOW - timedelta(minutes=30)))
+            VelocityCounterService.record_transfer_created(self.created('25', self.NOW))
+
+            self.assertEqual(VelocityCounterService.get_user_window(self.user.pk, 'hour'), (2, Decimal('75')))
+            self.assertEqual(VelocityCounterService.get_user_window(self.user.pk, 'day'), (3, Decimal('175')))
+            self.assertEqual(VelocityCounterService.get_recipient_hourly_count(self.user.pk, '2000000001'), 2)
+
+        # The day window rolls over bucket by bucket as well
+        with self.at(self.NOW + timedelta(hours=23, minutes=30)):
+            self.assertEqual(VelocityCounterService.get_user_window(self.user.pk, 'hour'), (0, Decimal('0')))
+            self.assertEqual(VelocityCounterService.get_user_window(self.user.pk, 'day'), (1, Decimal('25')))
+
+    def test_purge_deletes_only_expired_buckets(self):
+        with self.at(self.NOW):
+            VelocityCounterService.record_transfer_created(self.created('100', self.NOW))
+        self.assertEqual(VelocityCounter.objects.count(), 3)
+
+        with self.at(self.NOW + timedelta(hours=2)):
+            VelocityCounterService.purge_expired()
+            self.assertEqual(VelocityCounterService.get_user_window(self.user.pk, 'day'), (1, Decimal('100')))
+        # Only the day bucket is left
+        self.assertEqual(VelocityCounter.objects.count(), 1)
+
+    def test_completed_transfer_is_counted_once(self):
+        transfer = make_transfers(self.user, 1, amount='120.50', status='completed')[0]
+
+        self.assertTrue(VelocityCounterService.record_transfer_completed(transfer))
+        stale = BankTransfer.objects.get(pk=transfer.pk)
+        stale.velocity_recorded_at = None
+        self.assertFalse(VelocityCounterService.record_transfer_completed(transfer))
+        self.assertFalse(VelocityCounterService.record_transfer_completed(stale))
+
+        self.assertEqual(VelocityCounterService.get_completed_totals(self.user.pk), (1, Decimal('120.5')))
+        self.assertEqual(VelocityCounterService.get_recipient_completed_count(self.user.pk, '2000000001'), 1)
+
+    def test_rebuild_matches_incremental_counters(self):
+        other = make_user('bob')
+        recent = timezone.now() - timedelta(minutes=10)
+        transfers = (
+            make_transfers(self.user, 2, amount='10.00', status='completed', created_at=recent)
+            + make_transfers(self.user, 1, amount='5.00', account_number='2000000002', created_at=recent)
+            + make_transfers(other, 1, amount='7.00', status='completed', created_at=recent)
+        )
+        # An old completed transfer only counts towards the lifetime totals
+        make_transfers(self.user, 1, amount='1.00', account_number='2000000003', status='completed',
+                       created_at=timezone.now() - timedelta(days=3))
+        for transfer in BankTransfer.objects.filter(pk__in=[t.pk for t in transfers]):
+            VelocityCounterService.record_transfer_created(transfer)
+        for transfer in BankTransfer.objects.filter(user=self.user, status='completed', created_at__gte=recent):
+            VelocityCounterService.record_transfer_completed(transfer)
+
+        incremental = dict(VelocityCounter.objects.values_list('key', 'count'))
+        VelocityCounterService.rebuild()
+        rebuilt = dict(VelocityCounter.objects.values_list('key', 'count'))
+
+        expected = dict(incremental)
+        expected[VelocityCounterService._completed_key(VelocityCounterService._user_scope(self.user.pk))] += 1
+        expected[VelocityCounterService._completed_key(
+            VelocityCounterService._pair_scope(self.user.pk, '2000000003'))] = 1
+        expected[VelocityCounterService._completed_key(VelocityCounterService._user_scope(other.pk))] = 1
+        expected[VelocityCounterService._completed_key(
+            VelocityCounterService._pair_scope(other.pk, '2000000001'))] = 1
+        self.assertEqual(rebuilt, expected)
+        self.assertEqual(VelocityCounterService.get_completed_totals(self.user.pk), (3, Decimal('21')))
+        self.assertEqual(VelocityCounterService.get_user_window(self.user.pk, 'hour'), (3, Decimal('25')))
+        # Every completed transfer is marked, so completing it again does not count it twice
+        self.assertFalse(BankTransfer.objects.filter(status='completed', velocity_recorded_at__isnull=True).exists())
+
+    def test_rebuild_for_one_user_keeps_other_users_counters(self):
+        users = {user_id: get_user_model()(pk=user_id) for user_id in (1001, 10012)}
+        for user in users.values():
+            user.username = f'user{user.pk}'
+            user.save()
+            make_transfers(user, 1, status='completed')
+            VelocityCounterService.record_transfer_created(BankTransfer.objects.get(user=user))
+        VelocityCounter.objects.update(count=99)
+
+        VelocityCounterService.rebuild(user_ids=[1001])
+
+        self.assertEqual(VelocityCounterService.get_user_window(1001, 'hour')[0], 1)
+        self.assertEqual(VelocityCounterService.get_completed_totals(1001)[0], 1)
+        # 10012 shares the "1001" prefix but its rows are untouched
+        self.assertEqual(VelocityCounterService.get_user_window(10012, 'hour')[0], 99)
+        self.assertEqual(VelocityCounterService.get_completed_totals(10012)[0], 0)
+
+    def test_write_cost_per_transfer(self):
+        """
+        Counting a transfer costs three UPDATEs when it is created and a claim plus
+        two UPDATEs when it completes (the first transfer of a bucket also inserts
+        the row). The velocity checks then read two aggregates over at most 24 rows
+        each, where the BankTransfer scans they replace grew with the user's history.
+        """
+        transfers = make_transfers(self.user, 2, status='completed')
+        with self.at(self.NOW):
+            VelocityCounterService.record_transfer_created(self.created('1', self.NOW))
+            with CaptureQueriesContext(connection) as created:
+                VelocityCounterService.record_transfer_created(self.created('1', self.NOW))
+        VelocityCounterService.record_transfer_completed(transfers[0])
+        with CaptureQueriesContext(connection) as completed:
+            VelocityCounterService.record_transfer_completed(transfers[1])
+
+        def writes(context):
+            return [q['sql'] for q in context.captured_queries if q['sql'].startswith(('UPDATE', 'INSERT'))]
+
+        self.assertEqual(len(writes(created)), 3)
+        self.assertEqual(len(writes(completed)), 3)
+        with CaptureQueriesContext(connection) as reads:
+            VelocityCounterService.get_user_window(self.user.pk, 'hour')
+            VelocityCounterService.get_user_window(self.user.pk, 'day')
+        self.assertEqual(len(reads), 2)
+
+
+class WalletLedgerTests(TestCase):
+    def setUp(self):
+        self.wallet = make_wallet(make_user(), '1000000001', balance='100.00')
+        self.other = make_wallet(make_user('bob'), '1000000002', balance='5.00')
+
+    def balance(self, wallet):
+        return Wallet.objects.get(pk=wallet.pk).balance.amount
+
+    def test_debit_updates_row_and_instance(self):
+        balance = WalletLedger.debit(self.wallet, Money(Decimal('30.25'), 'NGN'))
+        self.assertEqual(balance, Money(Decimal('69.75'), 'NGN'))
+        self.assertEqual(self.wallet.balance, balance)
+        self.assertEqual(self.balance(self.wallet), Decimal('69.75'))
+
+    def test_debit_can_empty_the_wallet(self):
+        WalletLedger.debit(self.wallet.pk, Decimal('100.00'))
+        self.assertEqual(self.balance(self.wallet), Decimal('0'))
+
+    def test_insufficient_funds_leaves_balance_untouched(self):
+        with self.assertRaises(InsufficientFundsError):
+            WalletLedger.debit(self.wallet, Decimal('100.01'))
+        self.assertEqual(self.balance(self.wallet), Decimal('100.00'))
+        self.assertEqual(self.wallet.balance.amount, Decimal('100.00'))
+
+    def test_debit_checks_the_stored_balance_not_the_instance(self):
+        # Another request has spent most of the money since this instance was loaded
+        Wallet.objects.filter(pk=self.wallet.pk).update(balance=Decimal('10.00'))
+        with self.assertRaises(InsufficientFundsError):
+            WalletLedger.debit(self.wallet, Decimal('50.00'))
+        self.assertEqual(self.balance(self.wallet), Decimal('10.00'))
+
+    def test_negative_amounts_and_missing_wallets_are_rejected(self):
+        with self.assertRaises(ValueError):
+            WalletLedger.debit(self.wallet, Decimal('-1'))
+        with self.assertRaises(Wallet.DoesNotExist):
+            WalletLedger.debit(uuid.uuid4(), Decimal('1'))
+
+    def test_without_update_returning(self):
+        with mock.patch.object(WalletLedger, '_update_returning', return_value=False):
+            WalletLedger.debit(self.wallet, Decimal('40.00'))
+            with self.assertRaises(InsufficientFundsError):
+                WalletLedger.debit(self.wallet, Decimal('60.01'))
+            WalletLedger.credit(self.wallet, Decimal('0.01'), enforce_kyc_limit=False)
+        self.assertEqual(self.balance(self.wallet), Decimal('60.01'))
+
+    def test_credit_respects_kyc_balance_cap(self):
+        with mock.patch.object(KYCBalancePolicy, 'max_balance', return_value=Decimal('150.00')):
+            WalletLedger.credit(self.wallet, Decimal('50.00'), enforce_kyc_limit=True)
+            with self.assertRaises(BalanceLimitExceededError):
+                WalletLedger.credit(self.wallet, Decimal('0.01'), enforce_kyc_limit=True)
+        self.assertEqual(self.balance(self.wallet), Decimal('150.00'))
+
+    def test_failed_transfer_moves_nothing(self):
+        with self.assertRaises(InsufficientFundsError):
+            WalletLedger.transfer(self.other, self.wallet, Decimal('5.00'), debit_amount=Decimal('5.50'))
+        self.assertEqual(self.balance(self.other), Decimal('5.00'))
+        self.assertEqual(self.balance(self.wallet), Decimal('100.00'))
+
+        WalletLedger.transfer(self.wallet, self.other, Decimal('20.00'), debit_amount=Decimal('20.50'))
+        self.assertEqual(self.balance(self.wallet), Decimal('79.50'))
+        self.assertEqual(self.balance(self.other), Decimal('25.00'))
+
+
+class BatchInterestAccrualTests(TestCase):
+    ACCRUAL_DATE = date(2026, 3, 2)
+
+    def setUp(self):
+        self.accounts = []
+        for index in range(3):
+            user = make_user(f'saver{index}')
+            account, _ = XySaveAccount.objects.get_or_create(user=user, defaults={'account_number': f'XS{index:08d}'})
+            XySaveAccount.objects.filter(pk=account.pk).update(balance=Decimal('10000.00'))
+            self.accounts.append(account)
+
+    def accrue(self, **kwargs):
+        return BatchInterestAccrualService.accrue_product('xysave', self.ACCRUAL_DATE, chunk_size=1, **kwargs)
+
+    def credits(self):
+        return dict(
+            XySaveTransaction.objects.filter(transaction_type='interest_credit')
+            .values_list('xysave_account_id').annotate(n=Count('id'))
+        )
+
+    def balances(self):
+        return dict(XySaveAccount.objects.values_list('id', 'balance'))
+
+    def test_second_run_for_the_same_date_credits_nothing(self):
+        run = self.accrue()
+        self.assertEqual(run.status, 'completed')
+        self.assertEqual(run.accounts_processed, 3)
+        balances = self.balances()
+        self.assertTrue(all(balance > Decimal('10000') for balance in balances.values()))
+
+        again = self.accrue()
+        self.assertEqual(again.pk, run.pk)
+        self.assertEqual(self.balances(), balances)
+        self.assertEqual(self.credits(), {account.pk: 1 for account in self.accounts})
+
+    def test_lost_checkpoint_does_not_credit_twice(self):
+        self.accrue()
+        balances = self.balances()
+        InterestAccrualRun.objects.all().delete()
+
+        run = self.accrue()
+        self.assertEqual(run.status, 'completed')
+        self.assertEqual(run.accounts_processed, 0)
+        self.assertEqual(self.balances(), balances)
+        self.assertEqual(self.credits(), {account.pk: 1 for account in self.accounts})
+
+    def test_failed_run_resumes_after_its_checkpoint(self):
+        accrue_chunk = BatchInterestAccrualService._accrue_xysave_chunk
+        calls = []
+
+        def fail_second_chunk(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('database went away')
+            return accrue_chunk(*args)
+
+        with mock.patch.object(BatchInterestAccrualService, '_accrue_xysave_chunk', side_effect=fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                self.accrue()
+
+        run = InterestAccrualRun.objects.get(product='xysave', accrual_date=self.ACCRUAL_DATE)
+        self.assertEqual((run.status, run.failures, run.accounts_processed), ('failed', 1, 1))
+        self.assertEqual(run.last_error, 'database went away')
+        self.assertEqual(sum(self.credits().values()), 1)
+
+        run = self.accrue()
+        self.assertEqual((run.status, run.accounts_processed), ('completed', 3))
+        self.assertEqual(self.credits(), {account.pk: 1 for account in self.accounts})
+
+
+class KeysetPaginationTests(TestCase):
+    START = datetime(2026, 3, 2, 12, 0, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.wallet = make_wallet(make_user(), '1000000001')
+        # Rows 2 and 3 share a timestamp, so the id breaks the tie
+        self.rows = self.make_rows([0, 1, 2, 2, 3])
+
+    def make_rows(self, minutes):
+        rows = Transaction.objects.bulk_create([
+            Transaction(
+                wallet=self.wallet,
+                reference=f'TX-{uuid.uuid4().hex}',
+                amount=Money(Decimal('1.00'), 'NGN'),
+                type='credit',
+                channel='deposit',
+                description='Test',
+                status='success',
+            )
+            for _ in minutes
+        ])
+        for row, minute in zip(rows, minutes):
+            row.timestamp = self.START + timedelta(minutes=minute)
+            Transaction.objects.filter(pk=row.pk).update(timestamp=row.timestamp)
+        return rows
+
+    @staticmethod
+    def newest_first(rows):
+        return [row.pk for row in sorted(rows, key=lambda row: (row.timestamp, row.pk), reverse=True)]
+
+    def page(self, **params):
+        paginator = KeysetPagination()
+        request = Request(APIRequestFactory().get('/api/transactions/', params))
+        rows = paginator.paginate_queryset(Transaction.objects.filter(wallet=self.wallet), request)
+        return paginator, rows
+
+    def walk(self, page_size):
+        seen, params = [], {'page_size': page_size}
+        while True:
+            paginator, rows = self.page(**params)
+            self.assertLessEqual(len(rows), page_size)
+            seen.extend(row.pk for row in rows)
+            if paginator.next_cursor is None:
+                return seen
+            params['cursor'] = paginator.next_cursor
+
+    def test_pages_cover_every_row_once(self):
+        for page_size in (1, 2, 4, 5, 6):
+            self.assertEqual(self.walk(page_size), self.newest_first(self.rows))
+
+    def test_last_full_page_has_no_next_cursor(self):
+        paginator, rows = self.page(page_size=5)
+        self.assertEqual(len(rows), 5)
+        self.assertIsNone(paginator.next_cursor)
+        self.assertIsNone(paginator.get_next_link())
+
+    def test_new_rows_do_not_shift_later_pages(self):
+        paginator, first = self.page(page_size=2)
+        self.make_rows([10])
+        _, second = self.page(page_size=2, cursor=paginator.next_cursor)
+        expected = self.newest_first(self.rows)
+        self.assertEqual([row.pk for row in first + second], expected[:4])
+
+    def test_next_link_carries_cursor_and_page_size(self):
+        paginator, _ = self.page(page_size=2, type='credit')
+        link = paginator.get_next_link()
+        self.assertIn('page_size=2', link)
+        self.assertIn(f'cursor={paginator.next_cursor}', link)
+        self.assertIn('type=credit', link)
+
+    def test_page_size_is_clamped(self):
+        self.assertEqual(self.page(page_size=0)[0].page_size_used, 1)
+        self.assertEqual(self.page(page_size=10000)[0].page_size_used, KeysetPagination.max_page_size)
+        self.assertEqual(self.page(page_size='ten')[0].page_size_used, KeysetPagination.page_size)
+
+    def test_unpaginated_without_cursor_or_page_size(self):
+        self.assertIsNone(self.page()[1])
+
+    def test_bad_cursors_are_rejected(self):
+        def encode(payload):
+            return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+        ts = self.START.isoformat()
+        bad_cursors = [
+            'not a cursor',
+            encode('not json'),
+            encode(json.dumps(['a list'])),
+            encode(json.dumps({'ts': ts})),
+            encode(json.dumps({'ts': 'yesterday', 'id': str(uuid.uuid4())})),
+            encode(json.dumps({'ts': ts, 'id': 'not-a-uuid'})),
+            base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+        ]
+        for cursor in bad_cursors:
+            with self.subTest(cursor=cursor), self.assertRaises(NotFound):
+                self.page(cursor=cursor)
+
+
+class BulkTransferEngineTests(TestCase):
+    def setUp(self):
+        self.sender = make_wallet(make_user(), '1000000001', balance='10000.00')
+        self.recipient = make_wallet(make_user('bob'), '1000000002')
+        self.bulk = BulkTransfer.objects.create(user=self.sender.user, title='Salaries', total_count=3)
+        BulkTransferItem.objects.bulk_create([
+            BulkTransferItem(
+                bulk_transfer=self.bulk,
+                account_number=self.recipient.account_number,
+                account_name='Bob',
+                bank_code='000',
+                bank_name='XY Bank',
+                amount=Money(Decimal('100.00'), 'NGN'),
+                bulk_index=index,
+            )
+            for index in range(3)
+        ])
+
+    def statuses(self):
+        return list(self.bulk.items.order_by('bulk_index').values_list('status', flat=True))
+
+    def assertPaidOnce(self, indexes):
+        transfers = BankTransfer.objects.filter(bulk_transfer_id=self.bulk.id)
+        self.assertEqual(sorted(transfers.values_list('bulk_index', flat=True)), sorted(indexes))
+        debited = sum(
+            (t.amount.amount + t.fee.amount + t.vat.amount + t.levy.amount for t in transfers), Decimal('0')
+        )
+        self.sender.refresh_from_db()
+        self.recipient.refresh_from_db()
+        self.assertEqual(self.sender.balance.amount, Decimal('10000.00') - debited)
+        self.assertEqual(self.recipient.balance.amount, Decimal('100.00') * len(indexes))
+        self.assertEqual(Transaction.objects.filter(wallet=self.sender, type='debit').count(), len(indexes))
+
+    def test_failed_chunk_rolls_back_only_itself(self):
+        enqueue = BulkTransferEngine._enqueue_side_effects
+        calls = []
+
+        def fail_second_chunk(debits, credits):
+            calls.append(debits)
+            if len(calls) == 2:
+                raise RuntimeError('outbox unavailable')
+            enqueue(debits, credits)
+
+        with mock.patch.object(BulkTransferEngine, '_enqueue_side_effects', side_effect=fail_second_chunk):
+            result = BulkTransferEngine.run(self.bulk, chunk_size=1)
+
+        self.assertEqual(result['status'], 'partial_completed')
+        self.assertEqual((result['completed_count'], result['failed_count']), (2, 1))
+        self.assertEqual(self.statuses(), [TransferStatus.COMPLETED, TransferStatus.FAILED, TransferStatus.COMPLETED])
+        self.assertEqual(self.bulk.items.get(bulk_index=1).error_message, 'outbox unavailable')
+        self.assertPaidOnce([0, 2])
+        # Side effects of the committed chunks are queued: a notification per row,
+        # Spend and Save per debit and an auto-sweep per credit
+        self.assertEqual(OutboxEvent.objects.filter(event_type='transaction.notify').count(), 4)
+        self.assertEqual(OutboxEvent.objects.filter(event_type='transaction.spend_and_save').count(), 2)
+        self.assertEqual(OutboxEvent.objects.filter(event_type='transaction.auto_sweep').count(), 2)
+
+    def test_dead_run_is_resumed_without_paying_twice(self):
+        def die_after_first_chunk(bulk_transfer):
+            if bulk_transfer.completed_count:
+                raise RuntimeError('worker killed')
+
+        with self.assertRaises(RuntimeError):
+            BulkTransferEngine.run(self.bulk, chunk_size=1, progress_callback=die_after_first_chunk)
+        self.assertEqual(self.statuses(), [TransferStatus.COMPLETED, TransferStatus.PENDING, TransferStatus.PENDING])
+
+        # Not stale yet: another run leaves it alone
+        result = BulkTransferEngine.run(self.bulk, chunk_size=1)
+        self.assertFalse(result['success'])
+        self.assertEqual(result['status'], 'processing')
+
+        BulkTransfer.objects.filter(pk=self.bulk.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        result = BulkTransferEngine.run(self.bulk, chunk_size=1)
+        self.assertEqual(result['status'], 'completed')
+        self.assertEqual((result['completed_count'], result['failed_count']), (3, 0))
+        self.assertPaidOnce([0, 1, 2])
+
+    def test_items_settled_by_another_run_are_not_paid(self):
+        validate_items = BulkTransferEngine.validate_items
+
+        def settle_first_item(items, sender_wallet):
+            result = validate_items(items, sender_wallet)
+            # A concurrent run pays item 0 after this run has read it as pending
+            BulkTransferItem.objects.filter(bulk_transfer=self.bulk, bulk_index=0).update(
+                status=TransferStatus.COMPLETED
+            )
+            return result
+
+        with mock.patch.object(BulkTransferEngine, 'validate_items', side_effect=settle_first_item):
+            result = BulkTransferEngine.run(self.bulk, chunk_size=2)
+
+        self.assertEqual(result['completed_count'], 2)
+        self.assertPaidOnce([1, 2])
+
+    def test_insufficient_balance_fails_every_item_up_front(self):
+        Wallet.objects.filter(pk=self.sender.pk).update(balance=Decimal('250.00'))
+        result = BulkTransferEngine.run(self.bulk, chunk_size=1)
+
+        self.assertEqual(result['status'], 'failed')
+        self.assertEqual(result['failed_count'], 3)
+        self.assertEqual(self.statuses(), [TransferStatus.FAILED] * 3)
+        self.assertFalse(BankTransfer.objects.filter(bulk_transfer_id=self.bulk.id).exists())
+        self.sender.refresh_from_db()
+        self.assertEqual(self.sender.balance.amount, Decimal('250.00'))
+
+
+class OutboxRetryTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        handlers = mock.patch.dict(OutboxService._handlers, {
+            'test.ok': (self.calls.append, False),
+            'test.flaky': (self.fail, False),
+            'test.atomic': (self.write_then_fail, True),
+        })
+        handlers.start()
+        self.addCleanup(handlers.stop)
+
+    def fail(self, event):
+        self.calls.append(event)
+        raise RuntimeError('provider timed out')
+
+    def write_then_fail(self, event):
+        VelocityCounter.objects.create(key=f'outbox-test:{event.pk}')
+        raise RuntimeError('rolled back')
+
+    @staticmethod
+    def event(event_type):
+        return OutboxEvent.objects.create(event_type=event_type, aggregate_type='wallet', aggregate_id='1')
+
+    @staticmethod
+    def make_due(event):
+        OutboxEvent.objects.filter(pk=event.pk).update(available_at=timezone.now() - timedelta(seconds=1))
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        self.assertEqual(
+            [OutboxService.backoff(attempts).total_seconds() for attempts in range(1, 5)],
+            [30, 60, 120, 240],
+        )
+        self.assertEqual(OutboxService.backoff(0), OutboxService.BASE_BACKOFF)
+        self.assertEqual(OutboxService.backoff(20), OutboxService.MAX_BACKOFF)
+
+    def test_delivered_event_is_not_run_again(self):
+        event = self.event('test.ok')
+        self.assertEqual(OutboxService.relay(), {'delivered': 1, 'failed': 0, 'batches': 1})
+        self.assertEqual(OutboxService.relay()['batches'], 0)
+
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (OutboxEvent.STATUS_DELIVERED, 1))
+        self.assertIsNotNone(event.delivered_at)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_failed_event_waits_for_its_backoff(self):
+        event = self.event('test.flaky')
+        before = timezone.now()
+        self.assertEqual(OutboxService.relay(), {'delivered': 0, 'failed': 1, 'batches': 1})
+
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (OutboxEvent.STATUS_PENDING, 1))
+        self.assertEqual(event.last_error, 'RuntimeError: provider timed out')
+        self.assertGreaterEqual(event.available_at, before + timedelta(seconds=30))
+        # Not due yet
+        self.assertEqual(OutboxService.relay()['batches'], 0)
+
+        self.make_due(event)
+        before = timezone.now()
+        OutboxService.relay()
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 2)
+        self.assertGreaterEqual(event.available_at, before + timedelta(seconds=60))
+        self.assertEqual(len(self.calls), 2)
+
+    def test_event_gives_up_after_max_attempts(self):
+        event = self.event('test.flaky')
+        for _ in range(OutboxService.MAX_ATTEMPTS):
+            self.make_due(event)
+            OutboxService.relay()
+
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (OutboxEvent.STATUS_FAILED, OutboxService.MAX_ATTEMPTS))
+        self.make_due(event)
+        self.assertEqual(OutboxService.relay()['batches'], 0)
+        self.assertEqual(len(self.calls), OutboxService.MAX_ATTEMPTS)
+
+    def test_unknown_event_type_fails_without_retrying(self):
+        event = self.event('test.unknown')
+        OutboxService.relay()
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (OutboxEvent.STATUS_FAILED, 1))
+
+    def test_atomic_handler_failure_rolls_back_its_writes(self):
+        event = self.event('test.atomic')
+        OutboxService.relay()
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (OutboxEvent.STATUS_PENDING, 1))
+        self.assertFalse(VelocityCounter.objects.filter(key__startswith='outbox-test:').exists())
+
+    def test_stale_claims_are_released(self):
+        event = self.event('test.ok')
+        OutboxEvent.objects.filter(pk=event.pk).update(
+            status=OutboxEvent.STATUS_PROCESSING,
+            updated_at=timezone.now() - OutboxService.CLAIM_TIMEOUT - timedelta(minutes=1),
+        )
+        self.assertEqual(OutboxService.relay()['delivered'], 1)
+        event.refresh_from_db()
+        self.assertEqual(event.status, OutboxEvent.STATUS_DELIVERED)
@@ -9,6 +9,7 @@ from typing import Dict, List, Optional, Tuple
 from django.utils import timezone
 from django.db import transaction
 from django.db.models import Q, Sum, Count
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
 from djmoney.money import Money
 from .models import (
@@ -23,6 +24,7 @@ from .security_services import (
     FraudDetectionService, SecurityAlertService, TransferLimitService,
     TwoFactorAuthService
 )
+from .ledger_services import WalletLedger, InsufficientFundsError
 
 logger = logging.getLogger(__name__)
 
@@ -47,8 +49,8 @@ class BulkTransferService:
                 )
                 
                 # Create individual transfer items
-                for index, transfer_data in enumerate(transfers_data):
-                    BulkTransferItem.objects.create(
+                BulkTransferItem.objects.bulk_create([
+                    BulkTransferItem(
                         bulk_transfer=bulk_transfer,
                         account_number=transfer_data['account_number'],
                         account_name=transfer_data['account_name'],
@@ -58,6 +60,8 @@ class BulkTransferService:
                         description=transfer_data.get('description', ''),
                         bulk_index=index
                     )
+                    for index, transfer_data in enumerate(transfers_data)
+                ], batch_size=1000)
                 
                 logger.info(f"Bulk transfer created: {bulk_transfer.id} with {len(transfers_data)} items")
                 return bulk_transfer
@@ -67,71 +71,13 @@ class BulkTransferService:
             raise
     
     @staticmethod
-    def process_bulk_transfer(bulk_transfer: BulkTransfer) -> Dict:
-        """Process all items in a bulk transfer."""
+    def process_bulk_transfer(bulk_transfer: BulkTransfer, chunk_size: int = None, progress_callback=None) -> Dict:
+        """Process all items in a bulk transfer with the chunked bulk engine."""
         try:
-            with transaction.atomic():
-                items = bulk_transfer.items.all().order_by('bulk_index')
-                completed_count = 0
-                failed_count = 0
-                
-                for item in items:
-                    try:
-                        # Create individual bank transfer
-                        transfer = BankTransfer.objects.create(
-                            user=bulk_transfer.user,
-                            bank_name=item.bank_name,
-                            bank_code=item.bank_code,
-                            account_number=item.account_number,
-                            amount=item.amount,
-                            description=item.description,
-                            transfer_type='inter',
-                            status='pending',
-                            is_bulk=True,
-                            bulk_transfer_id=bulk_transfer.id,
-                            bulk_index=item.bulk_index
-                        )
-                        
-                        # Process the transfer
-                        result = TransferProcessingService.process_transfer(transfer)
-                        
-                        if result['success']:
-                            item.status = TransferStatus.COMPLETED
-                            completed_count += 1
-                        else:
-                            item.status = TransferStatus.FAILED
-                            item.error_message = result['error']
-                            failed_count += 1
-                        
-                        item.transfer = transfer
-                        item.save()
-                        
-                    except Exception as e:
-                        logger.error(f"Error processing bulk transfer item {item.id}: {str(e)}")
-                        item.status = TransferStatus.FAILED
-                        item.error_message = str(e)
-                        item.save()
-                        failed_count += 1
-                
-                # Update bulk transfer status
-                if failed_count == 0:
-                    bulk_transfer.status = 'completed'
-                elif completed_count == 0:
-                    bulk_transfer.status = 'failed'
-                else:
-                    bulk_transfer.status = 'partial_completed'
-                
-                bulk_transfer.completed_count = completed_count
-                bulk_transfer.failed_count = failed_count
-                bulk_transfer.save()
-                
-                return {
-                    'success': True,
-                    'completed_count': completed_count,
-                    'failed_count': failed_count,
-                    'status': bulk_transfer.status
-                }
-                
+            from .bulk_transfer_services import BulkTransferEngine
+            return BulkTransferEngine.run(
+                bulk_transfer, chunk_size=chunk_size, progress_callback=progress_callback
+            )
         except Exception as e:
             logger.error(f"Error processing bulk transfer: {str(e)}")
             return {
@@ -168,54 +114,11 @@ class ScheduledTransferService:
             raise
     
     @staticmethod
-    def process_scheduled_transfers() -> Dict:
-        """Process all due scheduled transfers."""
+    def process_scheduled_transfers(batch_size: int = None, concurrent: bool = False) -> Dict:
+        """Process all due scheduled transfers through the batched dispatcher."""
         try:
-            now = timezone.now()
-            due_transfers = ScheduledTransfer.objects.filter(
-                next_execution__lte=now,
-                is_active=True,
-                status=TransferStatus.PENDING
-            )
-            
-            processed_count = 0
-            failed_count = 0
-            
-            for scheduled_transfer in due_transfers:
-                try:
-                    # Create bank transfer
-                    transfer = BankTransfer.objects.create(
-                        user=scheduled_transfer.user,
-                        bank_name=scheduled_transfer.recipient_bank_code,  # You might want to get actual bank name
-                        bank_code=scheduled_transfer.recipient_bank_code,
-                        account_number=scheduled_transfer.recipient_account,
-                        amount=scheduled_transfer.amount,
-                        description=scheduled_transfer.description,
-                        transfer_type=scheduled_transfer.transfer_type,
-                        status='pending',
-                        is_scheduled=True
-                    )
-                    
-                    # Process the transfer
-                    result = TransferProcessingService.process_transfer(transfer)
-                    
-                    if result['success']:
-                        # Update next execution
-                        ScheduledTransferService._update_next_execution(scheduled_transfer)
-                        processed_count += 1
-                    else:
-                        failed_count += 1
-                        logger.error(f"Scheduled transfer failed: {result['error']}")
-                    
-                except Exception as e:
-                    logger.error(f"Error processing scheduled transfer {scheduled_transfer.id}: {str(e)}")
-                    failed_count += 1
-            
-            return {
-                'processed_count': processed_count,
-                'failed_count': failed_count,
-                'total_due': due_transfers.count()
-            }
+            from .scheduled_transfer_services import ScheduledTransferDispatcher
+            return ScheduledTransferDispatcher.dispatch(batch_size=batch_size, concurrent=concurrent)
             
         except Exception as e:
             logger.error(f"Error processing scheduled transfers: {str(e)}")
@@ -229,30 +132,14 @@ class ScheduledTransferService:
     def _update_next_execution(scheduled_transfer: ScheduledTransfer) -> None:
         """Update the next execution date for a scheduled transfer."""
         try:
-            current_next = scheduled_transfer.next_execution
-            
-            if scheduled_transfer.frequency == 'once':
-                scheduled_transfer.is_active = False
-                scheduled_transfer.status = TransferStatus.COMPLETED
-            elif scheduled_transfer.frequency == 'daily':
-                next_execution = current_next + timedelta(days=1)
-            elif scheduled_transfer.frequency == 'weekly':
-                next_execution = current_next + timedelta(weeks=1)
-            elif scheduled_transfer.frequency == 'monthly':
-                # Simple monthly calculation
-                next_execution = current_next + timedelta(days=30)
-            elif scheduled_transfer.frequency == 'yearly':
-                next_execution = current_next + timedelta(days=365)
-            else:
+            from .scheduled_transfer_services import ScheduledTransferDispatcher
+            schedule = ScheduledTransferDispatcher.next_schedule(scheduled_transfer)
+            if schedule is None:
                 return
             
-            # Check if we've reached the end date
-            if scheduled_transfer.end_date and next_execution > scheduled_transfer.end_date:
-                scheduled_transfer.is_active = False
-                scheduled_transfer.status = TransferStatus.COMPLETED
-            else:
-                scheduled_transfer.next_execution = next_execution
-            
+            (scheduled_transfer.next_execution,
+             scheduled_transfer.is_active,
+             scheduled_transfer.status) = schedule
             scheduled_transfer.save()
             
         except Exception as e:
@@ -287,15 +174,13 @@ class EscrowService:
         """Fund an escrow transfer."""
         try:
             with transaction.atomic():
-                # Check if sender has sufficient balance
+                # Deduct amount from sender if the balance covers it
                 sender_wallet = Wallet.objects.get(user=escrow.sender)
-                if sender_wallet.balance < escrow.amount:
+                try:
+                    WalletLedger.debit(sender_wallet, escrow.amount)
+                except InsufficientFundsError:
                     raise ValidationError('Insufficient balance to fund escrow')
                 
-                # Deduct amount from sender
-                sender_wallet.balance = sender_wallet.balance - escrow.amount
-                sender_wallet.save()
-                
                 # Update escrow status
                 escrow.status = 'funded'
                 escrow.funded_at = timezone.now()
@@ -318,8 +203,7 @@ class EscrowService:
                 
                 # Credit recipient
                 recipient_wallet = Wallet.objects.get(user=escrow.recipient)
-                recipient_wallet.balance = recipient_wallet.balance + escrow.amount
-                recipient_wallet.save()
+                WalletLedger.credit(recipient_wallet, escrow.amount)
                 
                 # Update escrow status
                 escrow.status = 'released'
@@ -343,8 +227,7 @@ class EscrowService:
                 
                 # Refund sender
                 sender_wallet = Wallet.objects.get(user=escrow.sender)
-                sender_wallet.balance = sender_wallet.balance + escrow.amount
-                sender_wallet.save()
+                WalletLedger.credit(sender_wallet, escrow.amount)
                 
                 # Update escrow status
                 escrow.status = 'refunded'
@@ -430,52 +313,21 @@ class TransferProcessingService:
     def process_transfer(transfer: BankTransfer) -> Dict:
         """Process a transfer with retry logic and circuit breaker."""
         try:
-            # Enforce Night Guard if applicable (app-only, time-windowed, face + fallback)
+            # Enforce Night Guard, Large Transaction Shield and Location Guard (app-only).
+            # Reuses the evaluation stored on the transfer when the signal already ran it.
             try:
-                from .security_services import NightGuardService
-                ng = NightGuardService.apply_night_guard(transfer)
-                if ng.get('required'):
-                    # Expect client to complete face verification first. If client marks
-                    # face failure, fallback (e.g., 2FA) is already flagged via requires_2fa.
-                    metadata = transfer.metadata or {}
-                    if metadata.get('night_guard_status') not in {'face_passed', 'fallback_passed'}:
-                        return {
-                            'success': False,
-                            'error': 'Night Guard verification required',
-                            'night_guard': ng,
-                        }
-            except Exception as _:
-                # Do not block transfers if Night Guard check fails; proceed normally
-                pass
-
-            # Enforce Large Transaction Shield if thresholds exceeded (app-only)
-            try:
-                from .security_services import LargeTransactionShieldService
-                lts = LargeTransactionShieldService.apply_shield(transfer)
-                if lts.get('required'):
-                    metadata = transfer.metadata or {}
-                    if metadata.get('large_tx_shield_status') not in {'face_passed', 'fallback_passed'}:
-                        return {
-                            'success': False,
-                            'error': 'Large Transaction Shield verification required',
-                            'large_tx_shield': lts,
-                        }
-            except Exception as _:
-                pass
-
-            # Enforce Location Guard (app-only, out-of-allowed states)
-            try:
-                from .security_services import LocationGuardService
-                lg = LocationGuardService.apply_guard(transfer)
-                if lg.get('required'):
-                    metadata = transfer.metadata or {}
-                    if metadata.get('location_guard_status') not in {'face_passed', 'fallback_passed'}:
-                        return {
-                            'success': False,
-                            'error': 'Location Guard verification required',
-                            'location_guard': lg,
-                        }
+                from .security_services import TransferGuardPipeline
+                guards = TransferGuardPipeline.evaluate(transfer)
+                pending = TransferGuardPipeline.pending_guard(transfer, guards)
+                if pending:
+                    key, _, name = pending
+                    return {
+                        'success': False,
+                        'error': f'{name} verification required',
+                        key: guards[key],
+                    }
             except Exception as _:
+                # Do not block transfers if the guard check fails; proceed normally
                 pass
 
             # Check circuit breaker
@@ -493,14 +345,16 @@ class TransferProcessingService:
                     'error': 'Maximum retry attempts exceeded'
                 }
             
-            # Process the transfer
-            result = TransferProcessingService._execute_transfer(transfer)
+            # Process the transfer; completion commits with the debit, so a crash
+            # in between cannot leave a debited transfer looking unpaid
+            with transaction.atomic():
+                result = TransferProcessingService._execute_transfer(transfer)
+                if result['success']:
+                    transfer.mark_as_completed()
+                    transfer.processing_completed_at = timezone.now()
+                    transfer.save()
             
             if result['success']:
-                transfer.mark_as_completed()
-                transfer.processing_completed_at = timezone.now()
-                transfer.save()
-                
                 return {'success': True}
             else:
                 # Increment retry count
@@ -537,30 +391,22 @@ class TransferProcessingService:
                 # Calculate total deduction (amount + fees)
                 total_deduction = transfer.amount + transfer.fee + transfer.vat + transfer.levy
                 
-                # Check balance
-                if sender_wallet.balance < total_deduction:
+                receiver_wallet = Wallet.objects.filter(account_number=transfer.account_number).first()
+                
+                # Check balance and move funds in conditional updates
+                try:
+                    if receiver_wallet:
+                        WalletLedger.transfer(sender_wallet, receiver_wallet, transfer.amount, total_deduction)
+                    else:
+                        WalletLedger.debit(sender_wallet, total_deduction)
+                except InsufficientFundsError:
                     return {
                         'success': False,
                         'error': 'Insufficient balance'
                     }
                 
-                # Deduct from sender
-                sender_wallet.balance = sender_wallet.balance - total_deduction
-                sender_wallet.save()
-                
-                # Check if internal transfer
-                try:
-                    receiver_wallet = Wallet.objects.get(account_number=transfer.account_number)
-                    # Credit receiver
-                    receiver_wallet.balance = receiver_wallet.balance + transfer.amount
-                    receiver_wallet.save()
-                    
-                    # Create transaction records
-                    TransferProcessingService._create_transaction_records(transfer, sender_wallet, receiver_wallet)
-                    
-                except Wallet.DoesNotExist:
-                    # External transfer - just create transaction records
-                    TransferProcessingService._create_transaction_records(transfer, sender_wallet)
+                # Create transaction records (external transfers have no receiver wallet)
+                TransferProcessingService._create_transaction_records(transfer, sender_wallet, receiver_wallet)
                 
                 return {'success': True}
                 
@@ -575,6 +421,9 @@ class TransferProcessingService:
     def _create_transaction_records(transfer: BankTransfer, sender_wallet: Wallet, receiver_wallet: Wallet = None):
         """Create transaction records for the transfer."""
         try:
+            # Ledger rows point back at the transfer so a retry can tell it was already paid
+            content_type = ContentType.objects.get_for_model(BankTransfer)
+
             # Debit transaction for sender
             Transaction.objects.create(
                 wallet=sender_wallet,
@@ -583,7 +432,9 @@ class TransferProcessingService:
                 channel='transfer',
                 description=f"Transfer to {transfer.account_number}",
                 status='success',
-                balance_after=sender_wallet.balance
+                balance_after=sender_wallet.balance,
+                content_type=content_type,
+                object_id=str(transfer.id),
             )
             
             # Credit transaction for receiver (if internal)
@@ -595,7 +446,9 @@ class TransferProcessingService:
                     channel='transfer',
                     description=f"Transfer from {sender_wallet.account_number}",
                     status='success',
-                    balance_after=receiver_wallet.balance
+                    balance_after=receiver_wallet.balance,
+                    content_type=content_type,
+                    object_id=str(transfer.id),
                 )
                 
         except Exception as e:
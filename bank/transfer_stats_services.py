@@ -0,0 +1,116 @@
+"""
+Maintained per-user transfer statistics for fraud scoring.
+
+UserTransferStats is updated once per transfer as it completes, so amount
+anomaly checks read a single row instead of aggregating the user's history.
+A transfer's stats_recorded_at is set in the same transaction as the stats
+update, so re-saves on any worker, at any later time, never fold it in twice.
+"""
+import logging
+from typing import Dict, Iterable, Optional
+from django.db import transaction
+from django.utils import timezone
+
+from .models import BankTransfer, UserTransferStats, GeneralStatusChoices
+
+logger = logging.getLogger(__name__)
+
+
+class TransferStatsService:
+    """Incremental maintenance and lookup of UserTransferStats."""
+
+    @staticmethod
+    def get_stats(user_id) -> Optional[UserTransferStats]:
+        """Current stats for a user, or None if they have no completed transfers yet."""
+        return UserTransferStats.objects.filter(user_id=user_id).first()
+
+    @staticmethod
+    def get_mean_amount(user_id) -> float:
+        """Mean completed transfer amount for a user (0 without history)."""
+        stats = UserTransferStats.objects.filter(user_id=user_id).values_list('mean_amount', flat=True).first()
+        return stats or 0
+
+    @classmethod
+    def record_transfer_completed(cls, transfer) -> bool:
+        """
+        Fold a completed transfer into its user's stats.
+        Returns False if this transfer was already counted.
+        """
+        now = timezone.now()
+        new_recipient = not BankTransfer.objects.filter(
+            user_id=transfer.user_id,
+            account_number=transfer.account_number,
+            status=GeneralStatusChoices.COMPLETED,
+        ).exclude(pk=transfer.pk).exists()
+
+        # A failure rolls the flag back with the stats, so a later save retries
+        with transaction.atomic():
+            claimed = BankTransfer.objects.filter(
+                pk=transfer.pk, stats_recorded_at__isnull=True
+            ).update(stats_recorded_at=now)
+            if not claimed:
+                return False
+            UserTransferStats.objects.get_or_create(user_id=transfer.user_id)
+            stats = UserTransferStats.objects.select_for_update().get(user_id=transfer.user_id)
+            stats.add_sample(
+                transfer.amount,
+                seen_at=transfer.processing_completed_at or transfer.updated_at or now,
+                new_recipient=new_recipient,
+            )
+            stats.save()
+        transfer.stats_recorded_at = now
+        return True
+
+    @classmethod
+    def rebuild(cls, user_ids: Optional[Iterable] = None, batch_size: int = 1000) -> Dict[str, int]:
+        """
+        Recompute stats from completed BankTransfer history, overwriting existing rows.
+        Transfers are streamed in user order so only one user's stats are held at a time.
+        """
+        completed = BankTransfer.objects.filter(status=GeneralStatusChoices.COMPLETED)
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            completed = completed.filter(user_id__in=user_ids)
+        # Mark first so transfers completing during the rebuild are not folded in twice
+        completed.filter(stats_recorded_at__isnull=True).update(stats_recorded_at=timezone.now())
+
+        rows = completed.order_by('user_id', 'created_at').values_list(
+            'user_id', 'account_number', 'amount', 'processing_completed_at', 'updated_at'
+        )
+
+        pending = []
+        users = 0
+        current, seen_recipients = None, set()
+        for user_id, account_number, amount, completed_at, updated_at in rows.iterator(chunk_size=batch_size):
+            if current is None or current.user_id != user_id:
+                if current is not None:
+                    pending.append(current)
+                current, seen_recipients = UserTransferStats(user_id=user_id), set()
+                users += 1
+            current.add_sample(
+                amount,
+                seen_at=completed_at or updated_at,
+                new_recipient=account_number not in seen_recipients,
+            )
+            seen_recipients.add(account_number)
+            if len(pending) >= batch_size:
+                cls._replace_stats(pending)
+                pending = []
+        if current is not None:
+            pending.append(current)
+        cls._replace_stats(pending)
+
+        # Users without any completed transfer keep no stats row
+        stale = UserTransferStats.objects.exclude(user_id__in=completed.values('user_id'))
+        if user_ids is not None:
+            stale = stale.filter(user_id__in=user_ids)
+        removed, _ = stale.delete()
+        return {'users': users, 'removed': removed}
+
+    @staticmethod
+    def _replace_stats(stats_rows):
+        if not stats_rows:
+            return
+        with transaction.atomic():
+            UserTransferStats.objects.filter(user_id__in=[row.user_id for row in stats_rows]).delete()
+            UserTransferStats.objects.bulk_create(stats_rows)
@@ -89,4 +89,5 @@ urlpatterns = [
 
 urlpatterns += [
     path('statement/pdf/', views.download_pdf_statement, name='download_pdf_statement'),
+    path('notifications/metrics/', views.notification_metrics, name='notification-metrics'),
 ]
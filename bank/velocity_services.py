@@ -0,0 +1,264 @@
+"""
+Rolling-window transfer counters for fraud scoring.
+
+Counts and amounts are kept in time buckets per user and per (user, recipient)
+so velocity checks read a fixed number of rows instead of scanning BankTransfer.
+Counters live in the VelocityCounter table and are changed with F() updates, so
+every worker process reads the same totals and they survive restarts. A
+completed transfer is added to the lifetime totals in the same transaction that
+sets its velocity_recorded_at, so repeated saves never count it twice.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_purge_state = {'at': 0.0}
+_purge_lock = threading.Lock()
+
+
+class VelocityCounterService:
+    """Bucketed rolling-window transfer counters per user and per (user, recipient)."""
+
+    KEY_PREFIX = 'velocity'
+    # Hour window: 12 x 5 minute buckets. Day window: 24 x 1 hour buckets.
+    WINDOWS = {
+        'hour': (300, 12),
+        'day': (3600, 24),
+    }
+    # MoneyField stores 4 decimal places; amounts are kept as integers in these units
+    AMOUNT_SCALE = 10000
+    # Seconds between deletions of expired window buckets (per process)
+    PURGE_INTERVAL = 3600
+
+    # --- storage ---
+
+    @staticmethod
+    def _incr(key: str, count: int, units: int, timeout: Optional[int]) -> None:
+        """Add to a counter row, creating it on first use."""
+        from .models import VelocityCounter
+
+        expires_at = None if timeout is None else timezone.now() + timedelta(seconds=timeout)
+        changes = {'count': F('count') + count, 'amount': F('amount') + units, 'expires_at': expires_at}
+        if VelocityCounter.objects.filter(key=key).update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                VelocityCounter.objects.create(key=key, count=count, amount=units, expires_at=expires_at)
+        except IntegrityError:
+            # Another worker created the row first
+            VelocityCounter.objects.filter(key=key).update(**changes)
+
+    @staticmethod
+    def _totals(keys: Iterable[str]) -> Tuple[int, int]:
+        from .models import VelocityCounter
+
+        totals = VelocityCounter.objects.filter(key__in=list(keys)).aggregate(n=Sum('count'), amt=Sum('amount'))
+        return totals['n'] or 0, totals['amt'] or 0
+
+    @classmethod
+    def purge_expired(cls) -> int:
+        """Delete window buckets that have fallen out of their window."""
+        from .models import VelocityCounter
+
+        deleted, _ = VelocityCounter.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+    @classmethod
+    def _maybe_purge(cls) -> None:
+        now = time.monotonic()
+        with _purge_lock:
+            if now - _purge_state['at'] < cls.PURGE_INTERVAL:
+                return
+            _purge_state['at'] = now
+        try:
+            cls.purge_expired()
+        except Exception as e:
+            logger.warning(f"Failed to purge expired velocity counters: {str(e)}")
+
+    # --- key layout ---
+
+    @classmethod
+    def _bucket_key(cls, scope: str, window: str, bucket: int) -> str:
+        return f"{cls.KEY_PREFIX}:{scope}:{window}:{bucket}"
+
+    @classmethod
+    def _completed_key(cls, scope: str) -> str:
+        return f"{cls.KEY_PREFIX}:{scope}:completed"
+
+    @staticmethod
+    def _user_scope(user_id) -> str:
+        return f"u:{user_id}"
+
+    @staticmethod
+    def _pair_scope(user_id, account_number: str) -> str:
+        return f"ur:{user_id}:{account_number}"
+
+    @classmethod
+    def _current_bucket(cls, window: str, at=None) -> int:
+        size, _ = cls.WINDOWS[window]
+        moment = at or timezone.now()
+        return int(moment.timestamp()) // size
+
+    @classmethod
+    def _window_timeout(cls, window: str) -> int:
+        size, buckets = cls.WINDOWS[window]
+        return size * (buckets + 1)
+
+    @classmethod
+    def _to_units(cls, amount) -> int:
+        value = amount.amount if hasattr(amount, 'amount') else amount
+        return int(Decimal(str(value)) * cls.AMOUNT_SCALE)
+
+    @classmethod
+    def _from_units(cls, units: int) -> Decimal:
+        return Decimal(units) / cls.AMOUNT_SCALE
+
+    # --- writes ---
+
+    @classmethod
+    def record_transfer_created(cls, transfer) -> None:
+        """Count a newly created transfer in the user and (user, recipient) windows."""
+        units = cls._to_units(transfer.amount)
+        created_at = transfer.created_at or timezone.now()
+        user_scope = cls._user_scope(transfer.user_id)
+        for window in cls.WINDOWS:
+            key = cls._bucket_key(user_scope, window, cls._current_bucket(window, created_at))
+            cls._incr(key, 1, units, cls._window_timeout(window))
+
+        pair_scope = cls._pair_scope(transfer.user_id, transfer.account_number)
+        key = cls._bucket_key(pair_scope, 'hour', cls._current_bucket('hour', created_at))
+        cls._incr(key, 1, 0, cls._window_timeout('hour'))
+        cls._maybe_purge()
+
+    @classmethod
+    def record_transfer_completed(cls, transfer) -> bool:
+        """
+        Count a completed transfer in the lifetime totals.
+        Returns False if this transfer was already counted.
+        """
+        from .models import BankTransfer
+
+        now = timezone.now()
+        with transaction.atomic():
+            claimed = BankTransfer.objects.filter(
+                pk=transfer.pk, velocity_recorded_at__isnull=True
+            ).update(velocity_recorded_at=now)
+            if not claimed:
+                return False
+            units = cls._to_units(transfer.amount)
+            cls._incr(cls._completed_key(cls._user_scope(transfer.user_id)), 1, units, None)
+            cls._incr(cls._completed_key(cls._pair_scope(transfer.user_id, transfer.account_number)), 1, 0, None)
+        transfer.velocity_recorded_at = now
+        return True
+
+    # --- reads ---
+
+    @classmethod
+    def _window_totals(cls, scope: str, window: str) -> Tuple[int, int]:
+        _, buckets = cls.WINDOWS[window]
+        current = cls._current_bucket(window)
+        return cls._totals(
+            cls._bucket_key(scope, window, bucket) for bucket in range(current - buckets + 1, current + 1)
+        )
+
+    @classmethod
+    def get_user_window(cls, user_id, window: str) -> Tuple[int, Decimal]:
+        """Transfer count and amount for a user over the 'hour' or 'day' window."""
+        count, units = cls._window_totals(cls._user_scope(user_id), window)
+        return count, cls._from_units(units)
+
+    @classmethod
+    def get_recipient_hourly_count(cls, user_id, account_number: str) -> int:
+        """Transfers from a user to one recipient account in the last hour."""
+        count, _ = cls._window_totals(cls._pair_scope(user_id, account_number), 'hour')
+        return count
+
+    @classmethod
+    def get_completed_totals(cls, user_id) -> Tuple[int, Decimal]:
+        """Lifetime count and amount of a user's completed transfers."""
+        count, units = cls._totals([cls._completed_key(cls._user_scope(user_id))])
+        return count, cls._from_units(units)
+
+    @classmethod
+    def get_recipient_completed_count(cls, user_id, account_number: str) -> int:
+        """Lifetime count of a user's completed transfers to one recipient account."""
+        count, _ = cls._totals([cls._completed_key(cls._pair_scope(user_id, account_number))])
+        return count
+
+    # --- rebuild ---
+
+    @classmethod
+    def rebuild(cls, user_ids=None, batch_size: int = 1000) -> Dict[str, int]:
+        """
+        Reconstruct all counters from BankTransfer history.
+        Window buckets are rebuilt from the last day of transfers; lifetime
+        totals from completed transfers. Existing rows are replaced.
+        """
+        from .models import BankTransfer, GeneralStatusChoices, VelocityCounter
+
+        transfers = BankTransfer.objects.all()
+        counters = VelocityCounter.objects.all()
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            transfers = transfers.filter(user_id__in=user_ids)
+            scopes = Q()
+            for user_id in user_ids:
+                # Trailing colons keep user 1 from matching user 12's keys
+                for scope in (f"{cls._user_scope(user_id)}:", cls._pair_scope(user_id, '')):
+                    scopes |= Q(key__startswith=f"{cls.KEY_PREFIX}:{scope}")
+            counters = counters.filter(scopes)
+        completed = transfers.filter(status=GeneralStatusChoices.COMPLETED)
+
+        # Mark first so transfers completing during the rebuild are not counted twice
+        completed.filter(velocity_recorded_at__isnull=True).update(velocity_recorded_at=timezone.now())
+
+        rows = {}
+
+        def add(key, count, units, timeout):
+            row = rows.get(key)
+            if row is None:
+                expires_at = None if timeout is None else timezone.now() + timedelta(seconds=timeout)
+                row = rows[key] = VelocityCounter(key=key, expires_at=expires_at)
+            row.count += count
+            row.amount += units
+
+        # Rolling windows: only the last day can contribute
+        day_ago = timezone.now() - timedelta(seconds=cls._window_timeout('day'))
+        recent = transfers.filter(created_at__gte=day_ago).values_list(
+            'user_id', 'account_number', 'amount', 'created_at'
+        )
+        for user_id, account_number, amount, created_at in recent.iterator(chunk_size=batch_size):
+            units = cls._to_units(amount)
+            user_scope = cls._user_scope(user_id)
+            for window in cls.WINDOWS:
+                key = cls._bucket_key(user_scope, window, cls._current_bucket(window, created_at))
+                add(key, 1, units, cls._window_timeout(window))
+            key = cls._bucket_key(
+                cls._pair_scope(user_id, account_number), 'hour', cls._current_bucket('hour', created_at)
+            )
+            add(key, 1, 0, cls._window_timeout('hour'))
+        window_keys = len(rows)
+
+        # Lifetime completed totals
+        for row in completed.values('user_id').annotate(n=Count('id'), total=Sum('amount')).order_by():
+            add(cls._completed_key(cls._user_scope(row['user_id'])), row['n'], cls._to_units(row['total'] or 0), None)
+        pair_rows = completed.values('user_id', 'account_number').annotate(n=Count('id')).order_by()
+        for row in pair_rows:
+            add(cls._completed_key(cls._pair_scope(row['user_id'], row['account_number'])), row['n'], 0, None)
+
+        with transaction.atomic():
+            counters.delete()
+            VelocityCounter.objects.bulk_create(rows.values(), batch_size=batch_size)
+
+        return {
+            'window_keys': window_keys,
+            'lifetime_keys': len(rows) - window_keys,
+        }
@@ -36,11 +36,15 @@ from django.db.models import Q, Count
 from .fees import calculate_transfer_fees, get_active_vat_rate
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.template.loader import render_to_string
 # from weasyprint import HTML
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse
+from django.core.files.storage import default_storage
 from decimal import Decimal
-from .nibss import NIBSSClient
+from .name_enquiry_services import NameEnquiryService
+from .bank_directory_services import BankDirectory
+from .ledger_services import WalletLedger, InsufficientFundsError
+from .pagination import KeysetPagination
+from .task_queue import enqueue, queue_available
 from .services import (
     BankAccountService, TransferValidationService, FraudDetectionService,
     TwoFactorAuthService, DeviceFingerprintService, IdempotencyService,
@@ -82,37 +86,65 @@ class WalletViewSet(ReadOnlyModelViewSet):
 
 
 class TransactionViewSet(ReadOnlyModelViewSet):
-    """ViewSet for Transaction operations (read-only)."""
+    """
+    ViewSet for Transaction operations (read-only).
+    Pass `page_size` and/or `cursor` for keyset pages, and `fields=id,amount,...`
+    to return only the listed fields.
+    """
     permission_classes = [IsAuthenticated]
     serializer_class = TransactionSerializer
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['type', 'channel', 'status', 'timestamp']
     search_fields = ['reference', 'description']
     ordering_fields = ['amount', 'timestamp']
     ordering = ['-timestamp']
 
+    def _requested_fields(self):
+        fields = self.request.query_params.get('fields') if self.request else None
+        if not fields:
+            return None
+        return [name.strip() for name in fields.split(',') if name.strip()]
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self._requested_fields()
+        if fields and self.serializer_class is TransactionSerializer:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def _project(self, queryset):
+        """Load only what the requested fields need."""
+        fields = self._requested_fields()
+        if fields is None or 'wallet' in fields:
+            queryset = queryset.select_related('wallet__user')
+        if fields is not None and 'metadata' not in fields:
+            queryset = queryset.defer('metadata')
+        return queryset
+
     def get_queryset(self):
         """Return transactions based on user permissions."""
         if self.request.user.is_staff:
-            return Transaction.objects.all()
-        try:
-            wallet = Wallet.objects.get(user=self.request.user)
-            return Transaction.objects.filter(wallet=wallet)
-        except Wallet.DoesNotExist:
+            return self._project(Transaction.objects.all())
+        wallet_id = Wallet.objects.filter(user=self.request.user).values_list('id', flat=True).first()
+        if wallet_id is None:
             return Transaction.objects.none()
+        return self._project(Transaction.objects.filter(wallet_id=wallet_id))
 
     @action(detail=False, methods=['get'])
     def my_transactions(self, request):
-        """Get current user's transactions."""
-        try:
-            wallet = Wallet.objects.get(user=request.user)
-            transactions = Transaction.objects.filter(wallet=wallet).order_by('-timestamp')
-            serializer = self.get_serializer(transactions, many=True)
-            return Response(serializer.data)
-        except Wallet.DoesNotExist:
+        """Get current user's transactions (keyset-paginated when `page_size`/`cursor` is given)."""
+        wallet_id = Wallet.objects.filter(user=request.user).values_list('id', flat=True).first()
+        if wallet_id is None:
             return Response({
                 'detail': 'Wallet not found. Complete KYC verification first.'
             }, status=status.HTTP_404_NOT_FOUND)
+        transactions = self._project(Transaction.objects.filter(wallet_id=wallet_id)).order_by('-timestamp', '-id')
+        page = self.paginate_queryset(transactions)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(transactions, many=True)
+        return Response(serializer.data)
 
 
 class BankTransferViewSet(ModelViewSet):
@@ -165,8 +197,7 @@ class BankTransferViewSet(ModelViewSet):
             })
         except Wallet.DoesNotExist:
             # Check external banks (simulated)
-            nibss_client = NIBSSClient()
-            validation_result = nibss_client.validate_account_number(account_number)
+            validation_result = NameEnquiryService.validate_account(account_number)
             
             if validation_result['valid']:
                 return Response({
@@ -189,23 +220,7 @@ class BankTransferViewSet(ModelViewSet):
         """
         Get list of all available banks for transfer.
         """
-        banks = Bank.objects.all().order_by('name')
-        bank_list = []
-        
-        for bank in banks:
-            bank_list.append({
-                'id': bank.id,
-                'name': bank.name,
-                'code': bank.code,
-                'slug': bank.slug,
-                'ussd': bank.ussd,
-                'logo': bank.logo
-            })
-        
-        return Response({
-            'banks': bank_list,
-            'count': len(bank_list)
-        })
+        return BankDirectory.response(request, 'transfer')
 
     # Payments: Payment Intents
     @action(detail=False, methods=['post'], url_path='payment-intents')
@@ -240,12 +255,12 @@ class BankTransferViewSet(ModelViewSet):
                 return Response({'error': 'Invalid 2FA code'}, status=status.HTTP_400_BAD_REQUEST)
 
             with transaction.atomic():
-                wallet = Wallet.objects.select_for_update().get(user=request.user)
-                if wallet.balance < intent.amount:
+                wallet = Wallet.objects.get(user=request.user)
+                # Debit wallet if the balance covers the intent
+                try:
+                    WalletLedger.debit(wallet, intent.amount)
+                except InsufficientFundsError:
                     return Response({'error': 'Insufficient balance'}, status=status.HTTP_400_BAD_REQUEST)
-                # Debit wallet
-                wallet.balance -= intent.amount
-                wallet.save()
                 # Record transaction
                 Transaction.objects.create(
                     wallet=wallet,
@@ -889,8 +904,17 @@ class BankTransferViewSet(ModelViewSet):
     @action(detail=False, methods=['post'], url_path='bulk-transfer')
     def bulk_transfer(self, request):
         """
-        Create multiple transfers in a single request.
+        Queue multiple transfers for background execution.
+        Returns 202 with a job id; progress is pushed to the user's notification
+        channel and can be polled at bulk-transfer/<job_id>/. Without a task queue
+        the job runs in the request (up to BULK_TRANSFER_INLINE_MAX_ITEMS items)
+        and the final counts come back with a 200.
         """
+        from django.conf import settings as django_settings
+        from .models import BulkTransfer
+        from .tasks import process_bulk_transfer_job
+        from .transfer_services import BulkTransferService
+
         try:
             transfers_data = request.data.get('transfers', [])
             
@@ -899,59 +923,88 @@ class BankTransferViewSet(ModelViewSet):
                     'error': 'No transfers provided'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            if len(transfers_data) > 50:  # Limit to 50 transfers per bulk request
+            inline_max_items = getattr(django_settings, 'BULK_TRANSFER_INLINE_MAX_ITEMS', 50)
+            if queue_available():
+                max_items = getattr(django_settings, 'BULK_TRANSFER_MAX_ITEMS', 5000)
+            else:
+                # Without a worker the whole job runs in this request
+                max_items = inline_max_items
+            if len(transfers_data) > max_items:
                 return Response({
-                    'error': 'Maximum 50 transfers allowed per bulk request'
+                    'error': f'Maximum {max_items} transfers allowed per bulk request'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Generate bulk transfer ID
-            bulk_transfer_id = str(uuid.uuid4())
-            
-            created_transfers = []
+            # Validate each transfer; account, balance and fee checks happen in the bulk engine
+            items = []
             failed_transfers = []
+            for index, transfer_data in enumerate(transfers_data):
+                serializer = self.get_serializer(data=transfer_data)
+                try:
+                    amount = Decimal(str(transfer_data.get('amount')))
+                except Exception:
+                    amount = None
+                if not serializer.is_valid():
+                    failed_transfers.append({'index': index, 'errors': serializer.errors})
+                elif amount is None or not amount.is_finite() or amount <= 0:
+                    failed_transfers.append({'index': index, 'error': 'A positive amount is required'})
+                else:
+                    validated = serializer.validated_data
+                    items.append({
+                        'account_number': str(validated['account_number']).strip(),
+                        'account_name': transfer_data.get('account_name', ''),
+                        'bank_code': validated.get('bank_code') or '',
+                        'bank_name': validated['bank_name'],
+                        'amount': amount,
+                        'description': validated.get('description', ''),
+                    })
             
-            with transaction.atomic():
-                for index, transfer_data in enumerate(transfers_data):
-                    try:
-                        # Validate each transfer
-                        serializer = self.get_serializer(data=transfer_data)
-                        if serializer.is_valid():
-                            # Create transfer with bulk metadata
-                            transfer = serializer.save(
-                                user=request.user,
-                                is_bulk=True,
-                                bulk_transfer_id=bulk_transfer_id,
-                                bulk_index=index,
-                                metadata={
-                                    **transfer_data.get('metadata', {}),
-                                    'bulk_transfer_id': bulk_transfer_id,
-                                    'bulk_index': index
-                                }
-                            )
-                            created_transfers.append({
-                                'index': index,
-                                'transfer_id': str(transfer.id),
-                                'status': transfer.status
-                            })
-                        else:
-                            failed_transfers.append({
-                                'index': index,
-                                'errors': serializer.errors
-                            })
-                    except Exception as e:
-                        failed_transfers.append({
-                            'index': index,
-                            'error': str(e)
-                        })
+            if failed_transfers:
+                return Response({
+                    'error': 'Some transfers are invalid',
+                    'failed_transfers': failed_transfers
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            bulk_transfer = BulkTransferService.create_bulk_transfer(
+                request.user,
+                request.data.get('title') or f"Bulk transfer ({len(items)} recipients)",
+                request.data.get('description', ''),
+                items,
+            )
+            
+            if not enqueue(process_bulk_transfer_job, str(bulk_transfer.id)):
+                if len(items) > inline_max_items:
+                    # The broker is configured but unreachable; too large to run in the request
+                    BulkTransfer.objects.filter(pk=bulk_transfer.pk, status='pending').update(
+                        status='cancelled', updated_at=timezone.now()
+                    )
+                    return Response({
+                        'error': 'Bulk transfers cannot be queued right now. Please try again later.'
+                    }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                # No task queue available: run the job in the request as before
+                result = BulkTransferService.process_bulk_transfer(bulk_transfer)
+                bulk_transfer.refresh_from_db()
+                data = {
+                    'job_id': str(bulk_transfer.id),
+                    'bulk_transfer_id': str(bulk_transfer.id),
+                    'status': bulk_transfer.status,
+                    'total_transfers': len(items),
+                    'total_amount': str(bulk_transfer.total_amount.amount),
+                    'success_count': bulk_transfer.completed_count,
+                    'failure_count': bulk_transfer.failed_count,
+                    'status_url': f"{request.path.rstrip('/')}/{bulk_transfer.id}/"
+                }
+                if result.get('error'):
+                    data['error'] = result['error']
+                return Response(data, status=status.HTTP_200_OK)
             
             return Response({
-                'bulk_transfer_id': bulk_transfer_id,
-                'total_transfers': len(transfers_data),
-                'created_transfers': created_transfers,
-                'failed_transfers': failed_transfers,
-                'success_count': len(created_transfers),
-                'failure_count': len(failed_transfers)
-            }, status=status.HTTP_200_OK)
+                'job_id': str(bulk_transfer.id),
+                'bulk_transfer_id': str(bulk_transfer.id),
+                'status': bulk_transfer.status,
+                'total_transfers': len(items),
+                'total_amount': str(bulk_transfer.total_amount.amount),
+                'status_url': f"{request.path.rstrip('/')}/{bulk_transfer.id}/"
+            }, status=status.HTTP_202_ACCEPTED)
             
         except Exception as e:
             logger.error(f"Error creating bulk transfers: {str(e)}")
@@ -959,6 +1012,25 @@ class BankTransferViewSet(ModelViewSet):
                 'error': 'Bulk transfer creation failed'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['get'], url_path=r'bulk-transfer/(?P<job_id>[0-9a-f-]+)')
+    def bulk_transfer_status(self, request, job_id=None):
+        """
+        Poll the progress of a queued bulk transfer.
+        """
+        from .models import BulkTransfer
+        from .bulk_transfer_services import BulkTransferProgress
+
+        queryset = BulkTransfer.objects.all() if request.user.is_staff else BulkTransfer.objects.filter(user=request.user)
+        bulk_transfer = get_object_or_404(queryset, pk=job_id)
+        progress = BulkTransferProgress.snapshot(bulk_transfer)
+        if request.query_params.get('include_items') == 'true':
+            progress['failed_items'] = list(
+                bulk_transfer.items.filter(status=TransferStatus.FAILED)
+                .order_by('bulk_index')
+                .values('bulk_index', 'account_number', 'error_message')
+            )
+        return Response(progress, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['get'], url_path='transfer-limits')
     def transfer_limits(self, request):
         """
@@ -1499,26 +1571,34 @@ class BankViewSet(ReadOnlyModelViewSet):
     ordering = ['name']
     queryset = Bank.objects.all()
 
+    def list(self, request, *args, **kwargs):
+        """Full directory from the in-memory snapshot (ETag/304, pre-compressed)."""
+        if 'search' in request.query_params:
+            return Response(BankDirectory.search(request.query_params['search']))
+        if request.query_params.keys() & {'code', 'ordering'}:
+            return super().list(request, *args, **kwargs)
+        return BankDirectory.response(request, 'list')
+
+    def retrieve(self, request, *args, **kwargs):
+        bank = BankDirectory.snapshot().get(kwargs.get(self.lookup_url_kwarg or self.lookup_field))
+        if bank is None:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(bank)
+
     @action(detail=False, methods=['get'])
     def search(self, request):
-        """Search banks by name or code."""
+        """Search banks by name or code prefix."""
         query = request.query_params.get('q', '').strip()
         if not query:
             return Response({'detail': 'Query parameter "q" is required'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        banks = Bank.objects.filter(
-            Q(name__icontains=query) | Q(code__icontains=query)
-        ).order_by('name')[:20]  # Limit to 20 results
-        
-        serializer = self.get_serializer(banks, many=True)
-        return Response(serializer.data)
+        return Response(BankDirectory.search(query))
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def download_pdf_statement(request):
     """
-    Download a PDF statement for the authenticated user.
+    Download a PDF (or streamed CSV) statement for the authenticated user.
     Query params:
       - date_from (YYYY-MM-DD, required)
       - date_to (YYYY-MM-DD, required)
@@ -1527,69 +1607,92 @@ def download_pdf_statement(request):
       - channel (optional)
       - status (optional)
       - meta_key/meta_value (optional, filter by metadata key/value)
+      - file_format (optional, pdf or csv; default pdf)
+    PDFs are rendered in the background: the first request returns 202 and the user
+    is notified when the file is ready; repeating the same request then downloads it.
     """
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
-    min_amount = request.GET.get('min_amount')
-    max_amount = request.GET.get('max_amount')
-    channel = request.GET.get('channel')
-    status_ = request.GET.get('status')
-    meta_key = request.GET.get('meta_key')
-    meta_value = request.GET.get('meta_value')
-    if not date_from or not date_to:
+    from .statement_services import StatementService
+
+    params = StatementService.normalize_params(request.GET)
+    file_format = request.GET.get('file_format', 'pdf').lower()
+    if file_format not in ('pdf', 'csv'):
+        return Response({'detail': 'file_format must be pdf or csv.', 'doc': download_pdf_statement.__doc__}, status=status.HTTP_400_BAD_REQUEST)
+    if not params.get('date_from') or not params.get('date_to'):
         return Response({'detail': 'date_from and date_to are required (YYYY-MM-DD).', 'doc': download_pdf_statement.__doc__}, status=status.HTTP_400_BAD_REQUEST)
     try:
-        from_date = timezone.datetime.strptime(date_from, '%Y-%m-%d').date()
-        to_date = timezone.datetime.strptime(date_to, '%Y-%m-%d').date()
+        from_date = timezone.datetime.strptime(params['date_from'], '%Y-%m-%d').date()
+        to_date = timezone.datetime.strptime(params['date_to'], '%Y-%m-%d').date()
     except Exception:
         return Response({'detail': 'Invalid date format. Use YYYY-MM-DD.', 'doc': download_pdf_statement.__doc__}, status=status.HTTP_400_BAD_REQUEST)
     try:
-        wallet = Wallet.objects.get(user=request.user)
+        wallet = Wallet.objects.select_related('user').get(user=request.user)
     except Wallet.DoesNotExist:
         return Response({'detail': 'Wallet not found.'}, status=status.HTTP_404_NOT_FOUND)
-    txs = Transaction.objects.filter(wallet=wallet, timestamp__date__gte=from_date, timestamp__date__lte=to_date)
-    if min_amount:
-        txs = txs.filter(amount__gte=float(min_amount))
-    if max_amount:
-        txs = txs.filter(amount__lte=float(max_amount))
-    if channel:
-        txs = txs.filter(channel=channel)
-    if status_:
-        txs = txs.filter(status=status_)
-    if meta_key and meta_value:
-        txs = txs.filter(metadata__contains={meta_key: meta_value})
-    txs = txs.order_by('timestamp')
-    if not txs.exists():
-        return Response({'detail': 'No transactions in selected range.'}, status=status.HTTP_404_NOT_FOUND)
-    opening_balance = txs.first().balance_after - txs.first().amount if txs.first().balance_after is not None else 0
-    closing_balance = txs.last().balance_after if txs.last().balance_after is not None else 0
-    total_credits = sum(t.amount for t in txs if t.type == 'credit')
-    total_debits = sum(t.amount for t in txs if t.type == 'debit')
-    html = render_to_string('bank/statement_pdf.html', {
-        'user': request.user,
-        'wallet': wallet,
-        'transactions': txs,
-        'date_from': from_date,
-        'date_to': to_date,
-        'opening_balance': opening_balance,
-        'closing_balance': closing_balance,
-        'total_credits': total_credits,
-        'total_debits': total_debits,
-        'now': timezone.now(),
-    })
     try:
-        # Try to generate PDF if weasyprint is available
-        from weasyprint import HTML
-        pdf_file = HTML(string=html).write_pdf()
-        response = HttpResponse(pdf_file, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename=statement_{wallet.account_number}_{from_date}_{to_date}.pdf'
+        txs = StatementService.get_queryset(wallet, params, from_date, to_date)
+        summary = StatementService.summarize(txs)
+    except ValueError:
+        return Response({'detail': 'min_amount and max_amount must be numbers.'}, status=status.HTTP_400_BAD_REQUEST)
+    if not summary['count']:
+        return Response({'detail': 'No transactions in selected range.'}, status=status.HTTP_404_NOT_FOUND)
+    digest = StatementService.content_hash(wallet, params, summary, file_format)
+
+    if file_format == 'csv':
+        etag = f'"{digest}"'
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+        response = StreamingHttpResponse(StatementService.stream_csv(txs), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename={StatementService.filename(wallet, params, "csv")}'
+        response['ETag'] = etag
         return response
+
+    path = StatementService.stored_pdf(digest)
+    if path:
+        return FileResponse(
+            default_storage.open(path, 'rb'),
+            as_attachment=True,
+            filename=StatementService.filename(wallet, params, 'pdf'),
+            content_type='application/pdf',
+        )
+
+    accepted = Response({
+        'detail': 'Your statement is being generated. You will be notified when it is ready; repeat this request to download it.',
+        'statement_id': digest,
+    }, status=status.HTTP_202_ACCEPTED)
+    if not StatementService.mark_pending(digest):
+        return accepted
+    from .tasks import generate_statement_pdf
+    if enqueue(generate_statement_pdf, str(wallet.id), params, digest, request.get_full_path()):
+        return accepted
+
+    # No task queue available: render in the request as before
+    try:
+        path = StatementService.render_pdf(wallet, params, digest)
     except ImportError:
         # Fallback if weasyprint is not available
         return Response({
             'detail': 'PDF generation is not available. Please contact support.',
-            'html_content': html  # Return HTML content as fallback
+            'html_content': StatementService.render_html(request.user, wallet, txs, from_date, to_date, summary)
         }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    finally:
+        StatementService.clear_pending(digest)
+    return FileResponse(
+        default_storage.open(path, 'rb'),
+        as_attachment=True,
+        filename=StatementService.filename(wallet, params, 'pdf'),
+        content_type='application/pdf',
+    )
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def notification_metrics(request):
+    """Per-channel send counts, deduplication and batch latency of the notification dispatcher."""
+    from .notification_dispatch_services import NotificationDispatcher
+
+    return Response({'channels': NotificationDispatcher.metrics()})
 
 
 class StaffRoleViewSet(ReadOnlyModelViewSet):
@@ -2133,11 +2236,19 @@ class TransferFailureViewSet(ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'], url_path='summary')
     def failure_summary(self, request):
         """Get summary statistics of transfer failures."""
+        from django.db.models.functions import TruncDate
         queryset = self.get_queryset()
+        week_ago = timezone.now() - timezone.timedelta(days=7)
         
         # Get failure statistics
-        total_failures = queryset.count()
-        resolved_failures = queryset.filter(is_resolved=True).count()
+        totals = queryset.aggregate(
+            total=Count('id'),
+            resolved=Count('id', filter=Q(is_resolved=True)),
+            recent=Count('id', filter=Q(failed_at__gte=week_ago)),
+        )
+        total_failures = totals['total']
+        resolved_failures = totals['resolved']
+        recent_failures = totals['recent']
         unresolved_failures = total_failures - resolved_failures
         
         # Get failure breakdown by error code
@@ -2154,10 +2265,15 @@ class TransferFailureViewSet(ReadOnlyModelViewSet):
             unresolved_count=Count('id', filter=Q(is_resolved=False))
         ).order_by('-count')
         
-        # Get recent failures (last 7 days)
-        recent_failures = queryset.filter(
-            failed_at__gte=timezone.now() - timezone.timedelta(days=7)
-        ).count()
+        # Recent failures per day, from the same queryset as the totals
+        daily_failures = [
+            {'date': row['day'].strftime('%Y-%m-%d'), 'count': row['count']}
+            for row in queryset.filter(failed_at__gte=week_ago)
+            .annotate(day=TruncDate('failed_at'))
+            .values('day')
+            .annotate(count=Count('id'))
+            .order_by('day')
+        ]
         
         return Response({
             'summary': {
@@ -2168,7 +2284,8 @@ class TransferFailureViewSet(ReadOnlyModelViewSet):
                 'recent_failures_7_days': recent_failures
             },
             'error_code_breakdown': list(error_code_stats),
-            'category_breakdown': list(category_stats)
+            'category_breakdown': list(category_stats),
+            'daily_failures': daily_failures
         })
 
     @action(detail=True, methods=['post'], url_path='mark-resolved')
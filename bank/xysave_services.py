@@ -12,6 +12,7 @@ from .models import (
     XySaveInvestment, XySaveSettings, Wallet
 )
 from .interest_services import InterestRateCalculator
+from .ledger_services import WalletLedger
 logger = logging.getLogger(__name__)
 
 
@@ -144,8 +145,7 @@ class XySaveTransactionService:
                 xysave_transaction.save()
                 
                 # Update balances
-                wallet.balance -= amount
-                wallet.save()
+                WalletLedger.debit(wallet, amount)
                 
                 xysave_account.balance += amount
                 xysave_account.save()
@@ -191,8 +191,7 @@ class XySaveTransactionService:
                 xysave_account.balance -= amount
                 xysave_account.save()
                 
-                wallet.balance += amount
-                wallet.save()
+                WalletLedger.credit(wallet, amount)
                 
                 logger.info(f"Withdrew {amount} from XySave account {xysave_account.account_number}")
                 return xysave_transaction
@@ -473,28 +472,17 @@ class XySaveInterestService:
     """Service for managing XySave interest calculations and payouts"""
     
     @staticmethod
-    def calculate_daily_interest_for_all_accounts():
-        """Calculate and credit daily interest for all active accounts"""
+    def calculate_daily_interest_for_all_accounts(accrual_date=None, chunk_size=None):
+        """
+        Calculate and credit daily interest for all active accounts.
+        Delegates to the batched engine, which credits accounts chunk by chunk
+        and resumes from its checkpoint if a previous run was interrupted.
+        """
+        from .interest_batch_services import BatchInterestAccrualService
         try:
-            active_accounts = XySaveAccount.objects.filter(is_active=True, balance__gt=0)
-            
-            for account in active_accounts:
-                try:
-                    daily_interest = account.calculate_daily_interest()
-                    
-                    if daily_interest.amount > 0:
-                        XySaveTransactionService.credit_interest(
-                            account.user,
-                            daily_interest,
-                            f"Daily interest credit ({account.get_annual_interest_rate():.2f}% p.a.)"
-                        )
-                        
-                except Exception as e:
-                    logger.error(f"Error calculating interest for account {account.account_number}: {str(e)}")
-                    continue
-            
-            logger.info(f"Processed daily interest for {active_accounts.count()} accounts")
-            
+            return BatchInterestAccrualService.accrue_product(
+                'xysave', accrual_date=accrual_date, chunk_size=chunk_size
+            )
         except Exception as e:
             logger.error(f"Error in daily interest calculation: {str(e)}")
             raise
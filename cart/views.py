@@ -12,6 +12,7 @@ from .serializers import (
     CartSummarySerializer, CartBulkUpdateSerializer, SimpleStoreSerializer
 )
 from product.models import Product, ProductVariant
+from product.search_services import ProductSearch
 from store.models import Store
 import logging
 
@@ -393,8 +394,7 @@ class CartViewSet(viewsets.ModelViewSet):
 
         try:
             cart_items = self.get_queryset().filter(
-                Q(product__name__icontains=query) |
-                Q(product__description__icontains=query) |
+                Q(product__in=ProductSearch.filter(Product.objects.all(), query)) |
                 Q(store__name__icontains=query) |
                 Q(variant__name__icontains=query)
             )
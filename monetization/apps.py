@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class MonetizationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'apps.monetization'
\ No newline at end of file
+    name = 'apps.monetization'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -1,16 +1,105 @@
+from bisect import bisect_left
 from decimal import Decimal
 import random
 import string
+from typing import List, NamedTuple, Optional
 from django.utils import timezone
 from django.db import transaction
-from django.db.models import Q, Sum
+from django.db.models import Sum
 from djmoney.money import Money
 
 from .models import (
-    FeeStructure, FeeRule, DiscountCode, DiscountUsage,
+    FeeRule, DiscountCode, DiscountUsage,
     ReferralProgram, ReferralCode, Referral,
     SubscriptionPlan, UserSubscription, SubscriptionTransaction
 )
+from bank.config_cache import VersionedConfigCache, table_version
+
+
+class CompiledFeeRule(NamedTuple):
+    id: str
+    name: str
+    rule_type: str
+    fixed_amount: Optional[Decimal]
+    percentage: Optional[Decimal]
+    cap_amount: Optional[Decimal]
+    min_fee: Optional[Decimal]
+    min_amount: Optional[Decimal]
+    max_amount: Optional[Decimal]
+
+    def applies_to(self, amount: Decimal) -> bool:
+        return ((self.min_amount is None or self.min_amount <= amount)
+                and (self.max_amount is None or amount <= self.max_amount))
+
+
+class FeeRuleTable:
+    """
+    Active fee rules of one transaction type compiled into a sorted interval table.
+    The rule bounds split the amount axis into the bound points themselves and the
+    open gaps between them; each slot stores its applicable rules in priority order,
+    so a lookup is one bisect.
+    """
+
+    def __init__(self, rules: List[CompiledFeeRule]):
+        points = sorted({bound for rule in rules for bound in (rule.min_amount, rule.max_amount) if bound is not None})
+        self.points = points
+        # Slot 2*i is the gap below points[i], slot 2*i + 1 is points[i] itself
+        self.slots = []
+        for index in range(len(points) + 1):
+            if not points:
+                sample = Decimal('0')
+            elif index == 0:
+                sample = points[0] - 1
+            elif index == len(points):
+                sample = points[-1] + 1
+            else:
+                sample = (points[index - 1] + points[index]) / 2
+            self.slots.append(tuple(rule for rule in rules if rule.applies_to(sample)))
+            if index < len(points):
+                self.slots.append(tuple(rule for rule in rules if rule.applies_to(points[index])))
+
+    def rules_for(self, amount: Decimal):
+        index = bisect_left(self.points, amount)
+        if index < len(self.points) and self.points[index] == amount:
+            return self.slots[2 * index + 1]
+        return self.slots[2 * index]
+
+
+def _money_amount(value) -> Optional[Decimal]:
+    return value.amount if value is not None else None
+
+
+def _load_fee_rule_tables():
+    """Compile the active rules of active fee structures into one table per transaction type."""
+    rules = FeeRule.objects.filter(fee_structure__is_active=True, is_active=True).order_by('-priority', 'name')
+    by_type = {}
+    for rule in rules:
+        by_type.setdefault(rule.transaction_type, []).append((rule.priority, rule.name, CompiledFeeRule(
+            id=str(rule.id),
+            name=rule.name,
+            rule_type=rule.rule_type,
+            fixed_amount=_money_amount(rule.fixed_amount),
+            percentage=rule.percentage,
+            cap_amount=_money_amount(rule.cap_amount),
+            min_fee=_money_amount(rule.min_fee),
+            min_amount=_money_amount(rule.min_amount),
+            max_amount=_money_amount(rule.max_amount),
+        )))
+
+    def merged(transaction_type):
+        entries = by_type.get('all', []) + (by_type.get(transaction_type, []) if transaction_type != 'all' else [])
+        return [entry[2] for entry in sorted(entries, key=lambda entry: (-entry[0], entry[1]))]
+
+    tables = {transaction_type: FeeRuleTable(merged(transaction_type)) for transaction_type in by_type}
+    tables['all'] = FeeRuleTable(merged('all'))
+    return tables
+
+
+# Compiled fee rules; rebuilt when fee structures or rules change in any process
+fee_rule_cache = VersionedConfigCache(
+    'monetization_fee_rules', _load_fee_rule_tables,
+    probe=table_version('monetization.FeeStructure', 'monetization.FeeRule'),
+)
 
 
 class FeeService:
@@ -29,66 +118,44 @@ class FeeService:
         Returns:
             dict: Dictionary containing fee details
         """
-        # Get active fee structures and rules
-        fee_structures = FeeStructure.objects.filter(is_active=True)
-        
-        # If no fee structures, return zero fee
-        if not fee_structures.exists():
-            return {
-                'fee_amount': Money(0, amount.currency),
-                'original_amount': amount,
-                'total_amount': amount,
-                'discount_applied': False,
-                'discount_amount': Money(0, amount.currency),
-                'rules_applied': []
-            }
-        
-        # Get applicable rules
-        rules = FeeRule.objects.filter(
-            fee_structure__in=fee_structures,
-            is_active=True
-        ).filter(
-            Q(transaction_type='all') | Q(transaction_type=transaction_type)
-        ).filter(
-            Q(min_amount__isnull=True) | Q(min_amount__lte=amount)
-        ).filter(
-            Q(max_amount__isnull=True) | Q(max_amount__gte=amount)
-        ).order_by('-priority')
+        # Applicable rules come from the compiled in-process table, not the database
+        tables = fee_rule_cache.get()
+        table = tables.get(transaction_type) or tables['all']
         
         # Calculate fee based on rules
-        fee_amount = Money(0, amount.currency)
+        fee_total = Decimal('0')
         rules_applied = []
         
-        for rule in rules:
-            rule_fee = Money(0, amount.currency)
+        for rule in table.rules_for(amount.amount):
+            rule_fee = Decimal('0')
             
             if rule.rule_type == 'fixed':
                 if rule.fixed_amount:
-                    rule_fee = Money(rule.fixed_amount.amount, amount.currency)
+                    rule_fee = rule.fixed_amount
             
             elif rule.rule_type == 'percentage':
                 if rule.percentage:
-                    rule_fee = Money(amount.amount * (rule.percentage / Decimal('100')), amount.currency)
+                    rule_fee = amount.amount * (rule.percentage / Decimal('100'))
             
             elif rule.rule_type == 'capped_percentage':
                 if rule.percentage and rule.cap_amount:
                     calculated_fee = amount.amount * (rule.percentage / Decimal('100'))
-                    capped_amount = min(calculated_fee, rule.cap_amount.amount)
-                    rule_fee = Money(capped_amount, amount.currency)
+                    rule_fee = min(calculated_fee, rule.cap_amount)
             
             elif rule.rule_type == 'minimum_fee':
-                if rule.min_fee and fee_amount < rule.min_fee:
-                    rule_fee = Money(rule.min_fee.amount - fee_amount.amount, amount.currency)
+                if rule.min_fee and fee_total < rule.min_fee:
+                    rule_fee = rule.min_fee - fee_total
             
             # Add rule fee to total fee
-            if rule_fee.amount > 0:
-                fee_amount += rule_fee
+            if rule_fee > 0:
+                fee_total += rule_fee
                 rules_applied.append({
-                    'rule_id': str(rule.id),
+                    'rule_id': rule.id,
                     'rule_name': rule.name,
                     'rule_type': rule.rule_type,
-                    'fee_amount': rule_fee
+                    'fee_amount': Money(rule_fee, amount.currency)
                 })
+        fee_amount = Money(fee_total, amount.currency)
         
         # Apply discount if provided
         discount_applied = False
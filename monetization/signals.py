@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import FeeStructure, FeeRule
+from .services import fee_rule_cache
+
+
+@receiver(post_save, sender=FeeStructure)
+@receiver(post_delete, sender=FeeStructure)
+@receiver(post_save, sender=FeeRule)
+@receiver(post_delete, sender=FeeRule)
+def invalidate_fee_rule_cache(sender, instance, **kwargs):
+    """Recompile this process's fee rule tables once the change commits; others pick it up through the version probe."""
+    transaction.on_commit(fee_rule_cache.invalidate)
@@ -19,4 +19,8 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             "title": event["title"],
             "message": event["message"],
             "extra_data": event.get("extra_data", {}),
-        })) 
\ No newline at end of file
+        }))
+
+    async def notify_batch(self, event):
+        for message in event["messages"]:
+            await self.notify(message) 
\ No newline at end of file
@@ -253,6 +253,25 @@ class Notification(models.Model):
         verbose_name=_('Extra Data'),
         help_text=_('Additional data for this notification (JSON format)')
     )
+    # --- Out-of-band delivery (claimed before sending, so a redelivered event skips them) ---
+    email_sent_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('Email Sent At'),
+        help_text=_('Timestamp when the email copy of this notification was sent')
+    )
+    sms_sent_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('SMS Sent At'),
+        help_text=_('Timestamp when the SMS copy of this notification was sent')
+    )
+    push_sent_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name=_('Push Sent At'),
+        help_text=_('Timestamp when the push copy of this notification was sent')
+    )
     created_at = models.DateTimeField(
         auto_now_add=True,
         verbose_name=_('Created At'),
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product, ProductVariant, Category, SubCategory, ProductReview, Coupon, CouponUsage, FlashSale, FlashSaleItem, ProductDiscount
+from .models import Product, ProductVariant, Category, SubCategory, ProductReview, Coupon, CouponUsage, FlashSale, FlashSaleItem, ProductDiscount, ProductSimilarity
 from django.utils import timezone
 from django.utils.html import format_html
 from django import forms
@@ -351,3 +351,10 @@ admin.site.register(CouponUsage)
 admin.site.register(FlashSale)
 admin.site.register(FlashSaleItem)
 
+
+@admin.register(ProductSimilarity)
+class ProductSimilarityAdmin(admin.ModelAdmin):
+    list_display = ('product', 'similar', 'same_store', 'rank', 'score', 'updated_at')
+    list_filter = ('same_store',)
+    search_fields = ('product__name', 'similar__name')
+    raw_id_fields = ('product', 'similar')
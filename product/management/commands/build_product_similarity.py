@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from product.similarity_services import ProductSimilarityService
+
+
+class Command(BaseCommand):
+    help = 'Build the similar-products index (all products, or the stores/categories of the given products).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', action='append', dest='products', help='Product id (repeatable)')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['products']:
+            count = ProductSimilarityService.rebuild(options['products'])
+        else:
+            count = ProductSimilarityService.rebuild_all()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} neighbour rows in {elapsed:.1f} s"))
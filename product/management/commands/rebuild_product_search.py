@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from product.search_services import ProductSearch
+
+
+class Command(BaseCommand):
+    help = 'Create the product search indexes (Postgres) and reindex every product.'
+
+    def handle(self, *args, **options):
+        backend = ProductSearch.backend()
+        backend.prepare()
+        indexed = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products with {type(backend).__name__}"))
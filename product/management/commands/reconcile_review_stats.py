@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from product.review_services import ProductReviewStatsService
+
+
+class Command(BaseCommand):
+    help = 'Recompute product and store review counts/rating sums from the review table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', action='append', dest='products', help='Product id (repeatable); defaults to all products')
+
+    def handle(self, *args, **options):
+        products, stores = ProductReviewStatsService.reconcile(options['products'])
+        self.stdout.write(self.style.SUCCESS(f"Reconciled review aggregates: {products} products and {stores} stores updated"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from product.models import Product
+from product.pricing_services import ProductPricingService
+
+
+class Command(BaseCommand):
+    help = 'Recompute effective prices for products (all products, or only those due with --due).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--due', action='store_true', help='Only products past a discount boundary or never priced')
+
+    def handle(self, *args, **options):
+        if options['due']:
+            repriced = ProductPricingService.sweep()
+        else:
+            repriced = ProductPricingService.refresh(Product.objects.values_list('id', flat=True))
+        self.stdout.write(self.style.SUCCESS(f"Repriced {repriced} products"))
@@ -13,6 +13,7 @@ from decimal import Decimal
 from store.models import Store
 import secrets
 from django.utils.text import slugify
+from django.contrib.postgres.search import SearchVectorField
 
 # Category model
 class Category(models.Model):
@@ -98,6 +99,21 @@ class Product(models.Model):
     is_deleted = models.BooleanField(default=False, db_index=True)
     deleted_at = models.DateTimeField(null=True, blank=True)
 
+    # Maintained by ProductPricingService; never edited directly
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False, db_index=True)
+    on_sale = models.BooleanField(default=False, editable=False, db_index=True)
+    active_discount = models.ForeignKey(
+        'ProductDiscount', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='+'
+    )
+    price_valid_until = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
+
+    # Weighted name/brand/description tsvector kept by the Postgres search backend
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+
+    # Review aggregates maintained by ProductReviewStatsService; never edited directly
+    review_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+
 
     def __str__(self):
         return f"{self.name} - {self.store.name}"
@@ -152,32 +168,29 @@ class Product(models.Model):
             self.save(update_fields=['is_deleted', 'deleted_at'])
 
     @property
-    def active_discount(self):
-        """Get the currently active discount for this product"""
-        return self.discounts.filter(is_active=True).first()
-    
+    def price_is_stale(self):
+        """True once a discount or flash sale window has opened or closed since the last repricing"""
+        return self.price_valid_until is not None and self.price_valid_until <= timezone.now()
+
     @property
-    def on_sale(self):
-        """Check if product has an active discount"""
-        return self.active_discount is not None
-    
+    def average_rating(self):
+        """Mean review rating (0.0 without reviews)"""
+        if not self.review_count:
+            return 0.0
+        return round(self.rating_sum / self.review_count, 2)
+
     @property
     def current_price(self):
-        """Calculate current price based on active discount"""
-        if not self.on_sale:
-            return self.base_price
-        
-        discount = self.active_discount
-        final_price = discount.calculate_discount_price(self.base_price)
-        
-        # Ensure proper decimal formatting
-        from decimal import Decimal, ROUND_HALF_UP
-        return Decimal(str(final_price)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        """Effective price kept by the discount engine (computed live if not yet repriced)"""
+        if self.effective_price is None or self.price_is_stale:
+            from .pricing_services import ProductPricingService
+            ProductPricingService.price_in_memory(self)
+        return self.effective_price
     
     @property
     def discount_percentage(self):
         """Get discount percentage if applicable"""
-        if self.on_sale and self.active_discount.discount_type == 'percentage':
+        if self.active_discount_id and self.active_discount.discount_type == 'percentage':
             return self.active_discount.discount_value
         return 0
     
@@ -385,6 +398,9 @@ class ProductVariant(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Maintained by ProductPricingService alongside the product's price
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False, db_index=True)
+
     def __str__(self):
         return f"{self.product.name} - {self.name}"
 
@@ -422,24 +438,11 @@ class ProductVariant(models.Model):
     
     @property
     def current_price(self):
-        """Calculate current price based on pricing mode and product discounts"""
-        if self.pricing_mode == 'individual':
-            # Use individual price directly
-            base_price = self.individual_price
-        else:
-            # Use product base price + adjustment
-            base_price = self.product.base_price + self.price_adjustment
-        
-        # Apply product-level discounts if any
-        if self.product.on_sale:
-            discount = self.product.active_discount
-            final_price = discount.calculate_discount_price(base_price)
-        else:
-            final_price = base_price
-        
-        # Ensure proper decimal formatting
-        from decimal import Decimal, ROUND_HALF_UP
-        return Decimal(str(final_price)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        """Effective price kept by the discount engine (computed live if not yet repriced)"""
+        if self.effective_price is None or self.product.price_is_stale:
+            from .pricing_services import ProductPricingService
+            ProductPricingService.price_in_memory(self.product, variants=[self])
+        return self.effective_price
     
     @property
     def base_price(self):
@@ -473,6 +476,35 @@ class ProductReview(models.Model):
     def __str__(self):
         return f'Review for {self.product.name} by {self.user.username}'
 
+class ProductSimilarity(models.Model):
+    """Precomputed nearest neighbours of a product (built by ProductSimilarityService)."""
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+        verbose_name=_('ID')
+    )
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similarity_links')
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    # Neighbours from the product's own store and from other stores are ranked separately
+    same_store = models.BooleanField(default=True)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    reasons = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['rank']
+        unique_together = ('product', 'similar')
+        indexes = [
+            models.Index(fields=['product', 'same_store', 'rank']),
+        ]
+        verbose_name = _('Product Similarity')
+        verbose_name_plural = _('Product Similarities')
+
+    def __str__(self):
+        return f"{self.product_id} ~ {self.similar_id} ({self.score})"
+
 class Coupon(models.Model):
     id = models.UUIDField(
         primary_key=True,
@@ -0,0 +1,8 @@
+from rest_framework.pagination import PageNumberPagination
+
+
+class ProductSearchPagination(PageNumberPagination):
+    """Pages over ranked search results (?page=, ?page_size=)."""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,191 @@
+"""
+Discount engine for product and variant prices.
+
+The price a shopper pays depends on the product's active ProductDiscount and on
+any running FlashSale item, which used to be resolved with extra queries every
+time current_price/on_sale was read. The engine materializes the result instead:
+Product.effective_price, on_sale and active_discount, and
+ProductVariant.effective_price, so price filters and sorting run on indexed
+columns and serializers read plain fields.
+
+Products are repriced when their discounts, flash sales, base price or variants
+change (after the transaction commits), and price_valid_until records the next
+discount/flash-sale start or end so the sweep reprices products whose window has
+opened or closed. Product views run the sweep lazily (sweep_if_due, at most once
+per PRODUCT_PRICE_SWEEP_INTERVAL seconds per process) before reading prices, so
+expired sales drop out of price filters, sorting and ?on_sale= without a
+scheduler; the Celery beat entry can still run it when a broker is configured.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Iterable, List
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import FlashSaleItem, Product, ProductDiscount, ProductVariant
+
+logger = logging.getLogger(__name__)
+
+_sweep_state = {'at': 0.0}
+_sweep_lock = threading.Lock()
+
+
+def _quantize(value) -> Decimal:
+    return Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+class ProductPricingService:
+    """Computes and persists effective prices."""
+
+    BATCH_SIZE = 500
+    DEFAULT_SWEEP_INTERVAL = 15
+
+    @staticmethod
+    def _variant_base_price(variant, product):
+        if variant.pricing_mode == 'individual':
+            return variant.individual_price
+        return product.base_price + variant.price_adjustment
+
+    @classmethod
+    def _apply(cls, product, variants, discounts, flash_items, now):
+        """Set the engine's fields on `product` and `variants` in memory."""
+        boundaries = []
+        active_discount, price = None, product.base_price
+        for discount in discounts:
+            if discount.start_date > now:
+                boundaries.append(discount.start_date)
+                continue
+            boundaries.append(discount.end_date)
+            discounted = _quantize(discount.calculate_discount_price(product.base_price))
+            # The first valid discount counts even when it doesn't lower the unit price (e.g. BOGO)
+            if active_discount is None or discounted < price:
+                active_discount, price = discount, discounted
+
+        flash_prices = {}
+        for item in flash_items:
+            flash_sale = item.flash_sale
+            if flash_sale.start_time > now:
+                boundaries.append(flash_sale.start_time)
+                continue
+            boundaries.append(flash_sale.end_time)
+            if item.quantity_sold < item.quantity_available:
+                current = flash_prices.get(item.variant_id)
+                flash_prices[item.variant_id] = item.sale_price if current is None else min(current, item.sale_price)
+
+        if None in flash_prices:
+            price = min(price, flash_prices[None])
+        product.effective_price = _quantize(price)
+        product.active_discount = active_discount
+        product.on_sale = active_discount is not None or product.effective_price < product.base_price
+        product.price_valid_until = min(boundaries) if boundaries else None
+
+        for variant in variants:
+            base_price = cls._variant_base_price(variant, product)
+            if base_price is None:
+                variant.effective_price = None
+                continue
+            variant_price = active_discount.calculate_discount_price(base_price) if active_discount else base_price
+            if variant.id in flash_prices:
+                variant_price = min(variant_price, flash_prices[variant.id])
+            variant.effective_price = _quantize(variant_price)
+
+    @staticmethod
+    def _load(product_ids, now):
+        discounts, flash_items = defaultdict(list), defaultdict(list)
+        for discount in ProductDiscount.objects.filter(product_id__in=product_ids, is_active=True, end_date__gte=now):
+            discounts[discount.product_id].append(discount)
+        for item in FlashSaleItem.objects.filter(
+            product_id__in=product_ids, flash_sale__is_active=True, flash_sale__end_time__gte=now
+        ).select_related('flash_sale'):
+            flash_items[item.product_id].append(item)
+        return discounts, flash_items
+
+    @classmethod
+    def refresh(cls, product_ids: Iterable) -> int:
+        """Reprice the given products and their variants; returns the number of products repriced."""
+        product_ids = list(dict.fromkeys(product_ids))
+        now = timezone.now()
+        repriced = 0
+        for start in range(0, len(product_ids), cls.BATCH_SIZE):
+            batch = product_ids[start:start + cls.BATCH_SIZE]
+            products = list(Product.objects.filter(id__in=batch))
+            variants = defaultdict(list)
+            for variant in ProductVariant.objects.filter(product_id__in=batch):
+                variants[variant.product_id].append(variant)
+            discounts, flash_items = cls._load(batch, now)
+
+            for product in products:
+                cls._apply(product, variants[product.id], discounts[product.id], flash_items[product.id], now)
+            with transaction.atomic():
+                Product.objects.bulk_update(
+                    products, ['effective_price', 'on_sale', 'active_discount', 'price_valid_until']
+                )
+                ProductVariant.objects.bulk_update(
+                    [variant for group in variants.values() for variant in group], ['effective_price']
+                )
+            repriced += len(products)
+        return repriced
+
+    @classmethod
+    def price_in_memory(cls, product, variants: List = None):
+        """Compute prices for an unrepriced product (and variants) without saving them."""
+        now = timezone.now()
+        discounts, flash_items = cls._load([product.id], now)
+        cls._apply(product, variants or [], discounts[product.id], flash_items[product.id], now)
+
+    @classmethod
+    def schedule_refresh(cls, product_ids: Iterable):
+        """Reprice products after the current transaction commits, in one batch per transaction."""
+        pending = getattr(connection, 'pending_product_repricing', None)
+        if pending is None:
+            pending = connection.pending_product_repricing = set()
+        pending.update(product_ids)
+        if not any(callback[1] == cls._flush_scheduled for callback in connection.run_on_commit):
+            transaction.on_commit(cls._flush_scheduled)
+
+    @classmethod
+    def _flush_scheduled(cls):
+        product_ids = getattr(connection, 'pending_product_repricing', None)
+        connection.pending_product_repricing = None
+        if not product_ids:
+            return
+        try:
+            cls.refresh(product_ids)
+        except Exception as e:
+            logger.error(f"Error repricing {len(product_ids)} products: {str(e)}")
+            # Hand them to the next sweep
+            Product.objects.filter(id__in=product_ids).update(price_valid_until=timezone.now())
+
+    @classmethod
+    def sweep(cls) -> int:
+        """Reprice products whose discount/flash-sale window changed, and any never priced."""
+        product_ids = list(
+            Product.objects.filter(
+                Q(price_valid_until__lte=timezone.now()) | Q(effective_price__isnull=True)
+            ).values_list('id', flat=True)
+        )
+        repriced = cls.refresh(product_ids) if product_ids else 0
+        if repriced:
+            logger.info(f"Repriced {repriced} products at discount boundaries")
+        return repriced
+
+    @classmethod
+    def sweep_if_due(cls) -> int:
+        """Run sweep() if this process has not run it in the last PRODUCT_PRICE_SWEEP_INTERVAL seconds."""
+        interval = getattr(settings, 'PRODUCT_PRICE_SWEEP_INTERVAL', cls.DEFAULT_SWEEP_INTERVAL)
+        now = time.monotonic()
+        with _sweep_lock:
+            if now - _sweep_state['at'] < interval:
+                return 0
+            _sweep_state['at'] = now
+        try:
+            return cls.sweep()
+        except Exception as e:
+            # Reads fall back to the stored prices; the next due read retries
+            logger.error(f"Lazy price sweep failed: {str(e)}")
+            return 0
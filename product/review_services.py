@@ -0,0 +1,87 @@
+"""
+Denormalized review aggregates.
+
+Product and Store keep review_count and rating_sum so list endpoints can show
+a count and an average without loading review rows. ProductReview save/delete
+hooks apply the change as a single UPDATE ... SET col = col + delta in the same
+transaction as the review write; reconcile() recomputes the columns from the
+review table to repair any drift (raw SQL, bulk deletes, stale full saves).
+"""
+import logging
+from typing import Iterable, Optional
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from store.models import Store
+from .models import Product, ProductReview
+
+logger = logging.getLogger(__name__)
+
+
+class ProductReviewStatsService:
+    """Keeps Product/Store review_count and rating_sum in step with ProductReview."""
+
+    @staticmethod
+    def apply(product_id, count_delta: int, rating_delta: int):
+        """Add a review change to the product's and its store's aggregates."""
+        if not count_delta and not rating_delta:
+            return
+        changes = {'review_count': F('review_count') + count_delta, 'rating_sum': F('rating_sum') + rating_delta}
+        Product.objects.filter(pk=product_id).update(**changes)
+        Store.objects.filter(products__pk=product_id).update(**changes)
+
+    @classmethod
+    def review_saved(cls, review, previous: Optional[tuple] = None):
+        """`previous` is the stored (product_id, rating) before an update, None on create."""
+        if previous is None:
+            cls.apply(review.product_id, 1, review.rating)
+            return
+        previous_product_id, previous_rating = previous
+        if previous_product_id != review.product_id:
+            cls.apply(previous_product_id, -1, -previous_rating)
+            cls.apply(review.product_id, 1, review.rating)
+        else:
+            cls.apply(review.product_id, 0, review.rating - previous_rating)
+
+    @classmethod
+    def review_deleted(cls, review):
+        cls.apply(review.product_id, -1, -review.rating)
+
+    @staticmethod
+    def _reconcile(model, reviews, ids: Optional[Iterable]) -> int:
+        """Rewrite the aggregates of rows of `model` that differ from `reviews` (a correlated queryset)."""
+        actual_count = Coalesce(
+            Subquery(reviews.annotate(n=Count('pk')).values('n')), Value(0), output_field=IntegerField()
+        )
+        actual_sum = Coalesce(
+            Subquery(reviews.annotate(total=Sum('rating')).values('total')), Value(0), output_field=IntegerField()
+        )
+        rows = model.objects.all() if ids is None else model.objects.filter(pk__in=ids)
+        drifted = list(
+            rows.annotate(actual_count=actual_count, actual_sum=actual_sum)
+            .exclude(review_count=F('actual_count'), rating_sum=F('actual_sum'))
+            .values_list('pk', flat=True)
+        )
+        if drifted:
+            model.objects.filter(pk__in=drifted).update(review_count=actual_count, rating_sum=actual_sum)
+        return len(drifted)
+
+    @classmethod
+    def reconcile(cls, product_ids: Optional[Iterable] = None):
+        """
+        Recompute aggregates from the review table (every product and store, or just
+        `product_ids` and their stores). Returns (products fixed, stores fixed).
+        """
+        store_ids = None
+        if product_ids is not None:
+            product_ids = list(product_ids)
+            store_ids = set(Product.objects.filter(pk__in=product_ids).values_list('store_id', flat=True))
+        products = cls._reconcile(
+            Product, ProductReview.objects.filter(product=OuterRef('pk')).order_by().values('product'), product_ids
+        )
+        stores = cls._reconcile(
+            Store, ProductReview.objects.filter(product__store=OuterRef('pk')).order_by().values('product__store'), store_ids
+        )
+        if products or stores:
+            logger.warning(f"Reconciled review aggregates: {products} products, {stores} stores had drifted")
+        return products, stores
@@ -0,0 +1,94 @@
+"""
+Random samples of rows for the home screen.
+
+The home endpoints used to load a whole table and shuffle it in Python to show
+five rows. A RandomSampler instead keeps a pool of up to POOL_SIZE random
+primary keys in the shared cache, drawn by the database (ORDER BY random() over
+the primary keys only) at most once per POOL_TTL seconds. A request shuffles
+that pool with a per-user seed and slices a page out of it, so each request
+costs one small id__in query and pages stay stable for a user until the pool
+is rebuilt.
+"""
+import logging
+import random
+import time
+from typing import Callable, List, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import QuerySet
+
+logger = logging.getLogger(__name__)
+
+
+class RandomSampler:
+    """Per-user stable random pages over a cached pool of primary keys."""
+
+    DEFAULT_POOL_SIZE = 200
+    DEFAULT_POOL_TTL = 300
+
+    def __init__(self, name: str, queryset: Callable[[], QuerySet], pool_size: int = None, pool_ttl: int = None):
+        self.name = name
+        self.queryset = queryset
+        self.pool_size = pool_size
+        self.pool_ttl = pool_ttl
+        self.cache_key = f"sample_pool:{name}"
+
+    def _pool_size(self) -> int:
+        if self.pool_size is not None:
+            return self.pool_size
+        return getattr(settings, 'HOME_SAMPLE_POOL_SIZE', self.DEFAULT_POOL_SIZE)
+
+    def _pool_ttl(self) -> int:
+        if self.pool_ttl is not None:
+            return self.pool_ttl
+        return getattr(settings, 'HOME_SAMPLE_POOL_TTL', self.DEFAULT_POOL_TTL)
+
+    def pool(self) -> dict:
+        """{'ids': [...], 'built_at': ts}, rebuilt by the database when missing or expired."""
+        pool = cache.get(self.cache_key)
+        if pool is None:
+            ids = list(self.queryset().order_by('?').values_list('pk', flat=True)[:self._pool_size()])
+            pool = {'ids': ids, 'built_at': int(time.time())}
+            cache.set(self.cache_key, pool, self._pool_ttl())
+            logger.debug(f"Rebuilt {self.name} sample pool with {len(ids)} rows")
+        return pool
+
+    def invalidate(self):
+        cache.delete(self.cache_key)
+
+    def sample(self, k: int, seed: Optional[str] = None, page: int = 1) -> List:
+        """
+        Primary keys for page `page` (k per page) of a random ordering. The same
+        seed gets the same ordering for as long as the pool lives; no seed gets a
+        fresh draw each time.
+        """
+        pool = self.pool()
+        ids = list(pool['ids'])
+        if seed is None:
+            return random.sample(ids, min(k, len(ids)))
+        random.Random(f"{self.name}:{seed}:{pool['built_at']}").shuffle(ids)
+        start = max(page - 1, 0) * k
+        return ids[start:start + k]
+
+    def fetch(self, queryset: QuerySet, k: int, seed: Optional[str] = None, page: int = 1) -> List:
+        """Load the sampled rows from `queryset` (with its joins/annotations), in sample order."""
+        ids = self.sample(k, seed=seed, page=page)
+        rows = {row.pk: row for row in queryset.filter(pk__in=ids)}
+        return [rows[pk] for pk in ids if pk in rows]
+
+    @staticmethod
+    def seed_for(request) -> Optional[str]:
+        """An explicit ?seed= wins, then the signed-in user; anonymous callers get fresh samples."""
+        seed = request.query_params.get('seed')
+        if seed:
+            return seed
+        if request.user and request.user.is_authenticated:
+            return str(request.user.pk)
+        return None
+
+    @staticmethod
+    def page_for(request) -> int:
+        try:
+            return max(int(request.query_params.get('page', 1)), 1)
+        except (TypeError, ValueError):
+            return 1
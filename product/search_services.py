@@ -0,0 +1,267 @@
+"""
+Ranked product search.
+
+Two interchangeable backends rank products by name (strongest), brand, then
+description:
+
+* PostgresSearchBackend keeps Product.search_vector (a weighted tsvector) up to
+  date on save, matches it through a GIN index and ranks with ts_rank. When the
+  full-text query finds nothing (typos), it falls back to pg_trgm word
+  similarity on name and brand. The GIN and trigram indexes, and the pg_trgm
+  extension, are created after migrate.
+* InMemorySearchBackend is a pure-Python inverted index for SQLite development
+  and tests. It matches exact words, then word prefixes, then close spellings.
+
+The default backend follows the database vendor; PRODUCT_SEARCH_BACKEND
+(dotted path) overrides it.
+"""
+import difflib
+import logging
+import math
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connection, connections, transaction
+from django.db.models import F, Q, QuerySet
+from django.db.models.functions import Greatest
+from django.utils.module_loading import import_string
+
+from bank.config_cache import VersionedConfigCache
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# Fields that feed the index
+SEARCH_FIELDS = ('name', 'brand', 'description', 'sku')
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall((text or '').lower())
+
+
+class SearchBackend:
+    """Finds and ranks products matching a free-text query."""
+
+    def ranked_ids(self, queryset: QuerySet, text: str, limit: int) -> List:
+        """Primary keys of matching rows of `queryset`, best match first."""
+        raise NotImplementedError
+
+    def filter(self, queryset: QuerySet, text: str) -> QuerySet:
+        """`queryset` narrowed to matching rows (ordering left to the caller)."""
+        raise NotImplementedError
+
+    def product_saved(self, product, update_fields=None):
+        pass
+
+    def product_deleted(self, product):
+        pass
+
+    def prepare(self, using='default'):
+        """Create whatever the backend needs in the database (run after migrate)."""
+
+    def rebuild(self) -> int:
+        """Reindex every product; returns the number indexed."""
+        return 0
+
+
+class PostgresSearchBackend(SearchBackend):
+    """tsvector + GIN full-text search with a pg_trgm fallback for typos."""
+
+    DEFAULT_CONFIG = 'english'
+    DEFAULT_TRIGRAM_THRESHOLD = 0.3
+
+    @property
+    def config(self) -> str:
+        return getattr(settings, 'PRODUCT_SEARCH_CONFIG', self.DEFAULT_CONFIG)
+
+    def vector(self):
+        return (
+            SearchVector('name', weight='A', config=self.config)
+            + SearchVector('brand', weight='B', config=self.config)
+            + SearchVector('description', weight='C', config=self.config)
+        )
+
+    def _query(self, text: str) -> SearchQuery:
+        return SearchQuery(text, config=self.config, search_type='websearch')
+
+    def _trigram(self, queryset: QuerySet, text: str) -> QuerySet:
+        threshold = getattr(settings, 'PRODUCT_SEARCH_TRIGRAM_THRESHOLD', self.DEFAULT_TRIGRAM_THRESHOLD)
+        return queryset.annotate(
+            similarity=Greatest(TrigramWordSimilarity(text, 'name'), TrigramWordSimilarity(text, 'brand'))
+        ).filter(similarity__gte=threshold)
+
+    def ranked_ids(self, queryset, text, limit):
+        query = self._query(text)
+        ids = list(
+            queryset.filter(Q(search_vector=query) | Q(sku__iexact=text))
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', 'pk')
+            .values_list('pk', flat=True)[:limit]
+        )
+        if ids:
+            return ids
+        return list(self._trigram(queryset, text).order_by('-similarity', 'pk').values_list('pk', flat=True)[:limit])
+
+    def filter(self, queryset, text):
+        matches = queryset.filter(Q(search_vector=self._query(text)) | Q(sku__iexact=text))
+        if matches.exists():
+            return matches
+        return queryset.filter(pk__in=self._trigram(Product.objects.all(), text).values('pk'))
+
+    def product_saved(self, product, update_fields=None):
+        if update_fields is not None and not set(SEARCH_FIELDS) & set(update_fields):
+            return
+        Product.objects.filter(pk=product.pk).update(search_vector=self.vector())
+
+    def prepare(self, using='default'):
+        table = Product._meta.db_table
+        statements = [
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            f'CREATE INDEX IF NOT EXISTS product_search_vector_gin ON {table} USING gin (search_vector)',
+            f'CREATE INDEX IF NOT EXISTS product_name_trgm ON {table} USING gin (name gin_trgm_ops)',
+            f'CREATE INDEX IF NOT EXISTS product_brand_trgm ON {table} USING gin (brand gin_trgm_ops)',
+        ]
+        for statement in statements:
+            try:
+                with transaction.atomic(using=using), connections[using].cursor() as cursor:
+                    cursor.execute(statement)
+            except Exception as e:
+                logger.warning(f"Product search setup step failed ({statement}): {str(e)}")
+
+    def rebuild(self):
+        return Product.objects.update(search_vector=self.vector())
+
+
+class ProductSearchIndex:
+    """Inverted index over the product catalogue at one version."""
+
+    # Same relative weights as ts_rank's defaults for A/B/C
+    FIELD_WEIGHTS = {'name': 1.0, 'sku': 1.0, 'brand': 0.4, 'description': 0.2}
+    MIN_PREFIX = 2
+    FUZZY_CUTOFF = 0.75
+
+    def __init__(self, rows):
+        postings = defaultdict(lambda: defaultdict(float))
+        for row in rows:
+            pk = row['pk']
+            for field, weight in self.FIELD_WEIGHTS.items():
+                words = _words(row[field])
+                # Long descriptions shouldn't outweigh a short title
+                norm = 1.0 / (1.0 + math.log(1 + len(words))) if field == 'description' else 1.0
+                for word in words:
+                    postings[word][pk] += weight * norm
+        self.postings: Dict[str, Dict] = {word: dict(scores) for word, scores in postings.items()}
+        self.vocabulary = sorted(self.postings)
+
+    def _expand(self, word: str) -> List[str]:
+        """Index words standing in for `word`: itself, else words it prefixes, else close spellings."""
+        if word in self.postings:
+            return [word]
+        if len(word) >= self.MIN_PREFIX:
+            start = bisect_left(self.vocabulary, word)
+            prefixed = []
+            for candidate in self.vocabulary[start:]:
+                if not candidate.startswith(word):
+                    break
+                prefixed.append(candidate)
+            if prefixed:
+                return prefixed
+        return difflib.get_close_matches(word, self.vocabulary, n=3, cutoff=self.FUZZY_CUTOFF)
+
+    def search(self, text: str) -> List:
+        """Primary keys matching every query word, best score first."""
+        scores: Optional[Dict] = None
+        for word in dict.fromkeys(_words(text)):
+            word_scores = defaultdict(float)
+            for term in self._expand(word):
+                for pk, score in self.postings[term].items():
+                    word_scores[pk] = max(word_scores[pk], score)
+            if scores is None:
+                scores = dict(word_scores)
+            else:
+                scores = {pk: score + word_scores[pk] for pk, score in scores.items() if pk in word_scores}
+            if not scores:
+                return []
+        if not scores:
+            return []
+        return sorted(scores, key=lambda pk: (-scores[pk], str(pk)))
+
+
+def _load_index() -> ProductSearchIndex:
+    return ProductSearchIndex(Product.objects.values('pk', *SEARCH_FIELDS).iterator())
+
+
+# Rebuilt after product saves/deletes when the in-memory backend is active
+product_search_index = VersionedConfigCache('product_search', _load_index)
+
+
+class InMemorySearchBackend(SearchBackend):
+    """Pure-Python inverted index (SQLite development and tests)."""
+
+    def _restrict(self, queryset, ids, limit=None):
+        allowed = set(queryset.filter(pk__in=ids).values_list('pk', flat=True))
+        ranked = [pk for pk in ids if pk in allowed]
+        return ranked if limit is None else ranked[:limit]
+
+    def ranked_ids(self, queryset, text, limit):
+        return self._restrict(queryset, product_search_index.get().search(text), limit)
+
+    def filter(self, queryset, text):
+        return queryset.filter(pk__in=product_search_index.get().search(text))
+
+    def product_saved(self, product, update_fields=None):
+        if update_fields is not None and not set(SEARCH_FIELDS) & set(update_fields):
+            return
+        transaction.on_commit(product_search_index.invalidate)
+
+    def product_deleted(self, product):
+        transaction.on_commit(product_search_index.invalidate)
+
+    def rebuild(self):
+        product_search_index.invalidate()
+        return len({pk for scores in product_search_index.get().postings.values() for pk in scores})
+
+
+class ProductSearch:
+    """Entry point used by the views."""
+
+    DEFAULT_MAX_RESULTS = 1000
+
+    _backend = None
+
+    @classmethod
+    def backend(cls) -> SearchBackend:
+        if cls._backend is None:
+            path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+            if path:
+                cls._backend = import_string(path)()
+            elif connection.vendor == 'postgresql':
+                cls._backend = PostgresSearchBackend()
+            else:
+                cls._backend = InMemorySearchBackend()
+        return cls._backend
+
+    @classmethod
+    def set_backend(cls, backend: Optional[SearchBackend]):
+        """Swap the backend (None restores the configured one)."""
+        cls._backend = backend
+
+    @classmethod
+    def ranked_ids(cls, queryset: QuerySet, text: str) -> List:
+        text = (text or '').strip()
+        if not text:
+            return []
+        limit = getattr(settings, 'PRODUCT_SEARCH_MAX_RESULTS', cls.DEFAULT_MAX_RESULTS)
+        return cls.backend().ranked_ids(queryset, text, limit)
+
+    @classmethod
+    def filter(cls, queryset: QuerySet, text: str) -> QuerySet:
+        text = (text or '').strip()
+        if not text:
+            return queryset
+        return cls.backend().filter(queryset, text)
@@ -75,19 +75,17 @@ class ProductSerializer(serializers.ModelSerializer):
     original_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     discount_percentage = serializers.DecimalField(max_digits=5, decimal_places=2, read_only=True)
     active_discount = ProductDiscountSerializer(read_only=True)
-    review_count = serializers.SerializerMethodField()
-    average_rating = serializers.SerializerMethodField()
+    review_count = serializers.IntegerField(read_only=True)
+    average_rating = serializers.FloatField(read_only=True)
     has_size_variants = serializers.BooleanField(read_only=True)
     has_color_variants = serializers.BooleanField(read_only=True)
 
-    def get_review_count(self, obj):
-        return obj.reviews.count()
-
-    def get_average_rating(self, obj):
-        reviews = obj.reviews.all()
-        if reviews.exists():
-            return round(sum(review.rating for review in reviews) / reviews.count(), 2)
-        return 0.0
+    def get_fields(self):
+        fields = super().get_fields()
+        # Lists carry the stored review_count/average_rating only; review bodies are detail-only
+        if isinstance(self.parent, serializers.ListSerializer):
+            fields.pop('reviews', None)
+        return fields
     
     def get_size_variants(self, obj):
         """Get only size variants"""
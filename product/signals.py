@@ -0,0 +1,88 @@
+from django.db.models.signals import post_save, post_delete, post_migrate, pre_save
+from django.dispatch import receiver
+
+from .models import FlashSale, FlashSaleItem, Product, ProductDiscount, ProductReview, ProductVariant
+from .pricing_services import ProductPricingService
+from .review_services import ProductReviewStatsService
+from .search_services import ProductSearch
+from .similarity_services import ProductSimilarityService
+
+# Saves that only touch these fields cannot change a price
+PRODUCT_PRICE_FIELDS = {'base_price'}
+VARIANT_PRICE_FIELDS = {'pricing_mode', 'price_adjustment', 'individual_price', 'product'}
+# ... or a product's similarity features
+SIMILARITY_FIELDS = {'store', 'category', 'subcategory', 'brand', 'base_price', 'is_featured', 'status', 'is_deleted'}
+
+
+@receiver(post_save, sender=Product)
+def reprice_product(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not PRODUCT_PRICE_FIELDS & set(update_fields):
+        return
+    ProductPricingService.schedule_refresh([instance.pk])
+
+
+@receiver(post_save, sender=ProductVariant)
+def reprice_variant(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not VARIANT_PRICE_FIELDS & set(update_fields):
+        return
+    ProductPricingService.schedule_refresh([instance.product_id])
+
+
+@receiver(post_save, sender=ProductDiscount)
+@receiver(post_delete, sender=ProductDiscount)
+@receiver(post_save, sender=FlashSaleItem)
+@receiver(post_delete, sender=FlashSaleItem)
+def reprice_discounted_product(sender, instance, **kwargs):
+    """Discounts and flash-sale items change their product's effective price."""
+    ProductPricingService.schedule_refresh([instance.product_id])
+
+
+@receiver(post_save, sender=FlashSale)
+def reprice_flash_sale_products(sender, instance, **kwargs):
+    ProductPricingService.schedule_refresh(instance.items.values_list('product_id', flat=True))
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, update_fields=None, **kwargs):
+    ProductSearch.backend().product_saved(instance, update_fields=update_fields)
+
+
+@receiver(post_save, sender=Product)
+def refresh_similar_products(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not SIMILARITY_FIELDS & set(update_fields):
+        return
+    ProductSimilarityService.schedule_rebuild([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    ProductSearch.backend().product_deleted(instance)
+
+
+@receiver(pre_save, sender=ProductReview)
+def remember_review_rating(sender, instance, raw=False, **kwargs):
+    """Updates apply the difference to the stored rating, so read it before it is overwritten."""
+    instance._previous_rating = None
+    if not raw and not instance._state.adding:
+        instance._previous_rating = ProductReview.objects.filter(pk=instance.pk).values_list(
+            'product_id', 'rating'
+        ).first()
+
+
+@receiver(post_save, sender=ProductReview)
+def count_review(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    ProductReviewStatsService.review_saved(instance, None if created else getattr(instance, '_previous_rating', None))
+
+
+@receiver(post_delete, sender=ProductReview)
+def uncount_review(sender, instance, **kwargs):
+    ProductReviewStatsService.review_deleted(instance)
+
+
+@receiver(post_migrate)
+def prepare_product_search(sender, using='default', **kwargs):
+    """Search indexes live outside the model state (GIN/trigram are Postgres-only)."""
+    if sender.name == 'product':
+        ProductSearch.backend().prepare(using)
@@ -0,0 +1,376 @@
+"""
+Offline product similarity index.
+
+Every published product is described by a feature vector (category,
+subcategory, brand, price and rating) and scored against its candidates with
+NumPy: products of the same store, and products of the same category in other
+stores. The top PRODUCT_SIMILARITY_TOP_N neighbours of each kind are stored in
+ProductSimilarity, so the similar/smart-similar endpoints are one indexed lookup.
+
+Scores keep the weights smart_similar used: category 50, brand 30, subcategory
+20, price within 20% 15 (within 50% 10), featured 5 and up to 10 for rating.
+A saved product gets its own lists rebuilt and is offered as a candidate to
+the lists of its store and category (after commit), which costs one scoring
+pass over those groups instead of rebuilding every list in them. Lists a
+product drops out of stay one entry short until the nightly full build.
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Min, Q
+
+from bank.task_queue import enqueue
+
+from .models import Product, ProductSimilarity
+
+logger = logging.getLogger(__name__)
+
+WEIGHTS = {
+    'category': 50.0,
+    'brand': 30.0,
+    'subcategory': 20.0,
+    'price_close': 15.0,
+    'price_near': 10.0,
+    'featured': 5.0,
+    'rating_max': 10.0,
+}
+
+
+class _Features:
+    """Column-wise feature arrays for a set of products (row i is products[i])."""
+
+    def __init__(self, rows: List[Dict]):
+        self.ids = [row['id'] for row in rows]
+        self.index = {pk: i for i, pk in enumerate(self.ids)}
+        self.store_ids = [row['store_id'] for row in rows]
+        self.category_ids = [row['category_id'] for row in rows]
+        self.store = self._codes(self.store_ids)
+        self.category = self._codes(self.category_ids)
+        # Missing subcategory/brand get -1 and never match
+        self.subcategory = self._codes([row['subcategory_id'] for row in rows])
+        self.brand = self._codes([(row['brand'] or '').strip().lower() or None for row in rows])
+        self.price = np.array(
+            [float(row['effective_price'] if row['effective_price'] is not None else row['base_price']) for row in rows],
+            dtype=float,
+        )
+        self.featured = np.array([bool(row['is_featured']) for row in rows], dtype=bool)
+        self.rating = np.array(
+            [row['rating_sum'] / row['review_count'] if row['review_count'] else 0.0 for row in rows], dtype=float
+        )
+
+    @staticmethod
+    def _codes(values) -> np.ndarray:
+        codes = {}
+        return np.array(
+            [-1 if value is None else codes.setdefault(value, len(codes)) for value in values], dtype=np.int64
+        )
+
+    def score(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Similarity of each product in `rows` (query) to each product in `cols` (candidates)."""
+        same_category = self.category[rows, None] == self.category[None, cols]
+        same_brand = (self.brand[rows, None] == self.brand[None, cols]) & (self.brand[rows, None] >= 0)
+        same_subcategory = (self.subcategory[rows, None] == self.subcategory[None, cols]) & (self.subcategory[rows, None] >= 0)
+        query_price = self.price[rows, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.abs(self.price[None, cols] - query_price) / query_price
+        ratio = np.where(query_price > 0, ratio, np.inf)
+
+        score = (
+            WEIGHTS['category'] * same_category
+            + WEIGHTS['brand'] * same_brand
+            + WEIGHTS['subcategory'] * same_subcategory
+            + np.where(ratio <= 0.2, WEIGHTS['price_close'], np.where(ratio <= 0.5, WEIGHTS['price_near'], 0.0))
+        )
+        bonus = WEIGHTS['featured'] * self.featured[cols] + np.minimum(self.rating[cols] * 2, WEIGHTS['rating_max'])
+        return score + bonus[None, :]
+
+    def reasons(self, i: int, j: int) -> List[str]:
+        reasons = []
+        if self.category[i] == self.category[j]:
+            reasons.append('Same category')
+        if self.brand[i] >= 0 and self.brand[i] == self.brand[j]:
+            reasons.append('Same brand')
+        if self.subcategory[i] >= 0 and self.subcategory[i] == self.subcategory[j]:
+            reasons.append('Same subcategory')
+        if self.price[i] > 0 and abs(self.price[j] - self.price[i]) / self.price[i] <= 0.2:
+            reasons.append('Similar price')
+        if self.featured[j]:
+            reasons.append('Featured product')
+        return reasons
+
+
+class ProductSimilarityService:
+    """Builds and reads the ProductSimilarity table."""
+
+    DEFAULT_TOP_N = 20
+    # Query rows scored per NumPy block (bounds memory to BLOCK_SIZE x group size)
+    BLOCK_SIZE = 256
+
+    @classmethod
+    def top_n(cls) -> int:
+        return int(getattr(settings, 'PRODUCT_SIMILARITY_TOP_N', cls.DEFAULT_TOP_N))
+
+    @staticmethod
+    def _load(filters: Q) -> _Features:
+        rows = Product.objects.filter(filters, status='published', is_deleted=False).values(
+            'id', 'store_id', 'category_id', 'subcategory_id', 'brand',
+            'base_price', 'effective_price', 'is_featured', 'review_count', 'rating_sum',
+        )
+        return _Features(list(rows))
+
+    @classmethod
+    def _neighbours(cls, features: _Features, query: np.ndarray, group: np.ndarray, same_store: bool) -> List:
+        """ProductSimilarity rows for each product in `query` against the candidates in `group`."""
+        top_n = cls.top_n()
+        links = []
+        for start in range(0, len(query), cls.BLOCK_SIZE):
+            rows = query[start:start + cls.BLOCK_SIZE]
+            scores = features.score(rows, group)
+            # Never a neighbour of itself; other-store lists exclude the product's own store
+            scores[rows[:, None] == group[None, :]] = -np.inf
+            if not same_store:
+                scores[features.store[rows, None] == features.store[None, group]] = -np.inf
+            scores[scores <= 0] = -np.inf
+
+            k = min(top_n, len(group))
+            if k == 0:
+                continue
+            best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for r, i in enumerate(rows):
+                order = best[r][np.argsort(-scores[r, best[r]], kind='stable')]
+                rank = 0
+                for col in order:
+                    if not np.isfinite(scores[r, col]):
+                        break
+                    j = group[col]
+                    rank += 1
+                    links.append(ProductSimilarity(
+                        product_id=features.ids[i],
+                        similar_id=features.ids[j],
+                        same_store=same_store,
+                        rank=rank,
+                        score=float(scores[r, col]),
+                        reasons=features.reasons(i, j),
+                    ))
+        return links
+
+    @classmethod
+    def _build(cls, features: _Features, store_ids: Optional[set], category_ids: Optional[set], only: Optional[set] = None):
+        """
+        Rebuild same-store lists for products of `store_ids` and other-store lists for
+        products of `category_ids` (None means every group). `only` limits the rebuilt
+        lists to those product ids.
+        """
+        by_store, by_category = defaultdict(list), defaultdict(list)
+        for i, pk in enumerate(features.ids):
+            by_store[features.store_ids[i]].append(i)
+            by_category[features.category_ids[i]].append(i)
+
+        links, same_store_for, other_store_for = [], [], []
+        for groups, wanted, same_store, rebuilt in (
+            (by_store, store_ids, True, same_store_for),
+            (by_category, category_ids, False, other_store_for),
+        ):
+            for key, members in groups.items():
+                if wanted is not None and key not in wanted:
+                    continue
+                group = np.array(members, dtype=np.int64)
+                query = group if only is None else np.array(
+                    [i for i in members if features.ids[i] in only], dtype=np.int64
+                )
+                if not len(query):
+                    continue
+                rebuilt.extend(features.ids[i] for i in query)
+                links.extend(cls._neighbours(features, query, group, same_store))
+
+        with transaction.atomic():
+            ProductSimilarity.objects.filter(
+                Q(product_id__in=same_store_for, same_store=True) | Q(product_id__in=other_store_for, same_store=False)
+            ).delete()
+            ProductSimilarity.objects.bulk_create(links, batch_size=1000)
+        return len(links)
+
+    @classmethod
+    def rebuild_all(cls) -> int:
+        """Full offline build; returns the number of neighbour rows stored."""
+        features = cls._load(Q())
+        with transaction.atomic():
+            # Unpublished or deleted products drop out of the index entirely
+            ProductSimilarity.objects.exclude(product_id__in=features.ids).delete()
+            count = cls._build(features, None, None)
+        logger.info(f"Built product similarity index: {len(features.ids)} products, {count} neighbours")
+        return count
+
+    @classmethod
+    def rebuild(cls, product_ids: Iterable) -> int:
+        """Incremental build: the stores and categories of `product_ids` are rebuilt."""
+        product_ids = list(dict.fromkeys(product_ids))
+        groups = Product.objects.filter(id__in=product_ids).values_list('store_id', 'category_id')
+        store_ids = {store_id for store_id, _ in groups}
+        category_ids = {category_id for _, category_id in groups}
+        # Products that left the catalogue lose their own lists
+        ProductSimilarity.objects.filter(
+            product_id__in=product_ids
+        ).exclude(product__status='published', product__is_deleted=False).delete()
+        ProductSimilarity.objects.filter(similar_id__in=product_ids).exclude(
+            similar__status='published', similar__is_deleted=False
+        ).delete()
+        if not store_ids:
+            return 0
+        features = cls._load(Q(store_id__in=store_ids) | Q(category_id__in=category_ids))
+        return cls._build(features, store_ids, category_ids)
+
+    @classmethod
+    def refresh_products(cls, product_ids: Iterable) -> int:
+        """
+        Save-time update for `product_ids`: their own lists are rebuilt, they are removed
+        from every other list and offered again as candidates to the lists of their store
+        and category, where they replace the weakest neighbour if they score higher.
+        """
+        product_ids = list(dict.fromkeys(product_ids))
+        listed = list(
+            Product.objects.filter(id__in=product_ids, status='published', is_deleted=False)
+            .values_list('id', 'store_id', 'category_id')
+        )
+        with transaction.atomic():
+            # Scores against a changed product are stale everywhere; products that left
+            # the catalogue also lose their own lists
+            ProductSimilarity.objects.filter(similar_id__in=product_ids).delete()
+            ProductSimilarity.objects.filter(product_id__in=product_ids).exclude(
+                product_id__in=[pk for pk, _, _ in listed]
+            ).delete()
+            if not listed:
+                return 0
+            store_ids = {store_id for _, store_id, _ in listed}
+            category_ids = {category_id for _, _, category_id in listed}
+            features = cls._load(Q(store_id__in=store_ids) | Q(category_id__in=category_ids))
+            changed = {pk for pk, _, _ in listed if pk in features.index}
+            if not changed:
+                return 0
+            count = cls._build(features, store_ids, category_ids, only=changed)
+            count += cls._offer(features, changed, same_store=True)
+            count += cls._offer(features, changed, same_store=False)
+        return count
+
+    @classmethod
+    def _offer(cls, features: _Features, changed: set, same_store: bool) -> int:
+        """Insert the `changed` products into the same-store/other-store lists of their groups where they now rank."""
+        top_n = cls.top_n()
+        group_keys = features.store_ids if same_store else features.category_ids
+        members = defaultdict(list)
+        for i, key in enumerate(group_keys):
+            if features.ids[i] not in changed:
+                members[key].append(i)
+
+        # Candidate scores: list owner id -> [(score, candidate index)]
+        offers = defaultdict(list)
+        for pk in changed:
+            j = features.index[pk]
+            group = np.array(members.get(group_keys[j], []), dtype=np.int64)
+            if not len(group):
+                continue
+            scores = features.score(group, np.array([j], dtype=np.int64))[:, 0]
+            if not same_store:
+                scores[features.store[group] == features.store[j]] = -np.inf
+            for position in np.nonzero(np.isfinite(scores) & (scores > 0))[0]:
+                offers[features.ids[group[position]]].append((float(scores[position]), j))
+        if not offers:
+            return 0
+
+        # Only lists that are short or whose weakest neighbour is beaten change
+        current = {
+            row['product_id']: row
+            for row in ProductSimilarity.objects.filter(product_id__in=list(offers), same_store=same_store)
+            .values('product_id').annotate(n=Count('id'), weakest=Min('score')).order_by()
+        }
+        affected = {}
+        for owner, candidates in offers.items():
+            stats = current.get(owner)
+            kept = [
+                candidate for candidate in candidates
+                if stats is None or stats['n'] < top_n or candidate[0] > stats['weakest']
+            ]
+            if kept:
+                affected[owner] = kept
+        if not affected:
+            return 0
+
+        lists = defaultdict(list)
+        for link in ProductSimilarity.objects.filter(product_id__in=list(affected), same_store=same_store):
+            lists[link.product_id].append(link)
+        links = []
+        for owner, candidates in affected.items():
+            i = features.index[owner]
+            entries = [(link.score, link.similar_id, link.reasons) for link in lists[owner]]
+            entries.extend((score, features.ids[j], features.reasons(i, j)) for score, j in candidates)
+            entries.sort(key=lambda entry: -entry[0])
+            for rank, (score, similar_id, reasons) in enumerate(entries[:top_n], start=1):
+                links.append(ProductSimilarity(
+                    product_id=owner,
+                    similar_id=similar_id,
+                    same_store=same_store,
+                    rank=rank,
+                    score=score,
+                    reasons=reasons,
+                ))
+
+        ProductSimilarity.objects.filter(product_id__in=list(affected), same_store=same_store).delete()
+        ProductSimilarity.objects.bulk_create(links, batch_size=1000)
+        return len(links)
+
+    @classmethod
+    def build_for(cls, product) -> int:
+        """Build just `product`'s own lists (first lookup before the offline build ran)."""
+        features = cls._load(Q(store_id=product.store_id) | Q(category_id=product.category_id))
+        if product.id not in features.index:
+            return 0
+        return cls._build(features, {product.store_id}, {product.category_id}, only={product.id})
+
+    @classmethod
+    def neighbours(cls, product, same_store: bool, limit: int = 10, same_category: bool = False, build_missing: bool = True):
+        """
+        Stored neighbours of `product` (ProductSimilarity rows, best first) with the
+        related rows the product serializer needs. Builds the product's lists on first
+        use if the offline build hasn't covered it yet.
+        """
+        links = ProductSimilarity.objects.filter(
+            product=product, same_store=same_store, similar__status='published', similar__is_deleted=False
+        )
+        if same_category:
+            links = links.filter(similar__category_id=product.category_id)
+        result = list(
+            links.select_related(
+                'similar__store', 'similar__category', 'similar__subcategory', 'similar__active_discount'
+            ).prefetch_related('similar__variants').order_by('rank')[:limit]
+        )
+        if not result and build_missing and not ProductSimilarity.objects.filter(product=product).exists():
+            if cls.build_for(product):
+                return cls.neighbours(product, same_store, limit, same_category, build_missing=False)
+        return result
+
+    @classmethod
+    def schedule_rebuild(cls, product_ids: Iterable):
+        """Refresh the products' similarity after the current transaction commits, once per transaction."""
+        pending = getattr(connection, 'pending_similarity_rebuild', None)
+        if pending is None:
+            pending = connection.pending_similarity_rebuild = set()
+        pending.update(str(pk) for pk in product_ids)
+        if not any(callback[1] == cls._flush_scheduled for callback in connection.run_on_commit):
+            transaction.on_commit(cls._flush_scheduled)
+
+    @classmethod
+    def _flush_scheduled(cls):
+        product_ids = getattr(connection, 'pending_similarity_rebuild', None)
+        connection.pending_similarity_rebuild = None
+        if not product_ids:
+            return
+        from .tasks import refresh_product_similarity
+        if enqueue(refresh_product_similarity, sorted(product_ids)):
+            return
+        try:
+            cls.refresh_products(product_ids)
+        except Exception as e:
+            logger.error(f"Error refreshing product similarity for {len(product_ids)} products: {str(e)}")
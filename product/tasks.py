@@ -0,0 +1,27 @@
+from celery import shared_task
+
+
+@shared_task(bind=True, ignore_result=True)
+def sweep_product_prices(self):
+    """Reprice products whose discount or flash sale started or ended since the last run."""
+    from .pricing_services import ProductPricingService
+
+    return ProductPricingService.sweep()
+
+
+@shared_task(bind=True, ignore_result=True)
+def rebuild_product_similarity(self, product_ids=None):
+    """Rebuild similar-product lists for the given products' stores and categories (all when omitted)."""
+    from .similarity_services import ProductSimilarityService
+
+    if product_ids is None:
+        return ProductSimilarityService.rebuild_all()
+    return ProductSimilarityService.rebuild(product_ids)
+
+
+@shared_task(bind=True, ignore_result=True)
+def refresh_product_similarity(self, product_ids):
+    """Save-time similarity update: the products' own lists, and them as candidates in their groups."""
+    from .similarity_services import ProductSimilarityService
+
+    return ProductSimilarityService.refresh_products(product_ids)
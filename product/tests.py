@@ -1,3 +1,100 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-# Create your tests here.
+from store.models import Store
+from product.models import Category, Product, ProductReview
+from product.review_services import ProductReviewStatsService
+
+
+class ReviewAggregateTests(TestCase):
+    def setUp(self):
+        self.owner = self.make_user('owner')
+        self.store = Store.objects.create(
+            name='Test Shop',
+            location='Lagos',
+            contact_email='shop@example.com',
+            phone_number='+2348000000000',
+            owner=self.owner,
+            created_by=self.owner,
+            updated_by=self.owner,
+        )
+        self.category = Category.objects.create(name='Shoes', image_url='https://example.com/shoes.png')
+        self.product = self.make_product('Boot')
+        self.other_product = self.make_product('Sandal')
+
+    @staticmethod
+    def make_user(username):
+        return get_user_model().objects.create_user(username, f'{username}@example.com', 'password')
+
+    def make_product(self, name):
+        return Product.objects.create(
+            name=name,
+            brand='Test',
+            base_price=Decimal('10.00'),
+            description=name,
+            image_urls=['https://example.com/product.png'],
+            stock=5,
+            available_sizes=['M'],
+            available_colors=['Black'],
+            store=self.store,
+            category=self.category,
+        )
+
+    def assertAggregates(self, obj, review_count, rating_sum):
+        obj.refresh_from_db(fields=['review_count', 'rating_sum'])
+        self.assertEqual((obj.review_count, obj.rating_sum), (review_count, rating_sum))
+
+    def test_create_update_and_delete_apply_deltas(self):
+        first = ProductReview.objects.create(product=self.product, user=self.make_user('ada'), rating=4)
+        ProductReview.objects.create(product=self.product, user=self.make_user('ben'), rating=2)
+        self.assertAggregates(self.product, 2, 6)
+        self.assertAggregates(self.store, 2, 6)
+
+        first.rating = 1
+        first.save()
+        self.assertAggregates(self.product, 2, 3)
+        self.assertAggregates(self.store, 2, 3)
+
+        # Saving without a change leaves the aggregates alone
+        first.save()
+        self.assertAggregates(self.product, 2, 3)
+
+        first.delete()
+        self.assertAggregates(self.product, 1, 2)
+        self.assertAggregates(self.store, 1, 2)
+
+    def test_stale_instance_updates_from_the_stored_rating(self):
+        review = ProductReview.objects.create(product=self.product, user=self.make_user('ada'), rating=5)
+        stale = ProductReview.objects.get(pk=review.pk)
+        review.rating = 3
+        review.save()
+
+        stale.rating = 4
+        stale.save()
+        self.assertAggregates(self.product, 1, 4)
+
+    def test_moving_a_review_to_another_product(self):
+        review = ProductReview.objects.create(product=self.product, user=self.make_user('ada'), rating=5)
+        review.product = self.other_product
+        review.rating = 3
+        review.save()
+
+        self.assertAggregates(self.product, 0, 0)
+        self.assertAggregates(self.other_product, 1, 3)
+        self.assertAggregates(self.store, 1, 3)
+
+    def test_reconcile_repairs_drift(self):
+        ProductReview.objects.create(product=self.product, user=self.make_user('ada'), rating=4)
+        # bulk_create and queryset updates skip the save hooks
+        ProductReview.objects.bulk_create([
+            ProductReview(product=self.other_product, user=self.make_user('ben'), rating=2),
+        ])
+        Product.objects.filter(pk=self.product.pk).update(review_count=7, rating_sum=30)
+
+        self.assertEqual(ProductReviewStatsService.reconcile(), (2, 1))
+        self.assertAggregates(self.product, 1, 4)
+        self.assertAggregates(self.other_product, 1, 2)
+        self.assertAggregates(self.store, 2, 6)
+        self.assertEqual(ProductReviewStatsService.reconcile(), (0, 0))
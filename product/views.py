@@ -4,8 +4,8 @@ from rest_framework.response import Response
 from rest_framework import status, generics, viewsets, permissions
 from rest_framework.exceptions import PermissionDenied
 from django.contrib.auth import get_user_model
-import random
-from django.db.models import Count, Avg, Q, F
+from django.db.models import Count, Avg, F
+from django.db.models.functions import Cast
 from django.db import models
 from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
@@ -24,9 +24,18 @@ from .models import (
     Category, SubCategory, Product, ProductVariant,
       FlashSale, FlashSaleItem, ProductReview, ProductDiscount
 )
+from .sampling import RandomSampler
+from .search_services import ProductSearch
+from .pagination import ProductSearchPagination
+from .similarity_services import ProductSimilarityService
+from .pricing_services import ProductPricingService
 
 User = get_user_model()
 
+# Cached random pools behind the homepage endpoints
+home_category_sampler = RandomSampler('home_categories', lambda: Category.objects.all())
+home_product_sampler = RandomSampler('home_products', lambda: Product.objects.all())
+
 class CategoryViewSet(viewsets.ModelViewSet):
     serializer_class = CategorySerializer
     queryset = Category.objects.all()
@@ -36,39 +45,39 @@ class CategoryViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='homecategories')
     def homecategories(self, request):
-        """Returns 5 random categories for the homepage."""
-        # Use a simpler queryset for random selection
-        queryset = Category.objects.all()
-        shuffled_queryset = list(queryset)
-        random.shuffle(shuffled_queryset)
-        
-        # Take first 5 items
-        selected_categories = shuffled_queryset[:5]
-        
-        # Now get the full data with annotations for the selected categories
-        full_queryset = Category.objects.prefetch_related('subcategories').annotate(
-            product_count=Count('products')
-        ).filter(id__in=[cat.id for cat in selected_categories])
-        
+        """Returns 5 random categories for the homepage (?page= for more, stable per user)."""
+        full_queryset = home_category_sampler.fetch(
+            Category.objects.prefetch_related('subcategories').annotate(product_count=Count('products')),
+            5, seed=RandomSampler.seed_for(request), page=RandomSampler.page_for(request)
+        )
+
         serializer = self.get_serializer(full_queryset, many=True)
         return Response(serializer.data)
 
 
 class ProductViewSet(viewsets.ModelViewSet):
     serializer_class = ProductSerializer
-    queryset = Product.objects.select_related('store', 'category', 'subcategory').prefetch_related('variants', 'reviews').filter(status='published')
+    queryset = Product.objects.select_related('store', 'category', 'subcategory', 'active_discount').prefetch_related('variants').filter(status='published')
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['brand', 'is_featured', 'status', 'store', 'category', 'subcategory']
     search_fields = ['name', 'description', 'brand']
-    ordering_fields = ['name', 'base_price', 'current_price', 'created_at', 'updated_at']
+    ordering_fields = ['name', 'base_price', 'effective_price', 'review_count', 'created_at', 'updated_at']
     ordering = ['-created_at']
 
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Reprice products whose discount window opened or closed before prices are read
+        ProductPricingService.sweep_if_due()
+
     def get_queryset(self):
         """
         Enhanced filtering with price range, stock status, and advanced search.
         Only shows published products for public access.
         """
         queryset = super().get_queryset()
+        # Review bodies are only serialized on the detail view
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related('reviews')
 
         # Subcategory filter
         subcategory_id = self.request.query_params.get('subcategory', None)
@@ -84,9 +93,9 @@ class ProductViewSet(viewsets.ModelViewSet):
         min_price = self.request.query_params.get('min_price', None)
         max_price = self.request.query_params.get('max_price', None)
         if min_price:
-            queryset = queryset.filter(current_price__gte=min_price)
+            queryset = queryset.filter(effective_price__gte=min_price)
         if max_price:
-            queryset = queryset.filter(current_price__lte=max_price)
+            queryset = queryset.filter(effective_price__lte=max_price)
 
         # Stock status filter
         in_stock = self.request.query_params.get('in_stock', None)
@@ -98,9 +107,9 @@ class ProductViewSet(viewsets.ModelViewSet):
         # On sale filter
         on_sale = self.request.query_params.get('on_sale', None)
         if on_sale == 'true':
-            queryset = queryset.filter(discounts__is_active=True)
+            queryset = queryset.filter(on_sale=True)
         elif on_sale == 'false':
-            queryset = queryset.filter(discounts__isnull=True)
+            queryset = queryset.filter(on_sale=False)
 
         # Featured filter
         featured = self.request.query_params.get('featured', None)
@@ -122,52 +131,45 @@ class ProductViewSet(viewsets.ModelViewSet):
         # Advanced search
         search_query = self.request.query_params.get('q', None)
         if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(description__icontains=search_query) |
-                Q(brand__icontains=search_query) |
-                Q(sku__icontains=search_query)
-            )
+            queryset = ProductSearch.filter(queryset, search_query)
 
         return queryset
 
     @action(detail=False, methods=['get'], url_path='homeproducts')
     def homeproducts(self, request):
-        """Returns 5 random products for the homepage."""
-        # Use a simpler queryset for random selection
-        queryset = Product.objects.all()
-        shuffled_queryset = list(queryset)
-        random.shuffle(shuffled_queryset)
-        
-        # Take first 5 items
-        selected_products = shuffled_queryset[:5]
-        
-        # Now get the full data with related fields for the selected products
-        full_queryset = Product.objects.select_related('store', 'category', 'subcategory').prefetch_related(
-            'variants', 'reviews'
-        ).filter(id__in=[prod.id for prod in selected_products])
-        
+        """Returns 5 random products for the homepage (?page= for more, stable per user)."""
+        full_queryset = home_product_sampler.fetch(
+            Product.objects.select_related('store', 'category', 'subcategory', 'active_discount').prefetch_related('variants'),
+            5, seed=RandomSampler.seed_for(request), page=RandomSampler.page_for(request)
+        )
+
         serializer = self.get_serializer(full_queryset, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """Published products ranked by relevance to ?q= (name, then brand, then description)."""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "Search query is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        ranked_ids = ProductSearch.ranked_ids(Product.objects.filter(status='published', is_deleted=False), query)
+        paginator = ProductSearchPagination()
+        page_ids = paginator.paginate_queryset(ranked_ids, request, view=self)
+        products = Product.objects.select_related('store', 'category', 'subcategory', 'active_discount').prefetch_related('variants').in_bulk(page_ids)
+        serializer = self.get_serializer([products[pk] for pk in page_ids if pk in products], many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=True, methods=['get'])
     def similar(self, request, pk=None):
-        """Returns products from the same category and store, excluding the product itself."""
+        """Returns the most similar products from the same category and store (other stores as fallback)."""
         product = self.get_object()
-        
-        # First try: same category and same store
-        queryset = self.get_queryset().filter(
-            category=product.category,
-            store=product.store
-        ).exclude(id=product.id)[:10]
-        
-        # If no results, fallback to same category only
-        if not queryset.exists():
-            queryset = self.get_queryset().filter(
-                category=product.category
-            ).exclude(id=product.id)[:10]
-        
-        # Add debug information
+        links = ProductSimilarityService.neighbours(product, same_store=True, same_category=True)
+        fallback_used = not links
+        if fallback_used:
+            links = ProductSimilarityService.neighbours(product, same_store=False)
+
+        serializer = self.get_serializer([link.similar for link in links], many=True)
         debug_info = {
             'product_id': str(product.id),
             'product_name': product.name,
@@ -175,56 +177,21 @@ class ProductViewSet(viewsets.ModelViewSet):
             'category_name': product.category.name,
             'store_id': str(product.store.id),
             'store_name': product.store.name,
-            'same_store_count': self.get_queryset().filter(
-                category=product.category,
-                store=product.store
-            ).exclude(id=product.id).count(),
-            'same_category_count': self.get_queryset().filter(
-                category=product.category
-            ).exclude(id=product.id).count(),
-            'total_products_in_category': self.get_queryset().filter(
-                category=product.category
-            ).count(),
-            'fallback_used': not self.get_queryset().filter(
-                category=product.category,
-                store=product.store
-            ).exclude(id=product.id).exists()
+            'similar_products_found': len(links),
+            'fallback_used': fallback_used,
         }
-        
-        paginated_queryset = self.paginate_queryset(queryset)
-        
-        # Handle pagination more carefully for small result sets
-        if queryset.count() <= 10:
-            paginated_queryset = None
-            debug_info['pagination_skipped'] = True
-            debug_info['reason'] = 'Small result set (≤10 items)'
-        
-        serializer = self.get_serializer(paginated_queryset, many=True) if paginated_queryset is not None else self.get_serializer(queryset, many=True)
-        
-        response_data = {
+        return Response({
             'similar_products': serializer.data,
             'debug_info': debug_info
-        }
-        
-        return self.get_paginated_response(response_data) if paginated_queryset is not None else Response(response_data)
+        })
 
     @action(detail=True, methods=['get'], url_path='similar-other-stores')
     def similar_other_stores(self, request, pk=None):
-        """Returns products from the same category but different stores, excluding the product itself."""
+        """Returns the most similar products from the same category in other stores."""
         product = self.get_object()
-        
-        # Get all products in the same category
-        same_category_products = self.get_queryset().filter(category=product.category)
-        
-        # Get products from other stores
-        other_stores_products = same_category_products.exclude(
-            id=product.id,
-            store=product.store
-        )
-        
-        queryset = other_stores_products[:10]
-        
-        # Add detailed debug information
+        links = ProductSimilarityService.neighbours(product, same_store=False)
+
+        serializer = self.get_serializer([link.similar for link in links], many=True)
         debug_info = {
             'product_id': str(product.id),
             'product_name': product.name,
@@ -232,33 +199,16 @@ class ProductViewSet(viewsets.ModelViewSet):
             'category_name': product.category.name,
             'store_id': str(product.store.id),
             'store_name': product.store.name,
-            'other_stores_count': other_stores_products.count(),
-            'total_products_in_category': same_category_products.count(),
-            'unique_stores_in_category': same_category_products.values('store').distinct().count(),
-            'all_products_in_category': list(same_category_products.values('id', 'name', 'store__id', 'store__name')),
-            'other_stores_products': list(other_stores_products.values('id', 'name', 'store__id', 'store__name')),
+            'other_stores_count': len(links),
             'current_product_store': {
                 'id': str(product.store.id),
                 'name': product.store.name
             }
         }
-        
-        paginated_queryset = self.paginate_queryset(queryset)
-        
-        # Handle pagination more carefully for small result sets
-        if queryset.count() <= 10:
-            paginated_queryset = None
-            debug_info['pagination_skipped'] = True
-            debug_info['reason'] = 'Small result set (≤10 items)'
-        
-        serializer = self.get_serializer(paginated_queryset, many=True) if paginated_queryset is not None else self.get_serializer(queryset, many=True)
-        
-        response_data = {
+        return Response({
             'similar_products_other_stores': serializer.data,
             'debug_info': debug_info
-        }
-        
-        return self.get_paginated_response(response_data) if paginated_queryset is not None else Response(response_data)
+        })
 
     @action(detail=False, methods=['get'], url_path='myproducts')
     def myproducts(self, request):
@@ -285,9 +235,7 @@ class ProductViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], url_path='on-sale')
     def on_sale(self, request):
         """Returns products that are currently on sale."""
-        queryset = self.get_queryset().filter(
-            discounts__is_active=True
-        ).distinct()
+        queryset = self.get_queryset().filter(on_sale=True)
         paginated_queryset = self.paginate_queryset(queryset)
         serializer = self.get_serializer(paginated_queryset, many=True)
         return self.get_paginated_response(serializer.data) if paginated_queryset is not None else Response(serializer.data)
@@ -309,10 +257,9 @@ class ProductViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], url_path='popular')
     def popular(self, request):
         """Returns most reviewed products."""
-        queryset = self.get_queryset().annotate(
-            review_count=Count('reviews'),
-            avg_rating=Avg('reviews__rating')
-        ).filter(review_count__gt=0).order_by('-review_count', '-avg_rating')
+        queryset = self.get_queryset().filter(review_count__gt=0).annotate(
+            avg_rating=Cast('rating_sum', models.FloatField()) / F('review_count')
+        ).order_by('-review_count', '-avg_rating')
         paginated_queryset = self.paginate_queryset(queryset)
         serializer = self.get_serializer(paginated_queryset, many=True)
         return self.get_paginated_response(serializer.data) if paginated_queryset is not None else Response(serializer.data)
@@ -330,7 +277,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             )
         
         # Use a more inclusive queryset for category filtering
-        queryset = Product.objects.select_related('store', 'category', 'subcategory').prefetch_related('variants', 'reviews')
+        queryset = Product.objects.select_related('store', 'category', 'subcategory', 'active_discount').prefetch_related('variants')
         
         # Filter by category
         if category_id:
@@ -360,9 +307,9 @@ class ProductViewSet(viewsets.ModelViewSet):
         min_price = request.query_params.get('min_price', None)
         max_price = request.query_params.get('max_price', None)
         if min_price:
-            queryset = queryset.filter(current_price__gte=min_price)
+            queryset = queryset.filter(effective_price__gte=min_price)
         if max_price:
-            queryset = queryset.filter(current_price__lte=max_price)
+            queryset = queryset.filter(effective_price__lte=max_price)
         
         # Status filter (optional)
         status_filter = request.query_params.get('status', 'published')
@@ -372,15 +319,13 @@ class ProductViewSet(viewsets.ModelViewSet):
         # Sort options
         sort_by = request.query_params.get('sort', 'newest')
         if sort_by == 'price_low':
-            queryset = queryset.order_by('current_price')
+            queryset = queryset.order_by('effective_price')
         elif sort_by == 'price_high':
-            queryset = queryset.order_by('-current_price')
+            queryset = queryset.order_by('-effective_price')
         elif sort_by == 'name':
             queryset = queryset.order_by('name')
         elif sort_by == 'popular':
-            queryset = queryset.annotate(
-                review_count=Count('reviews')
-            ).order_by('-review_count')
+            queryset = queryset.order_by('-review_count')
         else:  # newest (default)
             queryset = queryset.order_by('-created_at')
         
@@ -617,7 +562,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             )
         
         # Use a more inclusive queryset for store filtering
-        queryset = Product.objects.select_related('store', 'category', 'subcategory').prefetch_related('variants', 'reviews')
+        queryset = Product.objects.select_related('store', 'category', 'subcategory', 'active_discount').prefetch_related('variants')
         
         # Filter by store
         try:
@@ -634,9 +579,9 @@ class ProductViewSet(viewsets.ModelViewSet):
         min_price = request.query_params.get('min_price', None)
         max_price = request.query_params.get('max_price', None)
         if min_price:
-            queryset = queryset.filter(current_price__gte=min_price)
+            queryset = queryset.filter(effective_price__gte=min_price)
         if max_price:
-            queryset = queryset.filter(current_price__lte=max_price)
+            queryset = queryset.filter(effective_price__lte=max_price)
         
         # Status filter (optional)
         status_filter = request.query_params.get('status', 'published')
@@ -656,15 +601,13 @@ class ProductViewSet(viewsets.ModelViewSet):
         # Sort options
         sort_by = request.query_params.get('sort', 'newest')
         if sort_by == 'price_low':
-            queryset = queryset.order_by('current_price')
+            queryset = queryset.order_by('effective_price')
         elif sort_by == 'price_high':
-            queryset = queryset.order_by('-current_price')
+            queryset = queryset.order_by('-effective_price')
         elif sort_by == 'name':
             queryset = queryset.order_by('name')
         elif sort_by == 'popular':
-            queryset = queryset.annotate(
-                review_count=Count('reviews')
-            ).order_by('-review_count')
+            queryset = queryset.order_by('-review_count')
         elif sort_by == 'featured':
             queryset = queryset.order_by('-is_featured', '-created_at')
         else:  # newest (default)
@@ -690,74 +633,13 @@ class ProductViewSet(viewsets.ModelViewSet):
     def smart_similar(self, request, pk=None):
         """Returns smart similar products based on category, brand, and other criteria."""
         product = self.get_object()
-        
-        # Get all products from the same store
-        store_products = self.get_queryset().filter(store=product.store).exclude(id=product.id)
-        
-        # Calculate similarity scores for each product
-        similar_products = []
-        for store_product in store_products:
-            score = 0
-            
-            # Category match (highest weight)
-            if store_product.category == product.category:
-                score += 50
-            
-            # Brand match (high weight)
-            if store_product.brand.lower() == product.brand.lower():
-                score += 30
-            
-            # Subcategory match (medium weight)
-            if store_product.subcategory and product.subcategory and store_product.subcategory == product.subcategory:
-                score += 20
-            
-            # Price range similarity (medium weight)
-            price_diff = abs(store_product.current_price - product.current_price)
-            price_ratio = price_diff / product.current_price
-            if price_ratio <= 0.2:  # Within 20% price range
-                score += 15
-            elif price_ratio <= 0.5:  # Within 50% price range
-                score += 10
-            
-            # Featured status bonus
-            if store_product.is_featured:
-                score += 5
-            
-            # Rating bonus
-            if hasattr(store_product, 'average_rating') and store_product.average_rating:
-                score += min(store_product.average_rating * 2, 10)  # Max 10 points for rating
-            
-            # Only include products with some similarity
-            if score > 0:
-                similar_products.append({
-                    'product': store_product,
-                    'score': score,
-                    'similarity_reasons': []
-                })
-                
-                # Add similarity reasons
-                if store_product.category == product.category:
-                    similar_products[-1]['similarity_reasons'].append('Same category')
-                if store_product.brand.lower() == product.brand.lower():
-                    similar_products[-1]['similarity_reasons'].append('Same brand')
-                if store_product.subcategory and product.subcategory and store_product.subcategory == product.subcategory:
-                    similar_products[-1]['similarity_reasons'].append('Same subcategory')
-                if store_product.is_featured:
-                    similar_products[-1]['similarity_reasons'].append('Featured product')
-        
-        # Sort by similarity score (highest first)
-        similar_products.sort(key=lambda x: x['score'], reverse=True)
-        
-        # Take top 10 products
-        top_products = similar_products[:10]
-        
+        links = ProductSimilarityService.neighbours(product, same_store=True)
+
         # Serialize the products
-        products_data = []
-        for item in top_products:
-            product_data = self.get_serializer(item['product']).data
-            product_data['similarity_score'] = item['score']
-            product_data['similarity_reasons'] = item['similarity_reasons']
-            products_data.append(product_data)
+        products_data = self.get_serializer([link.similar for link in links], many=True).data
+        for product_data, link in zip(products_data, links):
+            product_data['similarity_score'] = link.score
+            product_data['similarity_reasons'] = link.reasons
         
         # Add debug information
         debug_info = {
@@ -768,8 +650,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             'brand': product.brand,
             'store_id': str(product.store.id),
             'store_name': product.store.name,
-            'total_store_products': store_products.count(),
-            'similar_products_found': len(similar_products),
+            'similar_products_found': len(links),
             'similarity_criteria': {
                 'category_match_weight': 50,
                 'brand_match_weight': 30,
@@ -793,9 +674,13 @@ class ProductVariantViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['variant_type', 'pricing_mode', 'is_active', 'product']
     search_fields = ['name', 'sku', 'product__name']
-    ordering_fields = ['name', 'current_price', 'stock', 'created_at']
+    ordering_fields = ['name', 'effective_price', 'stock', 'created_at']
     ordering = ['-created_at']
     
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        ProductPricingService.sweep_if_due()
+
     def get_queryset(self):
         """Enhanced filtering for variants"""
         queryset = super().get_queryset().select_related('product')
@@ -825,18 +710,10 @@ class ProductVariantViewSet(viewsets.ModelViewSet):
         # Price range filter
         min_price = self.request.query_params.get('min_price', None)
         max_price = self.request.query_params.get('max_price', None)
-        if min_price or max_price:
-            # This is a simplified filter - in production you might want to calculate current_price
-            if min_price:
-                queryset = queryset.filter(
-                    models.Q(individual_price__gte=min_price) | 
-                    models.Q(price_adjustment__gte=min_price)
-                )
-            if max_price:
-                queryset = queryset.filter(
-                    models.Q(individual_price__lte=max_price) | 
-                    models.Q(price_adjustment__lte=max_price)
-                )
+        if min_price:
+            queryset = queryset.filter(effective_price__gte=min_price)
+        if max_price:
+            queryset = queryset.filter(effective_price__lte=max_price)
         
         return queryset
     
@@ -171,6 +171,10 @@ class Store(models.Model):
         help_text=_('Commission rate percentage (0-100)')
     )
     
+    # Review aggregates over the store's products, maintained by ProductReviewStatsService
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+
     # Audit fields
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -296,6 +300,13 @@ class Store(models.Model):
         """Get number of active products for this store."""
         return self.products.filter(status='published').count()
 
+    @property
+    def average_rating(self):
+        """Mean rating across reviews of the store's products (0.0 without reviews)."""
+        if not self.review_count:
+            return 0.0
+        return round(self.rating_sum / self.review_count, 2)
+
     @property
     def total_staff(self):
         """Get total number of active staff for this store."""
@@ -211,6 +211,8 @@ class StoreSerializer(serializers.ModelSerializer):
     # Computed fields
     total_products = serializers.SerializerMethodField()
     total_staff = serializers.SerializerMethodField()
+    review_count = serializers.IntegerField(read_only=True)
+    average_rating = serializers.FloatField(read_only=True)
     is_operational = serializers.SerializerMethodField()
     # Owner information
     owner_username = serializers.CharField(source='owner.username', read_only=True)
@@ -291,7 +293,7 @@ class StoreSerializer(serializers.ModelSerializer):
             'instagram_url', 'twitter_url', 'whatsapp_url', 'status', 'is_verified',
             'commission_rate', 'created_at', 'updated_at',
             'owner', 'owner_username', 'owner_email',
-            'owner_details', 'total_products', 'total_staff', 'is_operational',
+            'owner_details', 'total_products', 'total_staff', 'review_count', 'average_rating', 'is_operational',
             'products', 'staff', 'analytics',
             'wallet_details', 'xysave_details'  # Add these new fields
         ]
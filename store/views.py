@@ -4,7 +4,6 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, generics, viewsets, permissions
 from django.contrib.auth import get_user_model
-import random
 from django.db.models import Avg, Count, Sum, Q, F
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ValidationError, PermissionDenied
@@ -32,10 +31,14 @@ from .serializers import (
     StoreAnalyticsReportSerializer
 )
 from notification.models import Notification
+from product.sampling import RandomSampler
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Cached random pool of active, verified stores behind the homepage endpoint
+home_store_sampler = RandomSampler('home_stores', lambda: Store.objects.filter(status='active', is_verified=True))
+
 
 class BasicTestView(APIView):
     """Basic test view to check if the app is working."""
@@ -182,28 +185,15 @@ class StoreViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], url_path='homestore')
     def homestore(self, request):
-        """Returns 5 random active and verified stores for the homepage."""
+        """Returns 5 random active and verified stores for the homepage (?page= for more, stable per user)."""
         try:
-            # Get active and verified stores
-            queryset = Store.objects.filter(
-                status='active',
-                is_verified=True
+            selected_stores = home_store_sampler.fetch(
+                Store.objects.select_related('owner').prefetch_related('products', 'staff_members', 'analytics'),
+                5, seed=RandomSampler.seed_for(request), page=RandomSampler.page_for(request)
             )
-            
-            # Convert to list and shuffle for random selection
-            shuffled_queryset = list(queryset)
-            random.shuffle(shuffled_queryset)
-            
-            # Take first 5 items
-            selected_stores = shuffled_queryset[:5]
-            
-            # Now get the full data with related fields for the selected stores
-            full_queryset = Store.objects.select_related('owner').prefetch_related(
-                'products', 'staff_members', 'analytics'
-            ).filter(id__in=[store.id for store in selected_stores])
-            
+
             # Use the basic serializer for homepage display
-            serializer = self.get_serializer(full_queryset, many=True, context={'request': request})
+            serializer = self.get_serializer(selected_stores, many=True, context={'request': request})
             data = serializer.data
             
             # Manually add products, staff, and analytics for each store
@@ -965,7 +955,7 @@ class StoreAnalyticsViewSet(viewsets.ModelViewSet):
 class ProductByStoreViewSet(viewsets.ModelViewSet):
     """ViewSet for filtering products by store."""
     serializer_class = None  # Will be set dynamically
-    queryset = Product.objects.select_related('store', 'category', 'subcategory').prefetch_related('variants', 'reviews')
+    queryset = Product.objects.select_related('store', 'category', 'subcategory').prefetch_related('variants')
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     throttle_classes = [UserRateThrottle]